@@ -0,0 +1,137 @@
+# File: bench/generate.py
+# ---
+# This module generates synthetic test trees for benchmarking the framework.
+# A tree has `files` YAML files of `tests_per_file` tests each, spread over
+# group directories of GROUP_FILES files (each group is one test directory of
+# the run, like tests/acme). The tests do no real work, so a run of the tree
+# measures the framework rather than the tests:
+#   - bash:         a script that prints `output_bytes` bytes from a payload file
+#   - nzsql_file:   a SQL file whose `SELECT n ROWS` makes the fake nzsql
+#                   (tools/fake_nzsql) print about `output_bytes` bytes
+#   - nzsql_pooled: the same SQL file, run through a pooled nzsql session
+# Executors are assigned round-robin. With `chain`, every test of a file depends
+# on the previous one (depends_on_previous), which exercises the scheduler.
+#
+# Usage:
+#   python3 -m bench.generate /tmp/tree --files 200 --tests-per-file 10
+import argparse
+import os
+import stat
+
+# YAML files per group directory
+GROUP_FILES = 100
+
+EXECUTORS = ("bash", "nzsql_file", "nzsql_pooled")
+
+# Directory of the fake nzsql client, to put first on PATH
+FAKE_NZSQL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools", "fake_nzsql")
+
+
+def generate_tree(root, files=100, tests_per_file=10, output_bytes=1024, executors=("bash",), chain=False):
+    """
+    Writes a synthetic test tree.
+
+    Args:
+        root (str): Directory of the tree; the group directories are created in it.
+        files (int): Number of YAML files.
+        tests_per_file (int): Number of tests in each YAML file.
+        output_bytes (int): Approximate output size of each test.
+        executors (tuple): Executors of the tests, assigned round-robin (see EXECUTORS).
+        chain (bool): Make every test of a file depend on the previous one.
+
+    Returns:
+        list: The group directories, i.e. the test directories of a run.
+
+    Raises:
+        ValueError: If an executor is not one of EXECUTORS.
+    """
+    unknown = [e for e in executors if e not in EXECUTORS]
+    if unknown:
+        raise ValueError(f"Unsupported benchmark executors: {', '.join(unknown)} (expected {', '.join(EXECUTORS)})")
+
+    root = os.path.abspath(root)
+    os.makedirs(root, exist_ok=True)
+    payload = os.path.join(root, "payload.txt")
+    with open(payload, "w") as f:
+        f.write(_payload_text(output_bytes))
+
+    group_dirs = []
+    test_number = 0
+    for file_number in range(files):
+        group_dir = os.path.join(root, f"group_{file_number // GROUP_FILES:04d}")
+        if not group_dirs or group_dirs[-1] != group_dir:
+            _write_group_files(group_dir, payload, output_bytes)
+            group_dirs.append(group_dir)
+
+        lines = ["tests:"]
+        for i in range(tests_per_file):
+            executor = executors[test_number % len(executors)]
+            test_number += 1
+            lines.append(f"  - name: f{file_number:05d}_t{i:04d}")
+            lines.append(f"    executor: {executor}")
+            if executor == "bash":
+                lines.append("    command: scripts/emit.sh")
+            else:
+                lines.append("    database: BENCH")
+                lines.append("    sql_file: sql/emit.sql")
+            lines.append(f"    tags: [bench, {executor}]")
+            if chain and i > 0:
+                lines.append("    depends_on_previous: true")
+        with open(os.path.join(group_dir, f"file_{file_number:05d}.yaml"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+    return group_dirs
+
+
+# Shared script and SQL file of a group directory
+def _write_group_files(group_dir, payload, output_bytes):
+    os.makedirs(os.path.join(group_dir, "scripts"), exist_ok=True)
+    os.makedirs(os.path.join(group_dir, "sql"), exist_ok=True)
+
+    script = os.path.join(group_dir, "scripts", "emit.sh")
+    with open(script, "w") as f:
+        f.write("#!/bin/sh\n")
+        f.write(f"exec cat '{payload}'\n" if output_bytes else "exit 0\n")
+    os.chmod(script, os.stat(script).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    with open(os.path.join(group_dir, "sql", "emit.sql"), "w") as f:
+        f.write(f"SELECT {_rows_for_bytes(output_bytes)} ROWS;\n")
+
+
+# Printable lines of about 80 characters, `size` bytes in total
+def _payload_text(size):
+    line = "x" * 79 + "\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+# Number of rows of `SELECT n ROWS` whose fake nzsql output is about `size` bytes:
+# " <n>\n" per row, plus about 20 bytes of header and "(n rows)" footer.
+def _rows_for_bytes(size):
+    rows, total = 0, 20
+    while total + len(str(rows + 1)) + 2 <= size:
+        rows += 1
+        total += len(str(rows)) + 2
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python3 -m bench.generate", description="Generate a synthetic test tree")
+    parser.add_argument("root", help="Directory to write the tree to")
+    parser.add_argument("--files", type=int, default=100, help="Number of YAML files")
+    parser.add_argument("--tests-per-file", type=int, default=10, help="Tests in each YAML file")
+    parser.add_argument("--output-bytes", type=int, default=1024, help="Approximate output size of each test")
+    parser.add_argument("--executors", default="bash", help=f"Comma-separated executors, among {', '.join(EXECUTORS)}")
+    parser.add_argument("--chain", action="store_true", help="Make every test depend on the previous test of its file")
+    args = parser.parse_args()
+
+    executors = tuple(e.strip() for e in args.executors.split(",") if e.strip())
+    try:
+        group_dirs = generate_tree(args.root, args.files, args.tests_per_file, args.output_bytes, executors, args.chain)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{args.files * args.tests_per_file} tests in {len(group_dirs)} test directories under {os.path.abspath(args.root)}")
+    if any(e != "bash" for e in executors):
+        print(f"Put the fake nzsql first on PATH to run them: PATH={FAKE_NZSQL_DIR}:$PATH")
+
+
+if __name__ == "__main__":
+    main()
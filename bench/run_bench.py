@@ -0,0 +1,350 @@
+# File: bench/run_bench.py
+# ---
+# This script benchmarks the framework itself on a synthetic test tree (see
+# bench/generate.py). It runs the same pipeline as main.py, in a scratch
+# directory, and times each stage:
+#   - select_cold:  select_tests() without a selection index or parsed-test cache
+#   - select_warm:  select_tests() again, with both caches in place
+#   - run:          run_tests() with the streaming JSONL report
+#   - write_report: the JSON report, from the result stream
+#   - html_full:    the "full" HTML report
+#   - html_index:   the "index" HTML report
+#   - summary:      print_summary()
+# The run stage is also reported as tests per second. With --fast-spawn, the
+# tests are run in fast-spawn mode (see executors/process.py); bench/spawn_bench.py
+# compares both modes.
+# It also reports the peak RSS of the process and, with --trace-memory, the
+# peak Python allocations of each stage (tracemalloc slows every stage down, so
+# it is off by default). The framework's console output is discarded unless
+# --verbose is given.
+#
+# Results can be saved as a named baseline in bench/baselines/<name>.json and
+# later runs compared against it; the script exits with status 1 when a stage
+# got slower than the baseline by more than --factor and --min-delta.
+#
+# Usage (from the repository root):
+#   python3 -m bench.run_bench --files 200 --tests-per-file 10 --save-baseline default
+#   python3 -m bench.run_bench --files 200 --tests-per-file 10 --compare default
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from bench.generate import EXECUTORS, FAKE_NZSQL_DIR, generate_tree
+from core.report import StreamingReport, read_report_stream, write_report
+from core.runner import ENGINES, run_tests
+from core.selection import select_tests
+from core.summary import print_summary
+from executors.process import configure_fast_spawn
+from utils import helpers
+from utils.report_utils import generate_html_report
+
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+STAGES = ("select_cold", "select_warm", "run", "write_report", "html_full", "html_index", "summary")
+
+# Parameters that must match for a comparison with a baseline to be meaningful
+WORKLOAD_PARAMS = ("files", "tests_per_file", "output_bytes", "executors", "chain", "jobs", "engine", "nzsql_batch", "trace_memory",
+                   "fast_spawn")
+# Values of the parameters added after baselines may have been saved without them
+PARAM_DEFAULTS = {"fast_spawn": False}
+
+# Peak RSS growth (MB) below which a memory increase is not reported
+MEMORY_MIN_DELTA_MB = 5.0
+
+LABEL = "bench"
+
+
+def run_benchmark(params, workdir, repeat=1, verbose=False):
+    """
+    Generates the synthetic tree in workdir and times each pipeline stage on it.
+
+    Args:
+        params (dict): Workload parameters, see WORKLOAD_PARAMS.
+        workdir (str): Scratch directory; the tree, caches and reports are written there.
+        repeat (int): Number of times the pipeline is run; each stage keeps its fastest time.
+        verbose (bool): Keep the framework's console output.
+
+    Returns:
+        dict: {"stages": {stage: seconds}, "traced_peak_mb": {stage: MB}, "peak_rss_mb": MB,
+               "tests": count, "statuses": {status: count}, "overhead_ms_per_test": ms,
+               "generate_sec": seconds}
+    """
+    start = time.perf_counter()
+    test_dirs = generate_tree(
+        os.path.join(workdir, "tests"),
+        files=params["files"],
+        tests_per_file=params["tests_per_file"],
+        output_bytes=params["output_bytes"],
+        executors=params["executors"],
+        chain=params["chain"]
+    )
+    measurement = {"generate_sec": time.perf_counter() - start, "stages": {}, "traced_peak_mb": {}}
+
+    # The framework writes its caches and reports relative to the working directory
+    cwd = os.getcwd()
+    path = os.environ.get("PATH", "")
+    os.environ["PATH"] = FAKE_NZSQL_DIR + os.pathsep + path
+    os.chdir(workdir)
+    # The environment snapshot of fast-spawn mode must include the PATH above
+    configure_fast_spawn(params.get("fast_spawn", False))
+    try:
+        for _ in range(repeat):
+            for name in (".nztest_cache", "reports", "output"):
+                shutil.rmtree(name, ignore_errors=True)
+            _run_pipeline(params, test_dirs, measurement, params["trace_memory"], verbose)
+    finally:
+        configure_fast_spawn(False)
+        os.chdir(cwd)
+        os.environ["PATH"] = path
+
+    measurement["peak_rss_mb"] = _peak_rss_mb()
+    return measurement
+
+
+# Runs the pipeline once, keeping the fastest time of every stage.
+def _run_pipeline(params, test_dirs, measurement, trace_memory, verbose):
+    stages = measurement["stages"]
+    run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output = sys.stdout if verbose else open(os.devnull, "w")
+    try:
+        with contextlib.redirect_stdout(output):
+            with _stage(measurement, "select_cold", trace_memory):
+                select_tests(test_dirs)
+            with _stage(measurement, "select_warm", trace_memory):
+                tests, _ = select_tests(test_dirs)
+
+            stream = StreamingReport()
+            with _stage(measurement, "run", trace_memory):
+                results, _, _ = run_tests(
+                    tests,
+                    label=LABEL,
+                    jobs=params["jobs"],
+                    engine=params["engine"],
+                    run_id=run_id,
+                    listeners=[stream],
+                    batch_size=params["nzsql_batch"]
+                )
+            with _stage(measurement, "write_report", trace_memory):
+                write_report(read_report_stream(stream.path), label=LABEL, run_id=run_id)
+            with _stage(measurement, "html_full", trace_memory):
+                generate_html_report(read_report_stream(stream.path), label=LABEL, timestamp=run_id, mode="full")
+            with _stage(measurement, "html_index", trace_memory):
+                generate_html_report(read_report_stream(stream.path), label=LABEL, timestamp=run_id, mode="index")
+            with _stage(measurement, "summary", trace_memory):
+                print_summary(read_report_stream(stream.path), label=LABEL, output_dir="reports", run_id=run_id)
+                helpers.flush_log()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    # Time the run spent outside the tests themselves, per test slot
+    test_time = sum(r.get("duration_sec") or 0.0 for r in results)
+    overhead = max(stages["run"] * params["jobs"] - test_time, 0.0) / max(len(results), 1) * 1000
+    measurement["overhead_ms_per_test"] = min(overhead, measurement.get("overhead_ms_per_test", overhead))
+    measurement["tests"] = len(results)
+    statuses = {}
+    for r in results:
+        statuses[r.get("status")] = statuses.get(r.get("status"), 0) + 1
+    measurement["statuses"] = statuses
+
+
+@contextlib.contextmanager
+def _stage(measurement, name, trace_memory):
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        # Queued log lines are part of the stage's work
+        helpers.flush_log()
+        elapsed = time.perf_counter() - start
+        stages = measurement["stages"]
+        stages[name] = min(elapsed, stages.get(name, elapsed))
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+            traced = measurement["traced_peak_mb"]
+            traced[name] = max(peak, traced.get(name, peak))
+
+
+# Peak resident set size of this process (ru_maxrss is in KB on Linux, bytes on macOS)
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def save_baseline(name, params, measurement):
+    """
+    Writes a measurement as the baseline `name`.
+
+    Returns:
+        str: Path of the baseline file.
+    """
+    os.makedirs(BASELINES_DIR, exist_ok=True)
+    path = os.path.join(BASELINES_DIR, f"{name}.json")
+    baseline = {
+        "params": params,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "measurement": measurement,
+    }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return path
+
+
+def load_baseline(name):
+    """
+    Reads the baseline `name`.
+
+    Raises:
+        ValueError: If the baseline does not exist or cannot be read.
+    """
+    path = os.path.join(BASELINES_DIR, f"{name}.json")
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"Cannot read baseline '{name}' ({path}): {e}")
+
+
+def compare(baseline, measurement, factor=1.25, min_delta_sec=0.05):
+    """
+    Compares a measurement with a baseline.
+
+    Args:
+        baseline (dict): Baseline, as returned by load_baseline().
+        measurement (dict): Measurement, as returned by run_benchmark().
+        factor (float): Minimum slowdown (or memory growth) ratio reported as a regression.
+        min_delta_sec (float): Minimum slowdown in seconds reported as a regression.
+
+    Returns:
+        tuple: (rows of (metric, baseline, current, ratio, regressed), list of regressed metrics)
+    """
+    old = baseline["measurement"]
+    rows = []
+    for stage in STAGES:
+        if stage not in old["stages"] or stage not in measurement["stages"]:
+            continue
+        base, current = old["stages"][stage], measurement["stages"][stage]
+        regressed = current > base * factor and current - base > min_delta_sec
+        rows.append((stage, base, current, _ratio(base, current), regressed))
+
+    base, current = old["peak_rss_mb"], measurement["peak_rss_mb"]
+    regressed = current > base * factor and current - base > MEMORY_MIN_DELTA_MB
+    rows.append(("peak_rss_mb", base, current, _ratio(base, current), regressed))
+    return rows, [row[0] for row in rows if row[4]]
+
+
+def _ratio(base, current):
+    return current / base if base else float("inf") if current else 1.0
+
+
+def print_measurement(params, measurement):
+    workload = (f"{measurement['tests']} tests, {params['output_bytes']} bytes of output each, "
+                f"executors {','.join(params['executors'])}, jobs {params['jobs']}, engine {params['engine']}")
+    if params["chain"]:
+        workload += ", chained"
+    if params["nzsql_batch"]:
+        workload += f", nzsql batches of {params['nzsql_batch']}"
+    if params.get("fast_spawn"):
+        workload += ", fast spawn"
+    print(f"Workload: {workload}")
+    print(f"Statuses: {', '.join(f'{s}={c}' for s, c in sorted(measurement['statuses'].items(), key=str))}")
+    print(f"{'STAGE':<14} {'TIME (s)':>10} {'PER TEST (ms)':>14}" + (f" {'PEAK ALLOC (MB)':>16}" if measurement["traced_peak_mb"] else ""))
+    for stage in STAGES:
+        seconds = measurement["stages"][stage]
+        line = f"{stage:<14} {seconds:>10.3f} {seconds / max(measurement['tests'], 1) * 1000:>14.3f}"
+        if stage in measurement["traced_peak_mb"]:
+            line += f" {measurement['traced_peak_mb'][stage]:>16.1f}"
+        print(line)
+    print(f"Throughput   : {measurement['tests'] / max(measurement['stages']['run'], 1e-9):.1f} tests/s")
+    print(f"Run overhead : {measurement['overhead_ms_per_test']:.3f} ms per test slot")
+    print(f"Peak RSS     : {measurement['peak_rss_mb']:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python3 -m bench.run_bench", description="Benchmark the framework on a synthetic test tree")
+    parser.add_argument("--files", type=int, default=100, help="Number of YAML files")
+    parser.add_argument("--tests-per-file", type=int, default=10, help="Tests in each YAML file")
+    parser.add_argument("--output-bytes", type=int, default=1024, help="Approximate output size of each test")
+    parser.add_argument("--executors", default="bash", help=f"Comma-separated executors, among {', '.join(EXECUTORS)}")
+    parser.add_argument("--chain", action="store_true", help="Make every test depend on the previous test of its file")
+    parser.add_argument("--jobs", type=int, default=8, help="Number of tests to run in parallel")
+    parser.add_argument("--engine", choices=ENGINES, default="thread", help="Execution engine")
+    parser.add_argument("--nzsql-batch", type=int, metavar="N", help="Run up to N adjacent nzsql_file tests in one nzsql session")
+    parser.add_argument("--fast-spawn", action="store_true", help="Run the tests in fast-spawn mode")
+    parser.add_argument("--repeat", type=int, default=1, help="Run the pipeline this many times and keep the fastest time of each stage")
+    parser.add_argument("--trace-memory", action="store_true", help="Measure the peak Python allocations of each stage (slower)")
+    parser.add_argument("--workdir", help="Scratch directory to keep (default: a temporary directory, removed afterwards)")
+    parser.add_argument("--verbose", action="store_true", help="Show the framework's console output")
+    parser.add_argument("--save-baseline", metavar="NAME", help="Save the results as bench/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="Compare the results with bench/baselines/NAME.json")
+    parser.add_argument("--factor", type=float, default=1.25, help="Minimum slowdown ratio reported as a regression")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="Minimum slowdown in seconds reported as a regression")
+    args = parser.parse_args()
+
+    params = {
+        "files": args.files,
+        "tests_per_file": args.tests_per_file,
+        "output_bytes": args.output_bytes,
+        "executors": [e.strip() for e in args.executors.split(",") if e.strip()],
+        "chain": args.chain,
+        "jobs": args.jobs,
+        "engine": args.engine,
+        "nzsql_batch": args.nzsql_batch,
+        "trace_memory": args.trace_memory,
+        "fast_spawn": args.fast_spawn,
+    }
+    helpers.USE_EMOJIS = False
+
+    baseline = None
+    if args.compare:
+        try:
+            baseline = load_baseline(args.compare)
+        except ValueError as e:
+            parser.error(str(e))
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="nztest_bench_")
+    try:
+        measurement = run_benchmark(params, os.path.abspath(workdir), args.repeat, args.verbose)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_measurement(params, measurement)
+    if set(measurement["statuses"]) - {"PASS"}:
+        print("Warning: some benchmark tests did not pass; the timings may not be comparable")
+
+    if args.save_baseline:
+        print(f"Baseline saved: {save_baseline(args.save_baseline, params, measurement)}")
+
+    if baseline:
+        mismatched = [p for p in WORKLOAD_PARAMS if baseline["params"].get(p, PARAM_DEFAULTS.get(p)) != params[p]]
+        if mismatched:
+            print(f"Warning: the baseline was measured with different {', '.join(mismatched)}")
+        rows, regressions = compare(baseline, measurement, args.factor, args.min_delta)
+        print(f"\nCompared with baseline '{args.compare}' ({baseline.get('created', '?')}):")
+        print(f"{'METRIC':<14} {'BASELINE':>10} {'CURRENT':>10} {'RATIO':>7}")
+        for metric, base, current, ratio, regressed in rows:
+            print(f"{metric:<14} {base:>10.3f} {current:>10.3f} {ratio:>6.2f}x{'  REGRESSION' if regressed else ''}")
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
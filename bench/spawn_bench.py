@@ -0,0 +1,95 @@
+# File: bench/spawn_bench.py
+# ---
+# This script compares the default process spawning with fast-spawn mode (see
+# executors/process.py) in tests per second. It measures two things:
+#   - spawn: run_process() on one tiny script, back to back in this thread, as
+#     the bash executor calls it; this is the spawn cost alone
+#   - run:   the run stage of bench/run_bench.py on the same synthetic tree,
+#     which adds the scheduler, logs and reports around every spawn
+# Each mode keeps its fastest of --repeat rounds.
+#
+# Usage (from the repository root):
+#   python3 -m bench.spawn_bench --files 100 --tests-per-file 20 --jobs 8
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from bench.run_bench import run_benchmark
+from executors.process import configure_fast_spawn, run_process
+from utils import helpers
+
+MODES = (("default", False), ("fast-spawn", True))
+
+
+def spawn_rate(script, count, fast_spawn):
+    """
+    Runs a script `count` times, one after the other, with run_process().
+
+    Returns:
+        float: Spawns per second.
+    """
+    configure_fast_spawn(fast_spawn)
+    try:
+        start = time.perf_counter()
+        for _ in range(count):
+            returncode, _, _ = run_process(script, shell=True)
+            if returncode != 0:
+                raise ValueError(f"{script} exited with status {returncode}")
+        return count / (time.perf_counter() - start)
+    finally:
+        configure_fast_spawn(False)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python3 -m bench.spawn_bench", description="Compare default and fast-spawn process spawning")
+    parser.add_argument("--spawns", type=int, default=500, help="Processes started back to back by the spawn measurement")
+    parser.add_argument("--files", type=int, default=50, help="Number of YAML files of the run measurement")
+    parser.add_argument("--tests-per-file", type=int, default=20, help="Tests in each YAML file")
+    parser.add_argument("--output-bytes", type=int, default=0, help="Approximate output size of each test")
+    parser.add_argument("--jobs", type=int, default=8, help="Number of tests to run in parallel")
+    parser.add_argument("--engine", choices=("thread", "async"), default="thread", help="Execution engine")
+    parser.add_argument("--repeat", type=int, default=3, help="Rounds per mode; the fastest is kept")
+    args = parser.parse_args()
+    helpers.USE_EMOJIS = False
+
+    params = {
+        "files": args.files,
+        "tests_per_file": args.tests_per_file,
+        "output_bytes": args.output_bytes,
+        "executors": ["bash"],
+        "chain": False,
+        "jobs": args.jobs,
+        "engine": args.engine,
+        "nzsql_batch": None,
+        "trace_memory": False,
+    }
+    workdir = tempfile.mkdtemp(prefix="nztest_spawn_bench_")
+    try:
+        script = os.path.join(workdir, "noop.sh")
+        with open(script, "w") as f:
+            f.write("#!/bin/sh\nexit 0\n")
+        os.chmod(script, 0o755)
+
+        rows = []
+        for mode, fast_spawn in MODES:
+            spawns = max(spawn_rate(script, args.spawns, fast_spawn) for _ in range(args.repeat))
+            measurement = run_benchmark(dict(params, fast_spawn=fast_spawn), os.path.join(workdir, mode), args.repeat)
+            if set(measurement["statuses"]) - {"PASS"}:
+                raise SystemExit(f"Some benchmark tests did not pass in {mode} mode: {measurement['statuses']}")
+            run_sec = measurement["stages"]["run"]
+            rows.append((mode, spawns, measurement["tests"] / run_sec, run_sec, measurement["overhead_ms_per_test"]))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"Workload: {args.spawns} spawns; {args.files * args.tests_per_file} bash tests, "
+          f"{args.output_bytes} bytes of output each, jobs {args.jobs}, engine {args.engine}")
+    print(f"{'MODE':<12} {'SPAWNS/S':>10} {'TESTS/S':>10} {'RUN (s)':>9} {'OVERHEAD (ms)':>14}")
+    for mode, spawns, tests_per_sec, run_sec, overhead in rows:
+        print(f"{mode:<12} {spawns:>10.1f} {tests_per_sec:>10.1f} {run_sec:>9.3f} {overhead:>14.3f}")
+    base, fast = rows
+    print(f"Speedup: {fast[1] / base[1]:.2f}x spawns/s, {fast[2] / base[2]:.2f}x tests/s")
+
+
+if __name__ == "__main__":
+    main()
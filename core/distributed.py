@@ -0,0 +1,471 @@
+# File: core/distributed.py
+# ---
+# This module spreads one suite run over several machines or processes.
+# Two modes are provided:
+#   - Static sharding (`--shard i/N`): every host loads the same tests and runs a
+#     deterministic 1/N share of them. Shares are balanced with the durations
+#     recorded in the history database or the newest reports (see
+#     core.report.load_durations()).
+#   - Coordinator/worker (`--coordinator DIR`, `--worker DIR`): the coordinator
+#     publishes the tests as work units into a shared queue directory, workers
+#     claim units from it, run them and write their results back. The coordinator
+#     merges the results into a single run: one run_id, one output/ tree and one
+#     JSON/HTML report.
+# In both modes tests linked by `depends_on_previous`/`depends_on` stay together
+# in one unit, so dependencies are always honored within a single process.
+# The queue directory and the output/ directory must be on storage shared by all
+# workers, and workers must run from the same working directory layout.
+# Workers renew a lease on the units they run by touching their claimed files;
+# the coordinator puts a unit whose lease was not renewed for lease_sec back in
+# the queue, so the unit of a worker that died is run by another one. When no
+# worker holds a unit for worker_timeout seconds (none ever joined, or all of
+# them died), the coordinator gives up: the pending units are withdrawn and
+# their tests reported as ERROR.
+# Setup and teardown fixtures run in the coordinator, once per scope for the
+# whole run; the variables they export are sent to the workers with the tests.
+import json
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from core.fixtures import FixtureManager, PreparedFixtures, prepare_fixtures
+from core.loader import configure_tests_root, test_name, tests_root
+from core.log_store import LogStore
+from core.runner import archive_test_logs, notify_listeners, run_test
+from core.scheduler import build_dependency_graph, connected_components, run_graph
+from executors.registry import close_executors
+from executors.process import RESOURCE_FIELDS
+from utils.helpers import log_context, log_line
+
+# Assumed duration of a test that has no history yet, when no history exists at all
+DEFAULT_DURATION_SEC = 1.0
+
+POLL_INTERVAL_SEC = 0.2
+
+# Seconds after which a claimed unit whose worker stopped renewing its lease is
+# handed out again; workers renew it every third of that
+DEFAULT_LEASE_SEC = 60.0
+
+# Seconds the coordinator waits without any live worker before it fails the
+# units that are left
+DEFAULT_WORKER_TIMEOUT_SEC = 300.0
+
+
+def parse_shard(spec):
+    """Parses "i/N" (1-based) into (i, N); raises ValueError when invalid."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}', expected i/N")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{spec}', expected 1 <= i <= N")
+    return index, count
+
+
+# Splits the tests into dependency-closed units and estimates the runtime of each.
+def _weighted_units(tests, durations):
+    deps = build_dependency_graph(tests)
+    known = sorted(durations.values())
+    default = known[len(known) // 2] if known else DEFAULT_DURATION_SEC
+    units = connected_components(deps)
+    weights = [sum(durations.get(test_name(tests[idx]), default) for idx in unit) for unit in units]
+    return units, weights
+
+
+def shard_tests(tests, index, count, durations):
+    """
+    Selects the tests of one shard.
+
+    Units are handed out longest first, each to the shard with the least total
+    estimated runtime so far (ties go to the lowest shard). The split only
+    depends on the tests and the durations, so every host computes the same one.
+
+    Args:
+        tests (list): All selected test dictionaries.
+        index (int): 1-based shard number.
+        count (int): Total number of shards.
+        durations (dict): Test name -> historical duration, see core.report.load_durations().
+
+    Returns:
+        list: The tests of this shard, in their original order.
+    """
+    units, weights = _weighted_units(tests, durations)
+    loads = [0.0] * count
+    assigned = [[] for _ in range(count)]
+    order = sorted(range(len(units)), key=lambda u: (-weights[u], test_name(tests[units[u][0]])))
+    for u in order:
+        shard = min(range(count), key=lambda s: (loads[s], s))
+        loads[shard] += weights[u]
+        assigned[shard].extend(units[u])
+    return [tests[idx] for idx in sorted(assigned[index - 1])]
+
+
+class WorkQueue:
+    """
+    Work queue kept in a shared directory:
+        run.json              run_id, label, output directory and options
+        pending/<unit>.json   units waiting for a worker
+        claimed/<unit>.<id>   units being run, renamed atomically by the worker;
+                              their mtime is renewed while the worker is alive
+        results/<unit>.json   finished units
+        closed                marker written once every unit is published
+    """
+
+    def __init__(self, queue_dir):
+        self.queue_dir = queue_dir
+        self.pending_dir = os.path.join(queue_dir, "pending")
+        self.claimed_dir = os.path.join(queue_dir, "claimed")
+        self.results_dir = os.path.join(queue_dir, "results")
+        # Claimed file -> (mtime, monotonic time it was last seen changing)
+        self._leases = {}
+
+    def publish(self, run_info, units):
+        """Clears the queue and publishes a new run with its units."""
+        for d in (self.pending_dir, self.claimed_dir, self.results_dir):
+            shutil.rmtree(d, ignore_errors=True)
+            os.makedirs(d)
+        for name in ("run.json", "closed"):
+            if os.path.exists(os.path.join(self.queue_dir, name)):
+                os.remove(os.path.join(self.queue_dir, name))
+
+        _write_json(os.path.join(self.queue_dir, "run.json"), run_info)
+        for unit in units:
+            _write_json(os.path.join(self.pending_dir, f"{unit['id']}.json"), unit)
+        _write_json(os.path.join(self.queue_dir, "closed"), {})
+
+    def run_info(self):
+        try:
+            with open(os.path.join(self.queue_dir, "run.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def closed(self):
+        return os.path.exists(os.path.join(self.queue_dir, "closed"))
+
+    def drained(self):
+        """Whether every unit is published and finished: none pending or claimed."""
+        try:
+            return self.closed() and not os.listdir(self.pending_dir) and not os.listdir(self.claimed_dir)
+        except OSError:
+            # The queue directory was removed
+            return True
+
+    def claim(self, worker_id):
+        """Claims the next pending unit; returns None when nothing is pending."""
+        try:
+            names = sorted(n for n in os.listdir(self.pending_dir) if n.endswith(".json"))
+        except OSError:
+            return None
+        for name in names:
+            claimed = os.path.join(self.claimed_dir, f"{name}.{worker_id}")
+            try:
+                os.rename(os.path.join(self.pending_dir, name), claimed)
+            except OSError:
+                # Another worker got it first
+                continue
+            self.renew(name[:-len(".json")], worker_id)
+            with open(claimed) as f:
+                return json.load(f)
+        return None
+
+    def renew(self, unit_id, worker_id):
+        """Renews the lease of a unit claimed by this worker."""
+        try:
+            os.utime(os.path.join(self.claimed_dir, f"{unit_id}.json.{worker_id}"))
+        except OSError:
+            pass
+
+    def requeue_expired(self, lease_sec):
+        """
+        Puts the claimed units whose lease was not renewed for lease_sec back in
+        pending. Leases are timed with this process's clock, from the moment a
+        change of the claimed file's mtime is seen, so the clocks of the workers
+        and of the shared storage do not matter.
+
+        Returns:
+            list: (unit id, worker id) of the requeued units.
+        """
+        now = time.monotonic()
+        try:
+            names = os.listdir(self.claimed_dir)
+        except OSError:
+            return []
+        leases, requeued = {}, []
+        for name in names:
+            try:
+                mtime = os.stat(os.path.join(self.claimed_dir, name)).st_mtime
+            except OSError:
+                continue
+            seen = self._leases.get(name)
+            renewed = seen[1] if seen and seen[0] == mtime else now
+            if now - renewed <= lease_sec:
+                leases[name] = (mtime, renewed)
+                continue
+            unit_file, _, worker_id = name.partition(".json.")
+            try:
+                os.rename(os.path.join(self.claimed_dir, name), os.path.join(self.pending_dir, f"{unit_file}.json"))
+            except OSError:
+                # Completed in the meantime
+                continue
+            requeued.append((unit_file, worker_id))
+        self._leases = leases
+        return requeued
+
+    def running(self):
+        """Number of claimed units whose lease was live at the last requeue_expired()."""
+        return len(self._leases)
+
+    def withdraw_pending(self):
+        """Removes the units no worker has claimed yet; returns their ids."""
+        withdrawn = []
+        try:
+            names = os.listdir(self.pending_dir)
+        except OSError:
+            return withdrawn
+        for name in names:
+            try:
+                os.remove(os.path.join(self.pending_dir, name))
+            except OSError:
+                # Claimed in the meantime
+                continue
+            withdrawn.append(name[:-len(".json")])
+        return withdrawn
+
+    def complete(self, unit, results, worker_id):
+        _write_json(os.path.join(self.results_dir, f"{unit['id']}.json"), {"worker": worker_id, "results": results})
+        try:
+            os.remove(os.path.join(self.claimed_dir, f"{unit['id']}.json.{worker_id}"))
+        except OSError:
+            pass
+
+    def result(self, unit_id):
+        try:
+            with open(os.path.join(self.results_dir, f"{unit_id}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, default=str)
+    os.replace(tmp_path, path)
+
+
+def run_coordinator(tests, queue_dir, dry_run=False, output_dir_base="output", label="system",
+                    durations=None, worker_command=None, spawn_workers=0, default_timeout=None,
+                    listeners=None, run_id=None, archive_logs=False, lease_sec=DEFAULT_LEASE_SEC,
+                    fingerprints=False, worker_timeout=DEFAULT_WORKER_TIMEOUT_SEC):
+    """
+    Publishes the tests to a shared work queue and merges the workers' results.
+
+    Args:
+        tests (list): List of test dictionaries.
+        queue_dir (str): Shared queue directory; any earlier content is discarded.
+        dry_run (bool): If True, workers do not execute commands.
+        output_dir_base (str): Base output folder for logs.
+        label (str): Custom label used in output folder naming.
+        durations (dict): Historical durations, used to hand out long units first.
+        default_timeout (float): Timeout for tests without `timeout_sec`.
+        listeners (list): Run listeners, see run_tests(); test_finished is called
+            for the tests of each unit as soon as a worker returns it.
+        run_id (str): Run ID to use instead of the current timestamp.
+        worker_command (list): Command line that starts a local worker.
+        spawn_workers (int): Number of local workers to start with worker_command.
+        archive_logs (bool): Workers move each test's log into the log store
+            under output_dir_base.
+        lease_sec (float): Seconds after which the unit of a worker that stopped
+            renewing its lease is handed out again.
+        fingerprints (bool): Workers record each test's fingerprint in its result.
+        worker_timeout (float): Seconds to wait while no worker holds a unit
+            before the units left are reported as ERROR; None waits forever.
+
+    Returns:
+        tuple: (results list, full output directory path, run_id timestamp string)
+    """
+    if not run_id:
+        run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    base_output_dir = os.path.join(output_dir_base, f"{run_id}_{label}")
+
+    # Every scope is set up once here, before the tests are published; a
+    # worker only knows the tests of the units it claims
+    fixtures = None
+    if not dry_run:
+        fixtures = FixtureManager(tests, base_output_dir, default_timeout)
+        prepare_fixtures(fixtures, tests)
+
+    units, weights = _weighted_units(tests, durations or {})
+    order = sorted(range(len(units)), key=lambda u: (-weights[u], units[u][0]))
+    queue = WorkQueue(queue_dir)
+    queue.publish(
+        {"run_id": run_id, "label": label, "output_dir": base_output_dir, "dry_run": dry_run,
+         "default_timeout": default_timeout, "archive_logs": archive_logs, "lease_sec": lease_sec,
+         "tests_root": tests_root(), "fingerprints": fingerprints},
+        [
+            {"id": f"{seq:06d}", "indices": units[u], "tests": [tests[idx] for idx in units[u]]}
+            for seq, u in enumerate(order)
+        ]
+    )
+    log_line("INFO", "Work queue", f"{queue_dir} ({len(units)} units, {len(tests)} tests)")
+    notify_listeners(listeners, "run_started", run_id, label, tests)
+
+    try:
+        workers = [subprocess.Popen(worker_command) for _ in range(spawn_workers)]
+
+        results = [None] * len(tests)
+        remaining = {f"{seq:06d}": units[u] for seq, u in enumerate(order)}
+        lost_reason = "No result received from any worker."
+        # Last time a worker was seen alive: holding a unit or returning one
+        alive_at = time.monotonic()
+        while remaining:
+            for unit_id in list(remaining):
+                done = queue.result(unit_id)
+                if done is None:
+                    continue
+                alive_at = time.monotonic()
+                for idx, result in zip(remaining.pop(unit_id), done["results"]):
+                    results[idx] = result
+                    notify_listeners(listeners, "test_finished", result)
+                    if fixtures:
+                        fixtures.leave(tests[idx])
+            if not remaining:
+                break
+            for unit_id, worker_id in queue.requeue_expired(lease_sec):
+                log_line("ERROR", "Lease expired", f"unit {unit_id} of worker {worker_id} requeued")
+            if workers and all(w.poll() is not None for w in workers):
+                log_line("ERROR", "Workers exited", f"{len(remaining)} units without results")
+                break
+            if queue.running():
+                alive_at = time.monotonic()
+            elif worker_timeout is not None and time.monotonic() - alive_at > worker_timeout:
+                lost_reason = f"No live workers: no worker held a unit for {worker_timeout:g}s."
+                log_line("ERROR", "No live workers", f"none for {worker_timeout:g}s, {len(remaining)} units without results")
+                # Workers that join later find nothing to run, and idle local
+                # workers would wait for the withdrawn units forever
+                queue.withdraw_pending()
+                for w in workers:
+                    if w.poll() is None:
+                        w.kill()
+                break
+            time.sleep(POLL_INTERVAL_SEC)
+
+        for w in workers:
+            w.wait()
+
+        for unit in remaining.values():
+            for idx in unit:
+                results[idx] = _lost_result(tests[idx], lost_reason)
+                notify_listeners(listeners, "test_finished", results[idx])
+    finally:
+        if fixtures:
+            fixtures.close()
+
+    notify_listeners(listeners, "run_finished", results)
+    return results, base_output_dir, run_id
+
+
+# Result for a test whose unit never came back from a worker.
+def _lost_result(test, reason):
+    return {
+        'name': test_name(test),
+        'executor': test.get('executor', 'bash'),
+        'command': test.get('command', ''),
+        'status': 'ERROR',
+        'output': reason,
+        'duration_sec': 0,
+        'output_file': '',
+        'output_bytes': 0,
+        'output_lines': 0,
+        'output_truncated': False,
+        'attempts': 0,
+        **{field: None for field in RESOURCE_FIELDS},
+    }
+
+
+def run_worker(queue_dir, jobs=1):
+    """
+    Runs units from a shared work queue until the queue is drained: nothing is
+    pending or claimed by another worker any more.
+
+    Args:
+        queue_dir (str): Shared queue directory written by run_coordinator().
+        jobs (int): Number of units this worker runs at the same time.
+
+    Returns:
+        int: Number of units this worker ran.
+    """
+    queue = WorkQueue(queue_dir)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+
+    info = queue.run_info()
+    while info is None:
+        time.sleep(POLL_INTERVAL_SEC)
+        info = queue.run_info()
+    log_line("START", "Worker", f"{worker_id} joined run {info['run_id']}_{info['label']}")
+    configure_tests_root(info.get("tests_root", tests_root()))
+    log_store = None
+    if info.get("archive_logs"):
+        log_store = LogStore(os.path.join(os.path.dirname(info["output_dir"]), ".store"))
+
+    # The coordinator ran the setups; the tests carry what they exported
+    fixtures = PreparedFixtures()
+
+    def run_one(test):
+        with log_context(test=test_name(test), worker=f"{worker_id}/{threading.current_thread().name}"):
+            result = run_test(test, info["output_dir"], dry_run=info["dry_run"],
+                              default_timeout=info.get("default_timeout"), fixtures=fixtures,
+                              fingerprints=info.get("fingerprints", False))
+            archive_test_logs(result, log_store)
+            return result
+
+    # Units being run, whose leases the heartbeat thread renews
+    active = set()
+    active_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def heartbeat():
+        interval = info.get("lease_sec", DEFAULT_LEASE_SEC) / 3
+        while not stopped.wait(interval):
+            with active_lock:
+                unit_ids = list(active)
+            for unit_id in unit_ids:
+                queue.renew(unit_id, worker_id)
+
+    def work():
+        count = 0
+        while True:
+            unit = queue.claim(worker_id)
+            if unit is None:
+                # Units still claimed may come back if their worker dies
+                if queue.drained():
+                    return count
+                time.sleep(POLL_INTERVAL_SEC)
+                continue
+            with active_lock:
+                active.add(unit["id"])
+            try:
+                unit_tests = unit["tests"]
+                results = run_graph(unit_tests, build_dependency_graph(unit_tests), run_one)
+                queue.complete(unit, results, worker_id)
+            finally:
+                with active_lock:
+                    active.discard(unit["id"])
+            count += 1
+
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+            count = sum(f.result() for f in [pool.submit(work) for _ in range(max(jobs, 1))])
+    finally:
+        stopped.set()
+        close_executors()
+
+    log_line("INFO", "Worker finished", f"{worker_id} ran {count} units")
+    return count
@@ -0,0 +1,285 @@
+# File: core/expect.py
+# ---
+# This module evaluates the `expect:` block of a test against its output.
+# Without an `expect:` block a test passes when its command succeeds. With one,
+# the test passes only if every expectation in it holds:
+#
+#   expect:
+#     exit_code: 0                 # exit status of the command (default: success)
+#     contains: ["LOAD OK"]        # text that must appear in some line
+#     not_contains: ["ERROR"]      # text that must not appear in any line
+#     regex: ["^ +42 *$"]          # patterns that must match some line
+#     not_regex: ["WARN(ING)?"]    # patterns that must not match any line
+#     lines: 12                    # output lines, exact or {min: 1, max: 20}
+#     rows: {min: 1}               # rows in nzsql "(N rows)" footers, summed
+#     golden: expected/q1.out      # normalized output must hash like this file
+#     sha256: 3f5a...              # or to this SHA-256 digest
+#     ignore_lines: ["^Time: "]    # lines left out of the golden comparison
+#
+# The output is checked while it is streamed, chunk by chunk, through the
+# test's OutputCapture. Each chunk's complete lines are checked as one block with
+# bytes searches and multi-line regular expressions, so the cost per line stays
+# in C code and the output is never held in memory all together. Text is
+# matched within a line, and in patterns ^ and $ match at the start and end of
+# every line. Lines longer than MAX_LINE_BYTES are checked in pieces.
+# Normalized output, for the checksum, has trailing whitespace (including "\r")
+# removed from every line and trailing blank lines dropped.
+import hashlib
+import os
+import re
+
+EXPECT_KEYS = ("exit_code", "contains", "not_contains", "regex", "not_regex",
+               "lines", "rows", "golden", "sha256", "ignore_lines")
+
+# nzsql (psql-style) row count footer, e.g. "(3 rows)"
+ROWS_FOOTER = re.compile(rb"^[ \t]*\((\d+) rows?\)[ \t\r]*$", re.MULTILINE)
+
+# Trailing whitespace of every line, removed before hashing
+TRAILING_SPACE = re.compile(rb"[ \t\r\f\v]+$", re.MULTILINE)
+
+# A partial line is checked on its own once it grows to this size
+MAX_LINE_BYTES = 1024 * 1024
+
+# Size of the chunks read from golden files
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+class OutputExpectations:
+    """Checks a test's output against its `expect:` block as the output streams in."""
+
+    def __init__(self, spec, test_dir=""):
+        """
+        Args:
+            spec (dict): The test's `expect:` block.
+            test_dir (str): Directory of the test's YAML file; `golden` is relative to it.
+
+        Raises:
+            ValueError: If the block is not valid.
+        """
+        if not isinstance(spec, dict):
+            raise ValueError("expect: must be a mapping")
+        unknown = sorted(set(spec) - set(EXPECT_KEYS))
+        if unknown:
+            raise ValueError(f"expect: unknown keys {', '.join(unknown)} (expected {', '.join(EXPECT_KEYS)})")
+
+        self.exit_code = spec.get("exit_code")
+        if self.exit_code is not None and (not isinstance(self.exit_code, int) or isinstance(self.exit_code, bool)):
+            raise ValueError("expect: exit_code must be an integer")
+        self.contains = [text.encode() for text in _strings(spec, "contains")]
+        self.not_contains = [text.encode() for text in _strings(spec, "not_contains")]
+        self.regex = [_compile(p) for p in _strings(spec, "regex")]
+        self.not_regex = [_compile(p) for p in _strings(spec, "not_regex")]
+        self.ignore_lines = [_compile(p) for p in _strings(spec, "ignore_lines")]
+        self.lines = _bounds(spec, "lines")
+        self.rows = _bounds(spec, "rows")
+
+        self.golden = None
+        if spec.get("golden"):
+            self.golden = os.path.join(test_dir, str(spec["golden"]))
+            if not os.path.isfile(self.golden):
+                raise ValueError(f"expect: golden file {self.golden} not found")
+        self.expected_sha256 = str(spec["sha256"]).lower() if spec.get("sha256") else None
+        self._hash = _NormalizedHash(self.ignore_lines) if self.golden or self.expected_sha256 else None
+
+        self._pending = bytearray()
+        self._line_count = 0
+        self._row_count = 0
+        self._found = [False] * len(self.contains)
+        self._matched = [False] * len(self.regex)
+        # (line number, text or pattern) of the first forbidden line
+        self._forbidden = None
+
+    def feed(self, chunk):
+        """Checks the complete lines of a chunk of raw output (bytes); a partial last line waits for the next chunk."""
+        self._pending += chunk
+        end = self._pending.rfind(b"\n") + 1
+        if not end and len(self._pending) < MAX_LINE_BYTES:
+            return
+        end = end or len(self._pending)
+        block = bytes(self._pending[:end])
+        del self._pending[:end]
+        self._check(block)
+
+    def finish(self, success, returncode=None):
+        """
+        Evaluates every expectation once the output is complete.
+
+        Args:
+            success (bool): Whether the executor reported success.
+            returncode (int): Exit status of the command, when known.
+
+        Returns:
+            list: One message per failed expectation; empty when all of them hold.
+        """
+        if self._pending:
+            self._check(bytes(self._pending))
+            del self._pending[:]
+            # The last line has no newline of its own
+            self._line_count += 1
+
+        failures = []
+        if self.exit_code is None:
+            if not success:
+                failures.append("command failed" if returncode is None else f"command exited with status {returncode}")
+        else:
+            # Sessions (nzsql_pooled, batches) report no exit status of their own
+            actual = returncode if returncode is not None else (0 if success else 1)
+            if actual != self.exit_code:
+                failures.append(f"expected exit code {self.exit_code}, got {actual}")
+
+        for text, found in zip(self.contains, self._found):
+            if not found:
+                failures.append(f"output does not contain '{text.decode(errors='replace')}'")
+        for pattern, matched in zip(self.regex, self._matched):
+            if not matched:
+                failures.append(f"no output line matches /{pattern.pattern.decode(errors='replace')}/")
+        if self._forbidden:
+            line_number, what = self._forbidden
+            failures.append(f"line {line_number} contains forbidden {what}")
+
+        for name, bounds, actual in (("lines", self.lines, self._line_count), ("rows", self.rows, self._row_count)):
+            message = _check_bounds(name, bounds, actual)
+            if message:
+                failures.append(message)
+
+        if self._hash is not None:
+            digest = self._hash.hexdigest()
+            if self.expected_sha256 and digest != self.expected_sha256:
+                failures.append(f"normalized output SHA-256 {digest[:12]} does not match {self.expected_sha256[:12]}")
+            if self.golden:
+                expected = normalized_sha256(self.golden, self.ignore_lines)
+                if digest != expected:
+                    failures.append(f"normalized output SHA-256 {digest[:12]} does not match golden file "
+                                    f"{self.golden} ({expected[:12]})")
+        return failures
+
+    # Checks a block of output: complete lines, or a piece of a line.
+    def _check(self, block):
+        lines_before = self._line_count
+        self._line_count += block.count(b"\n")
+
+        for i, text in enumerate(self.contains):
+            if not self._found[i] and text in block:
+                self._found[i] = True
+        for i, pattern in enumerate(self.regex):
+            if not self._matched[i] and pattern.search(block):
+                self._matched[i] = True
+        if self._forbidden is None:
+            hits = [(block.find(text), f"text '{text.decode(errors='replace')}'") for text in self.not_contains]
+            for pattern in self.not_regex:
+                match = pattern.search(block)
+                hits.append((match.start() if match else -1, f"pattern /{pattern.pattern.decode(errors='replace')}/"))
+            hits = [hit for hit in hits if hit[0] >= 0]
+            if hits:
+                pos, what = min(hits)
+                self._forbidden = (lines_before + block.count(b"\n", 0, pos) + 1, what)
+        if self.rows is not None and b"row" in block:
+            for footer in ROWS_FOOTER.finditer(block):
+                self._row_count += int(footer.group(1))
+
+        if self._hash is not None:
+            self._hash.update(block)
+
+
+# SHA-256 of normalized output, fed block by block. Blank lines at the end of a
+# block are held back and only hashed once more content follows them, so the
+# trailing blank lines of the output are dropped.
+class _NormalizedHash:
+    def __init__(self, ignore_lines=()):
+        self.ignore_lines = ignore_lines
+        self._digest = hashlib.sha256()
+        self._held_newlines = 0
+        self._started = False
+
+    def update(self, block):
+        if self.ignore_lines:
+            lines = block.split(b"\n")
+            last = lines.pop()
+            block = b"".join(line + b"\n" for line in lines if not self._ignored(line))
+            if last and not self._ignored(last):
+                block += last
+        block = TRAILING_SPACE.sub(b"", block)
+        content = block.rstrip(b"\n")
+        if not content:
+            self._held_newlines += len(block)
+            return
+        self._digest.update(b"\n" * self._held_newlines + content)
+        self._held_newlines = len(block) - len(content)
+        self._started = True
+
+    def hexdigest(self):
+        digest = self._digest.copy()
+        if self._started:
+            # Newline of the last non-blank line
+            digest.update(b"\n")
+        return digest.hexdigest()
+
+    def _ignored(self, line):
+        return any(pattern.search(line) for pattern in self.ignore_lines)
+
+
+def normalized_sha256(path, ignore_lines=()):
+    """
+    Returns the SHA-256 of a file's normalized content, as compared by `golden`.
+
+    Args:
+        path (str): File to hash, read in chunks.
+        ignore_lines (list): Compiled patterns of lines to leave out.
+    """
+    hasher = _NormalizedHash(ignore_lines)
+    pending = b""
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_BYTES), b""):
+            pending += chunk
+            end = pending.rfind(b"\n") + 1
+            if end:
+                hasher.update(pending[:end])
+                pending = pending[end:]
+    if pending:
+        hasher.update(pending)
+    return hasher.hexdigest()
+
+
+def _strings(spec, key):
+    value = spec.get(key)
+    if value is None:
+        return []
+    values = [value] if isinstance(value, str) else value
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        raise ValueError(f"expect: {key} must be a string or a list of strings")
+    return values
+
+
+def _compile(pattern):
+    try:
+        return re.compile(pattern.encode(), re.MULTILINE)
+    except re.error as e:
+        raise ValueError(f"expect: invalid pattern /{pattern}/: {e}")
+
+
+# Reads `lines` or `rows`: an exact count, or a {min, max} mapping.
+# Returns (min, max) with None for an open end, or None when the key is absent.
+def _bounds(spec, key):
+    value = spec.get(key)
+    if value is None:
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value, value
+    if isinstance(value, dict) and set(value) <= {"min", "max"} and value:
+        low, high = value.get("min"), value.get("max")
+        if all(v is None or (isinstance(v, int) and not isinstance(v, bool)) for v in (low, high)):
+            return low, high
+    raise ValueError(f"expect: {key} must be a count or a mapping with min and/or max")
+
+
+def _check_bounds(name, bounds, actual):
+    if bounds is None:
+        return None
+    low, high = bounds
+    if low == high and actual != low:
+        return f"expected {low} {name}, got {actual}"
+    if low is not None and actual < low:
+        return f"expected at least {low} {name}, got {actual}"
+    if high is not None and actual > high:
+        return f"expected at most {high} {name}, got {actual}"
+    return None
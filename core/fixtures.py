@@ -0,0 +1,394 @@
+# File: core/fixtures.py
+# ---
+# This module runs the setup and teardown fixtures of a run. Fixtures replace
+# setup steps written as ordinary tests chained with `depends_on_previous`:
+# they run once per scope, and the tests of a scope that do not depend on each
+# other can run concurrently once it is set up.
+# Fixtures are declared next to `tests:` in a test YAML file, or in a
+# fixtures.yaml file that applies to every test in its directory and below:
+#
+#   setup:
+#     - name: env
+#       executor: bash
+#       command: scripts/env_setup.sh
+#       scope: directory        # file, directory or run
+#   teardown:
+#     - name: drop_tables
+#       executor: nzsql_file
+#       database: SYSTEM
+#       sql_file: sql/drop.sql
+#
+# The scope defaults to "file" in a test YAML file and to "directory" in
+# fixtures.yaml. A setup runs when the first test that needs it is about to
+# start, once per YAML file, per directory of YAML files, or per run; the
+# other tests of the scope wait for it. The teardowns of a scope run once its
+# last test has finished, provided any of its tests got as far as the setups,
+# even when a setup failed, so that partial setups are cleaned up.
+# If a setup fails, every test of its scope is reported as ERROR.
+# Setups export variables to the tests and fixtures after them: a bash setup
+# is sourced, so its `export`s are picked up, and any setup can append
+# KEY=VALUE lines to the file named by $NZTEST_ENV. The variables are cached
+# with the fixture and added to the environment of the tests (see the `env`
+# capability in executors/registry.py).
+# With --coordinator, the coordinator runs the setups of every scope once for
+# the whole run before publishing the tests, and the teardowns as the workers
+# return the last tests of each scope; workers only apply the exported
+# variables (see PreparedFixtures).
+import os
+import shlex
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from core.loader import load_documents, test_name, tests_root
+from core.selection import DIRECT_PARSE_MAX_FILES
+from executors.capture import OutputCapture
+from executors.process import child_env, run_process
+from executors.registry import run_executor
+from utils.helpers import log_line
+
+FIXTURE_FILE = "fixtures.yaml"
+SCOPES = ("file", "directory", "run")
+FIXTURE_KEYS = ("name", "executor", "command", "database", "sql_file", "timeout_sec", "scope", "description")
+
+# File that setups append KEY=VALUE lines to
+ENV_FILE_VAR = "NZTEST_ENV"
+# File that sourced bash setups dump their environment to
+ENV_DUMP_VAR = "NZTEST_ENV_DUMP"
+# Variables set by the shell itself, never exported to the tests
+SHELL_VARS = {"PWD", "OLDPWD", "SHLVL", "_", ENV_FILE_VAR, ENV_DUMP_VAR}
+
+
+class FixtureManager:
+    def __init__(self, tests, base_output_dir, default_timeout=None):
+        """
+        Finds the fixtures of the tests of a run.
+
+        Args:
+            tests (list): The tests of the run.
+            base_output_dir (str): Output directory of the run; fixture logs go below it.
+            default_timeout (float): Timeout for fixtures without `timeout_sec`.
+
+        Raises:
+            ValueError: If a fixture declaration is not valid.
+        """
+        self.base_output_dir = base_output_dir
+        self.default_timeout = default_timeout
+        self._lock = threading.Lock()
+        # id(test) -> [{"setups": [(fixture, key)], "scopes": [scope key]}], outermost first
+        self._plans = {}
+        # (fixture id, unit) -> {"lock", "done", "env", "error"}
+        self._setups = {}
+        # Scope key (declaring file, scope, unit) -> number of tests still to finish
+        self._refcount = {}
+        self._teardowns = {}
+        self._scope_env = {}
+        # Started scopes, in the order they started; torn down scopes are removed
+        self._started = []
+
+        # The files declaring fixtures for each YAML file of the run
+        by_dir = {}
+        files = {test_file: _fixture_files(test_file, by_dir) for test_file in dict.fromkeys(test["__file__"] for test in tests)}
+        declarations = _declarations(files)
+        for test_file in files:
+            files[test_file] = [path for path in files[test_file] if path in declarations]
+
+        for test in tests:
+            plan = []
+            for path in files[test["__file__"]]:
+                setups, teardowns = declarations[path]
+                level = {"setups": [], "scopes": []}
+                for fixture in setups:
+                    unit = _unit(fixture["scope"], test["__file__"])
+                    key = (fixture["__id__"], unit)
+                    self._setups.setdefault(key, {"lock": threading.Lock(), "done": False, "env": {}, "error": None})
+                    level["setups"].append((fixture, key))
+                for fixture in setups + teardowns:
+                    scope_key = (path, fixture["scope"], _unit(fixture["scope"], test["__file__"]))
+                    if scope_key not in level["scopes"]:
+                        level["scopes"].append(scope_key)
+                for fixture in teardowns:
+                    scope_key = (path, fixture["scope"], _unit(fixture["scope"], test["__file__"]))
+                    if fixture not in self._teardowns.setdefault(scope_key, []):
+                        self._teardowns[scope_key].append(fixture)
+                for scope_key in level["scopes"]:
+                    self._refcount[scope_key] = self._refcount.get(scope_key, 0) + 1
+                plan.append(level)
+            if plan:
+                self._plans[id(test)] = plan
+
+    def scope_keys(self, test):
+        """Returns the fixture scopes of a test; tests with the same scopes share their setups."""
+        return tuple(key for level in self._plans.get(id(test), []) for key in level["scopes"])
+
+    def enter(self, test):
+        """
+        Runs the setups of a test that have not run yet, or waits for them.
+
+        Args:
+            test (dict): A test of the run, about to start.
+
+        Returns:
+            dict: Variables exported by its setups, or None if it has no setup.
+
+        Raises:
+            ValueError: If one of its setups failed.
+        """
+        plan = self._plans.get(id(test))
+        if plan is None:
+            return None
+        env = {}
+        for level in plan:
+            try:
+                for fixture, key in level["setups"]:
+                    env.update(self._setup(fixture, key, env))
+            finally:
+                with self._lock:
+                    for scope_key in level["scopes"]:
+                        if scope_key not in self._scope_env:
+                            self._started.append(scope_key)
+                            self._scope_env[scope_key] = dict(env)
+        return env or None
+
+    def leave(self, test):
+        """Records that a test has finished (or was skipped); runs the teardowns of the scopes it ends."""
+        plan = self._plans.get(id(test))
+        if plan is None:
+            return
+        ended = []
+        with self._lock:
+            for level in reversed(plan):
+                for scope_key in reversed(level["scopes"]):
+                    self._refcount[scope_key] -= 1
+                    if self._refcount[scope_key] == 0 and scope_key in self._started:
+                        self._started.remove(scope_key)
+                        ended.append(scope_key)
+        for scope_key in ended:
+            self._teardown(scope_key)
+
+    def close(self):
+        """Runs the teardowns of the scopes still open, e.g. after an interrupted run."""
+        with self._lock:
+            ended = list(reversed(self._started))
+            self._started.clear()
+        for scope_key in ended:
+            self._teardown(scope_key)
+
+    def _setup(self, fixture, key, env):
+        state = self._setups[key]
+        with state["lock"]:
+            if not state["done"]:
+                state["done"] = True
+                exports, error = self._run(fixture, key[1], "setup", env)
+                state["env"], state["error"] = exports, error
+        if state["error"]:
+            raise ValueError(state["error"])
+        return state["env"]
+
+    def _teardown(self, scope_key):
+        for fixture in reversed(self._teardowns.get(scope_key, [])):
+            self._run(fixture, scope_key[2], "teardown", self._scope_env.get(scope_key, {}))
+
+    # Runs a fixture. Returns (exported variables, error message or None).
+    def _run(self, fixture, unit, kind, env):
+        name = _fixture_name(fixture, unit)
+        log_path = self._log_path(fixture, unit, kind)
+        # Unique, as --coordinator workers may run the same fixture at the same time
+        env_path = f"{log_path}.{os.getpid()}.{threading.get_ident()}.env"
+        env = dict(env, **{ENV_FILE_VAR: os.path.abspath(env_path)})
+        timeout = fixture.get("timeout_sec", self.default_timeout)
+        log_line("START", f"Running {kind}", name)
+
+        capture = OutputCapture(log_path)
+        try:
+            if fixture.get("executor", "bash") == "bash":
+                success, exports = _source_bash(fixture, env, env_path + ".dump", timeout, capture)
+            else:
+                success, output = run_executor(fixture, timeout=timeout, capture=capture, env=env)
+                if output and not capture.bytes_written:
+                    capture.write_text(output.rstrip() + "\n")
+                exports = {}
+            exports.update(_read_env_file(env_path))
+        except Exception as e:
+            success, exports = False, {}
+            capture.write_text(f"{e}\n")
+        finally:
+            capture.close()
+        for path in (env_path, env_path + ".dump"):
+            if os.path.exists(path):
+                os.remove(path)
+
+        if capture.timed_out:
+            success = False
+        if not success:
+            log_line("FAIL", f"{kind.capitalize()} failed", f"{name} (see {log_path})")
+            return {}, f"{kind.capitalize()} fixture {name} failed (see {log_path})"
+        exported = f", exported {', '.join(sorted(exports))}" if exports else ""
+        log_line("SUCCESS", f"{kind.capitalize()} done", f"{name}{exported}")
+        return exports, None
+
+    def _log_path(self, fixture, unit, kind):
+        declared_in = os.path.dirname(fixture["__file__"])
+        directory = {"file": os.path.dirname(unit), "directory": unit, "run": declared_in}[fixture["scope"]]
+        prefix = f"{os.path.splitext(os.path.basename(unit))[0]}." if fixture["scope"] == "file" else ""
+        safe_name = str(fixture["name"]).replace(" ", "_").lower()
+        log_dir = os.path.join(self.base_output_dir, os.path.relpath(directory, tests_root()))
+        os.makedirs(log_dir, exist_ok=True)
+        return os.path.join(log_dir, f"{prefix}{safe_name}.{kind}.log")
+
+
+# Sources a bash setup so that the variables it exports can be read back.
+# The script path and its arguments are quoted, so paths with spaces or shell
+# characters are sourced as they are. Returns (success, exported variables).
+def _source_bash(fixture, env, dump_path, timeout, capture):
+    try:
+        words = shlex.split(fixture.get("command", ""))
+    except ValueError as e:
+        raise ValueError(f"Fixture {fixture['name']}: invalid command: {e}")
+    if not words:
+        raise ValueError(f"Fixture {fixture['name']}: no command")
+    words[0] = os.path.join(os.path.dirname(fixture["__file__"]), words[0])
+    script = f"trap 'env -0 > \"${ENV_DUMP_VAR}\"' EXIT\n. {' '.join(shlex.quote(word) for word in words)}"
+    env = child_env(dict(env, **{ENV_DUMP_VAR: os.path.abspath(dump_path)}))
+    returncode, _, _ = run_process(["bash", "-c", script], env=env, timeout=timeout, capture=capture)
+    if returncode != 0:
+        return False, {}
+    exports = {}
+    if os.path.exists(dump_path):
+        with open(dump_path, "rb") as f:
+            for item in f.read().split(b"\0"):
+                key, sep, value = item.decode(errors="replace").partition("=")
+                if sep and key not in SHELL_VARS and env.get(key) != value:
+                    exports[key] = value
+    return True, exports
+
+
+class PreparedFixtures:
+    """
+    Fixtures of --coordinator workers. The coordinator sets up every scope once
+    for the whole run and sends each test with the variables its setups exported
+    (`__fixture_env__`) or the error of a failed setup (`__fixture_error__`), see
+    prepare_fixtures(); workers only apply them.
+    """
+
+    def enter(self, test):
+        if test.get("__fixture_error__"):
+            raise ValueError(test["__fixture_error__"])
+        return test.get("__fixture_env__")
+
+    def leave(self, test):
+        pass
+
+    def close(self):
+        pass
+
+
+def prepare_fixtures(manager, tests, workers=8):
+    """
+    Runs the setups of every test up front, a few scopes at a time, and stores
+    their result in the tests for PreparedFixtures.
+
+    Args:
+        manager (FixtureManager): Fixtures of the run.
+        tests (list): The tests of the run; they get `__fixture_env__` or `__fixture_error__`.
+        workers (int): Setups run at the same time.
+    """
+    def enter(test):
+        # The runner reports these tests without entering their fixtures
+        if test.get("skip") or test.get("__preflight_error__"):
+            return
+        try:
+            env = manager.enter(test)
+        except ValueError as e:
+            test["__fixture_error__"] = str(e)
+            return
+        if env:
+            test["__fixture_env__"] = env
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(enter, tests))
+
+
+# Reads the KEY=VALUE lines a fixture appended to $NZTEST_ENV.
+def _read_env_file(path):
+    exports = {}
+    if not os.path.exists(path):
+        return exports
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            key, sep, value = line.partition("=")
+            if sep and key and not line.startswith("#"):
+                exports[key.strip()] = value
+    return exports
+
+
+# Reads the fixture declarations of the test files of a run and of the
+# fixtures.yaml files above them, given as {test file: candidate files}.
+# Returns {path: (setups, teardowns)} for the files that declare fixtures.
+def _declarations(files):
+    candidates = dict.fromkeys(path for paths in files.values() for path in paths)
+    paths = [path for path in candidates if os.path.exists(path)]
+    docs = load_documents(paths, use_cache=len(paths) > DIRECT_PARSE_MAX_FILES)
+    declarations = {}
+    for path in paths:
+        default_scope = "directory" if os.path.basename(path) == FIXTURE_FILE else "file"
+        setups = _parse(docs[path], path, "setup", default_scope)
+        teardowns = _parse(docs[path], path, "teardown", default_scope)
+        if setups or teardowns:
+            declarations[path] = (setups, teardowns)
+    return declarations
+
+
+def _parse(doc, path, kind, default_scope):
+    entries = doc.get(kind) or []
+    if not isinstance(entries, list):
+        raise ValueError(f"{path}: {kind} must be a list of fixtures")
+    fixtures = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("name"):
+            raise ValueError(f"{path}: every {kind} fixture needs a name")
+        unknown = sorted(set(entry) - set(FIXTURE_KEYS))
+        if unknown:
+            raise ValueError(f"{path}: {kind} fixture '{entry['name']}' has unknown keys {', '.join(unknown)}")
+        fixture = dict(entry)
+        fixture.setdefault("scope", default_scope)
+        if fixture["scope"] not in SCOPES:
+            raise ValueError(f"{path}: {kind} fixture '{entry['name']}' has unknown scope "
+                             f"'{fixture['scope']}' (expected {', '.join(SCOPES)})")
+        fixture["__file__"] = path
+        fixture["__id__"] = f"{path}:{kind}:{entry['name']}"
+        fixtures.append(fixture)
+    return fixtures
+
+
+# The fixtures.yaml files that apply to a test file, outermost first, then the
+# test file itself. `by_dir` caches the fixtures.yaml files of each directory.
+def _fixture_files(test_file, by_dir=None):
+    directory = os.path.dirname(test_file)
+    by_dir = {} if by_dir is None else by_dir
+    if directory not in by_dir:
+        rel_path = os.path.relpath(directory, tests_root())
+        if rel_path.startswith(".."):
+            dirs = [directory]
+        else:
+            dirs = [tests_root()]
+            for part in ([] if rel_path == "." else rel_path.split(os.sep)):
+                dirs.append(os.path.join(dirs[-1], part))
+        by_dir[directory] = [os.path.join(d, FIXTURE_FILE) for d in dirs]
+    files = by_dir[directory]
+    return files if test_file in files else files + [test_file]
+
+
+# What one instance of a fixture covers: a YAML file, a directory or the run.
+def _unit(scope, test_file):
+    if scope == "file":
+        return test_file
+    if scope == "directory":
+        return os.path.dirname(test_file)
+    return ""
+
+
+def _fixture_name(fixture, unit):
+    where = test_name({"name": fixture["name"], "__file__": fixture["__file__"]})
+    if fixture["scope"] != "run" and unit != os.path.dirname(fixture["__file__"]) and unit != fixture["__file__"]:
+        where += f" @ {os.path.relpath(unit, tests_root())}"
+    return where
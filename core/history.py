@@ -0,0 +1,280 @@
+# File: core/history.py
+# ---
+# This module keeps the duration history of every test in an append-only SQLite
+# database (reports/history.sqlite by default).
+# The runner records each result as it completes through HistoryRecorder, and the
+# JSON reports written by earlier runs can be imported in bulk. The history is then
+# queried by the `history` command of main.py for per-test p50/p95 durations, the
+# slowest tests, and tests that got slower compared to a baseline run label.
+# Each result also keeps the test's fingerprint (see core/result_cache.py), so
+# that the outcomes of runs with identical inputs can be compared: a test whose
+# outcome flips between PASS and a failure while its fingerprint stays the same
+# is flaky.
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+DEFAULT_HISTORY_DB = os.path.join("reports", "history.sqlite")
+
+# Only these statuses carry a meaningful duration
+# (a TIMEOUT duration is the time the test ran before it was killed)
+TIMED_STATUSES = ("PASS", "FAIL", "TIMEOUT")
+
+# Outcomes compared to find flaky tests; other statuses (CACHED, SKIPPED,
+# DRY_RUN) are not a run of the test
+FAILED_STATUSES = ("FAIL", "TIMEOUT", "ERROR")
+OUTCOME_STATUSES = ("PASS",) + FAILED_STATUSES
+
+# Report files are named <run_id>_<label>.json, with run_id = YYYYMMDD_HHMMSS
+REPORT_NAME = re.compile(r"^(\d{8}_\d{6})_(.+)\.json$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    run_id       TEXT NOT NULL,
+    label        TEXT NOT NULL,
+    name         TEXT NOT NULL,
+    executor     TEXT,
+    status       TEXT,
+    duration_sec REAL,
+    output_bytes INTEGER,
+    recorded_at  TEXT,
+    fingerprint  TEXT,
+    attempts     INTEGER,
+    UNIQUE (run_id, label, name)
+);
+CREATE INDEX IF NOT EXISTS results_name ON results (name);
+CREATE INDEX IF NOT EXISTS results_label ON results (label);
+"""
+
+# Columns added after the first version of the schema, with their types
+ADDED_COLUMNS = (("fingerprint", "TEXT"), ("attempts", "INTEGER"))
+
+
+class HistoryStore:
+    def __init__(self, path=DEFAULT_HISTORY_DB):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # One small write per completed test: WAL keeps each commit cheap
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    # Adds the columns missing from a database created by an earlier version
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(results)")}
+        for column, sql_type in ADDED_COLUMNS:
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE results ADD COLUMN {column} {sql_type}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_fingerprint ON results (name, fingerprint)")
+        self._conn.commit()
+
+    def record(self, run_id, label, result, commit=True):
+        """Appends one result; a result already recorded for the run is left as is."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO results (run_id, label, name, executor, status, duration_sec, "
+                "output_bytes, recorded_at, fingerprint, attempts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_id, label, result.get("name"), result.get("executor"), result.get("status"),
+                    result.get("duration_sec"), result.get("output_bytes"),
+                    datetime.now().isoformat(timespec="seconds"),
+                    result.get("fingerprint"), result.get("attempts"),
+                )
+            )
+            if commit:
+                self._conn.commit()
+
+    def record_run(self, run_id, label, results):
+        for result in results:
+            self.record(run_id, label, result, commit=False)
+        with self._lock:
+            self._conn.commit()
+
+    def import_reports(self, paths):
+        """
+        Imports earlier JSON reports named <run_id>_<label>.json.
+
+        Returns:
+            int: Number of report files imported.
+        """
+        count = 0
+        for path in paths:
+            match = REPORT_NAME.match(os.path.basename(path))
+            if not match:
+                continue
+            try:
+                with open(path) as f:
+                    results = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not isinstance(results, list):
+                continue
+            self.record_run(match.group(1), match.group(2), [r for r in results if isinstance(r, dict)])
+            count += 1
+        return count
+
+    def durations(self, label=None):
+        """Returns {test name: [durations, ascending]} of timed results."""
+        query = f"SELECT name, duration_sec FROM results WHERE status IN {TIMED_STATUSES} AND duration_sec IS NOT NULL"
+        params = ()
+        if label:
+            query += " AND label = ?"
+            params = (label,)
+        query += " ORDER BY name, duration_sec"
+        history = {}
+        with self._lock:
+            for name, duration in self._conn.execute(query, params):
+                history.setdefault(name, []).append(duration)
+        return history
+
+    def last_durations(self):
+        """Returns {test name: duration} of the most recent timed result of each test."""
+        # SQLite takes the bare columns from the row holding the MAX()
+        query = (f"SELECT name, duration_sec, MAX(run_id) FROM results WHERE status IN {TIMED_STATUSES} "
+                 "AND duration_sec > 0 GROUP BY name")
+        with self._lock:
+            return {name: duration for name, duration, _ in self._conn.execute(query)}
+
+    def last_statuses(self):
+        """Returns {test name: status} of the most recent run of each test (see OUTCOME_STATUSES)."""
+        query = f"SELECT name, status, MAX(run_id) FROM results WHERE status IN {OUTCOME_STATUSES} GROUP BY name"
+        with self._lock:
+            return {name: status for name, status, _ in self._conn.execute(query)}
+
+    def percentiles(self, label=None):
+        """Returns rows (name, runs, p50, p95, max), slowest p95 first."""
+        rows = [
+            (name, len(d), percentile(d, 50), percentile(d, 95), d[-1])
+            for name, d in self.durations(label).items()
+        ]
+        return sorted(rows, key=lambda row: (-row[3], row[0]))
+
+    def slowest(self, count=20, label=None):
+        """Returns rows (name, runs, p50, p95, max) of the tests with the highest p50."""
+        return sorted(self.percentiles(label), key=lambda row: (-row[2], row[0]))[:count]
+
+    def regressions(self, baseline, label=None, factor=1.5, min_delta_sec=0.1):
+        """
+        Finds tests whose median duration grew compared to a baseline label.
+
+        Args:
+            baseline (str): Run label to compare against.
+            label (str): Run label to check; all other labels when None.
+            factor (float): Minimum ratio current/baseline median to report.
+            min_delta_sec (float): Minimum absolute growth to report.
+
+        Returns:
+            list: Rows (name, baseline p50, current p50, ratio), worst first.
+        """
+        before = self.durations(baseline)
+        if label:
+            after = self.durations(label)
+        else:
+            after = {}
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT name, duration_sec FROM results WHERE status IN {TIMED_STATUSES} "
+                    "AND duration_sec IS NOT NULL AND label != ? ORDER BY name, duration_sec",
+                    (baseline,)
+                ).fetchall()
+            for name, duration in rows:
+                after.setdefault(name, []).append(duration)
+
+        found = []
+        for name, durations in after.items():
+            if name not in before:
+                continue
+            old, new = percentile(before[name], 50), percentile(durations, 50)
+            if new - old >= min_delta_sec and (old == 0 or new / old >= factor):
+                found.append((name, old, new, new / old if old else float("inf")))
+        return sorted(found, key=lambda row: (-row[3], row[0]))
+
+    def flaky(self, names=None, label=None):
+        """
+        Finds flaky tests: tests whose outcome flipped between PASS and a failure
+        across runs with the same fingerprint, or that only passed on a retry.
+
+        Args:
+            names (iterable): Only these test names, e.g. the tests of the current run.
+            label (str): Only runs with this label.
+
+        Returns:
+            list: Rows (name, fingerprint, runs, passes, failures, flips, last status),
+                most flips first.
+        """
+        query = (
+            "SELECT results.name, fingerprint, status, attempts FROM results{join} "
+            f"WHERE fingerprint IS NOT NULL AND status IN {OUTCOME_STATUSES}"
+        )
+        params = []
+        if label:
+            query += " AND label = ?"
+            params.append(label)
+        query += " ORDER BY results.name, fingerprint, run_id"
+
+        groups = {}
+        with self._lock:
+            if names is None:
+                rows = self._conn.execute(query.format(join=""), params).fetchall()
+            else:
+                # A temporary table keeps the lookup an indexed join however many names there are
+                self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS flaky_names (name TEXT PRIMARY KEY)")
+                self._conn.execute("DELETE FROM flaky_names")
+                self._conn.executemany("INSERT OR IGNORE INTO flaky_names VALUES (?)", ((n,) for n in names))
+                join = " JOIN flaky_names ON flaky_names.name = results.name"
+                rows = self._conn.execute(query.format(join=join), params).fetchall()
+                self._conn.execute("DELETE FROM flaky_names")
+                self._conn.commit()
+        for name, fp, status, attempts in rows:
+            groups.setdefault((name, fp), []).append((status, attempts))
+
+        found = []
+        for (name, fp), outcomes in groups.items():
+            passes = sum(1 for status, _ in outcomes if status == "PASS")
+            flips = sum(
+                1 for (before, _), (after, _) in zip(outcomes, outcomes[1:])
+                if (before == "PASS") != (after == "PASS")
+            )
+            # A PASS after failed attempts is a flip within one run
+            flips += sum(1 for status, attempts in outcomes if status == "PASS" and (attempts or 1) > 1)
+            if flips:
+                found.append((name, fp, len(outcomes), passes, len(outcomes) - passes, flips, outcomes[-1][0]))
+        return sorted(found, key=lambda row: (-row[5], row[0]))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Nearest-rank percentile of an ascending list
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def report_paths(reports_dir="reports"):
+    return sorted(glob.glob(os.path.join(reports_dir, "*.json")))
+
+
+class HistoryRecorder:
+    """Runner listener that appends every completed result to a HistoryStore."""
+
+    def __init__(self, store):
+        self.store = store
+        self.run_id = None
+        self.label = None
+
+    def run_started(self, run_id, label, tests):
+        self.run_id, self.label = run_id, label
+
+    def test_finished(self, result):
+        self.store.record(self.run_id, self.label, result)
@@ -6,23 +6,165 @@
 # includes the file path for reference, allowing for easy identification
 # and debugging of tests. The loaded tests can then be used by the runner
 # to execute the defined commands and validate their outcomes.
-# It uses the PyYAML library to parse YAML files and extract test definitions.
+# It uses the PyYAML library to parse YAML files and extract test definitions,
+# with the libyaml based CSafeLoader when PyYAML was built with it.
 # The tests are expected to be defined in a specific format within the YAML files,
 # typically under a "tests" key, where each test case is a dictionary containing
 # the necessary information such as command, executor type, and expected outcomes.
+# Parsed files are kept in an on-disk cache keyed by path, mtime, size and content
+# hash, so only files that changed since the last run are parsed again. On a cold
+# cache with many files, parsing is spread over a process pool.
+# Test names are relative to the root directory of the tests (--test-dir, see
+# configure_tests_root()), which also decides where their logs go below output/.
+import hashlib
 import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 import yaml
 
-def load_tests(test_dir):
+# libyaml is several times faster than the pure Python loader
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+CACHE_PATH = os.path.join(".nztest_cache", "tests.pickle")
+CACHE_VERSION = 1
+
+# Below this many changed files, parsing in worker processes costs more than it saves
+PARALLEL_PARSE_MIN_FILES = 64
+
+_tests_root = "tests"
+
+
+def configure_tests_root(path):
+    """Sets the root directory of the tests, which test names and log paths are relative to."""
+    global _tests_root
+    _tests_root = path
+
+
+def tests_root():
+    """Returns the root directory of the tests (--test-dir)."""
+    return _tests_root
+
+
+def load_tests(test_dir, use_cache=True):
+    """
+    Loads the tests of every YAML file below one or more directories.
+
+    Args:
+        test_dir (str or list): Directory, or list of directories, to walk.
+        use_cache (bool): Reuse parsed files from the on-disk cache.
+
+    Returns:
+        list: Test dictionaries in directory walk order, each with a `__file__` key.
+    """
+    test_dirs = [test_dir] if isinstance(test_dir, str) else test_dir
+    paths = [path for d in test_dirs for path in find_yaml_files(d)]
+
+    docs = load_documents(paths, use_cache=use_cache)
+
     all_tests = []
-    for root, _, files in os.walk(test_dir):
-        for f in files:
-            if f.endswith(".yaml") or f.endswith(".yml"):
-                path = os.path.join(root, f)
-                with open(path) as infile:
-                    doc = yaml.safe_load(infile)
-                    for test in doc.get("tests", []):
-                        test["__file__"] = path  # Inject path info
-                        all_tests.append(test)
+    for path in paths:
+        for test in docs[path].get("tests", []):
+            test = dict(test)
+            test["__file__"] = path  # Inject path info
+            all_tests.append(test)
     return all_tests
 
+
+def load_documents(paths, use_cache=True):
+    """
+    Parses YAML files, reusing cached documents for files that did not change.
+
+    Args:
+        paths (list): YAML file paths.
+        use_cache (bool): Read and update the on-disk cache.
+
+    Returns:
+        dict: Parsed document for each path (an empty dict for empty files).
+    """
+    cache = _read_cache() if use_cache else {}
+    docs, misses, touched = {}, [], False
+
+    for path in paths:
+        st = os.stat(path)
+        entry = cache.get(path)
+        if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            docs[path] = entry["doc"]
+            continue
+
+        with open(path, "rb") as infile:
+            data = infile.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if entry and entry["sha256"] == digest:
+            # Touched but not changed: only the stat key needs refreshing
+            docs[path] = entry["doc"]
+            touched = True
+        else:
+            misses.append((path, data))
+        cache[path] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": digest, "doc": docs.get(path)}
+
+    if len(misses) >= PARALLEL_PARSE_MIN_FILES:
+        with ProcessPoolExecutor() as pool:
+            parsed = list(pool.map(_parse_yaml, [data for _, data in misses], chunksize=16))
+    else:
+        parsed = [_parse_yaml(data) for _, data in misses]
+
+    for (path, _), doc in zip(misses, parsed):
+        docs[path] = doc
+        cache[path]["doc"] = doc
+
+    if use_cache and (misses or touched):
+        _write_cache(cache)
+    return docs
+
+
+# Yields the YAML files below a directory, in the same order as os.walk()
+# (files of a directory first, then its subdirectories), but with a single
+# scandir() call per directory. Symlinked directories are not followed.
+def find_yaml_files(test_dir):
+    files, subdirs = [], []
+    try:
+        with os.scandir(test_dir) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.endswith((".yaml", ".yml")):
+                    files.append(entry.path)
+    except OSError:
+        return
+    yield from files
+    for subdir in subdirs:
+        yield from find_yaml_files(subdir)
+
+
+def _parse_yaml(data):
+    return yaml.load(data, Loader=YAML_LOADER) or {}
+
+
+def _read_cache():
+    try:
+        with open(CACHE_PATH, "rb") as f:
+            cache = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        return {}
+    if cache.get("version") != CACHE_VERSION or cache.get("loader") != YAML_LOADER.__name__:
+        return {}
+    return cache["entries"]
+
+
+# Entries of deleted files are dropped whenever the cache is written.
+def _write_cache(cache):
+    entries = {path: entry for path, entry in cache.items() if os.path.exists(path)}
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    tmp_path = f"{CACHE_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"version": CACHE_VERSION, "loader": YAML_LOADER.__name__, "entries": entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, CACHE_PATH)
+
+
+# Builds the display name of a test: its directory relative to the tests
+# root (see configure_tests_root()) followed by its short name, e.g. "acme/step-01".
+# This is the name used in logs, reports and `depends_on` lookups.
+def test_name(test):
+    short_name = test.get('name', 'Unnamed Test')
+    rel_path = os.path.relpath(os.path.dirname(test.get('__file__', 'misc')), _tests_root)
+    return f"{rel_path}/{short_name}"
@@ -0,0 +1,299 @@
+# File: core/log_store.py
+# ---
+# This module provides the compressed, content-addressed store for test logs
+# used by `--archive-logs`, and the retention command behind `main.py gc`.
+# Once a test has finished, its log is hashed (SHA-256) and compressed into
+# output/.store/objects/<first 2 hex digits>/<digest>.<codec> unless an object
+# with that digest is already stored, so a log that is identical from run to run
+# is kept only once. The plain log is then replaced by a small reference file
+# next to it (<name>.log.ref) that names the object.
+# Logs are compressed with zstd when the `zstandard` package is installed and
+# with gzip otherwise; readers open both, as well as plain legacy logs, through
+# open_log().
+# collect_garbage() removes old runs (their output directory and their reports)
+# and then every stored object that no remaining run references.
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LOG_STORE_DIR = os.path.join("output", ".store")
+REF_SUFFIX = ".ref"
+
+# Run output directories are named <run_id>_<label>, with run_id = YYYYMMDD_HHMMSS
+RUN_DIR_NAME = re.compile(r"^\d{8}_\d{6}_.+$")
+# Report files of a run, keyed by <run_id>_<label>
+REPORT_NAME = re.compile(r"^(\d{8}_\d{6}_.+?)(_summary\.txt|_data|\.jsonl|\.json|\.html)$")
+
+# Unreferenced objects younger than this are kept by the garbage collector: a
+# running test may have stored one and not written its reference yet
+GC_GRACE_SEC = 3600
+
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+class LogStore:
+    def __init__(self, root=LOG_STORE_DIR, codec=None):
+        """
+        Args:
+            root (str): Directory of the store.
+            codec (str): "zst" or "gz"; defaults to zst when zstandard is installed.
+
+        Raises:
+            ValueError: If the codec is unknown or not available.
+        """
+        self.root = root
+        self.codec = codec or ("zst" if zstandard else "gz")
+        if self.codec not in ("zst", "gz"):
+            raise ValueError(f"Unknown log codec '{self.codec}', expected zst or gz")
+        if self.codec == "zst" and zstandard is None:
+            raise ValueError("The zst log codec needs the zstandard package")
+
+    def archive(self, path):
+        """
+        Moves a plain log into the store and leaves a reference file in its place.
+
+        Args:
+            path (str): Plain log file.
+
+        Returns:
+            str: SHA-256 digest of the log.
+        """
+        digest = _file_sha256(path)
+        object_path = self._find_object(digest)
+        if object_path:
+            # Keeps the object out of the garbage collector's grace period check
+            os.utime(object_path)
+        else:
+            object_path = os.path.join(self.root, "objects", digest[:2], f"{digest}.{self.codec}")
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = f"{object_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+                _compress(src, dst, self.codec)
+            os.replace(tmp_path, object_path)
+
+        ref = {
+            "sha256": digest,
+            "size": os.path.getsize(path),
+            # Relative to the log, so that runs and store can be moved together
+            "object": os.path.relpath(os.path.abspath(object_path), os.path.dirname(os.path.abspath(path))),
+        }
+        tmp_ref = f"{path}{REF_SUFFIX}.tmp"
+        with open(tmp_ref, "w") as f:
+            json.dump(ref, f)
+        os.replace(tmp_ref, path + REF_SUFFIX)
+        os.remove(path)
+        return digest
+
+    def _find_object(self, digest):
+        for codec in ("zst", "gz"):
+            candidate = os.path.join(self.root, "objects", digest[:2], f"{digest}.{codec}")
+            if os.path.exists(candidate):
+                return candidate
+        return None
+
+
+def open_log(path):
+    """
+    Opens a test log for reading in binary mode, whether it is plain or archived.
+
+    Args:
+        path (str): Path of the log as recorded in the result (<name>.log).
+
+    Returns:
+        file: Binary file object; the caller closes it.
+
+    Raises:
+        OSError: If neither the log nor its reference exist, or the object is missing.
+        ValueError: If the reference file cannot be read.
+    """
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        pass
+    object_path = _ref_object(path + REF_SUFFIX)
+    if object_path.endswith(".zst"):
+        if zstandard is None:
+            raise ValueError(f"{object_path} is zstd-compressed; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().stream_reader(open(object_path, "rb"), closefd=True)
+    return gzip.open(object_path, "rb")
+
+
+def read_log(path):
+    """Returns the text of a test log, plain or archived."""
+    with open_log(path) as f:
+        return f.read().decode(errors="replace")
+
+
+# Returns the object file named by a reference file.
+def _ref_object(ref_path):
+    with open(ref_path) as f:
+        try:
+            ref = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"Invalid log reference {ref_path}: {e}")
+    return os.path.abspath(os.path.join(os.path.dirname(ref_path), ref["object"]))
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _compress(src, dst, codec):
+    if codec == "zst":
+        with zstandard.ZstdCompressor(level=3).stream_writer(dst, closefd=False) as writer:
+            shutil.copyfileobj(src, writer, READ_CHUNK_BYTES)
+    else:
+        # mtime=0 keeps the object bytes the same for the same log
+        with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=6, mtime=0) as writer:
+            shutil.copyfileobj(src, writer, READ_CHUNK_BYTES)
+
+
+def collect_garbage(keep=None, max_bytes=None, output_dir="output", reports_dir="reports",
+                    store_root=LOG_STORE_DIR, dry_run=False):
+    """
+    Removes old runs and the stored logs that no remaining run references.
+
+    Runs are the <run_id>_<label> directories in output_dir together with their
+    reports in reports_dir; the most recent run is never removed.
+
+    Args:
+        keep (int): Keep only this many most recent runs.
+        max_bytes (int): Then remove the oldest runs until the runs and the
+            store together take at most this many bytes.
+        output_dir (str): Directory of the run output directories.
+        reports_dir (str): Directory of the reports.
+        store_root (str): Directory of the log store.
+        dry_run (bool): Only report what would be removed.
+
+    Returns:
+        dict: {"removed_runs": [run keys], "kept_runs": count, "removed_objects": count,
+               "freed_bytes": bytes, "total_bytes": bytes left}
+    """
+    runs = _find_runs(output_dir, reports_dir)
+    keys = sorted(runs)
+    removed = keys[:-keep] if keep and len(keys) > keep else []
+    remaining = keys[len(removed):]
+
+    # Reference counts of the objects used by the remaining runs
+    run_size, run_objects, refcount = {}, {}, {}
+    for key in remaining:
+        run_size[key], run_objects[key] = _run_usage(runs[key])
+        for object_path in run_objects[key]:
+            refcount[object_path] = refcount.get(object_path, 0) + 1
+    object_size = {path: _size(path) for path in refcount}
+
+    total = sum(run_size.values()) + sum(object_size.values())
+    if max_bytes is not None:
+        while total > max_bytes and len(remaining) > 1:
+            key = remaining.pop(0)
+            removed.append(key)
+            total -= run_size[key]
+            for object_path in run_objects[key]:
+                refcount[object_path] -= 1
+                if refcount[object_path] == 0:
+                    total -= object_size[object_path]
+
+    freed = 0
+    for key in removed:
+        freed += run_size[key] if key in run_size else _run_usage(runs[key])[0]
+        if not dry_run:
+            for path in runs[key]:
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    _remove(path)
+
+    live = {path for path, count in refcount.items() if count > 0}
+    removed_objects = 0
+    now = time.time()
+    for root, _, files in os.walk(os.path.join(store_root, "objects")):
+        for name in files:
+            path = os.path.abspath(os.path.join(root, name))
+            if path in live:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if now - st.st_mtime < GC_GRACE_SEC and not name.endswith(".tmp"):
+                continue
+            removed_objects += 1
+            freed += st.st_size
+            if not dry_run:
+                _remove(path)
+
+    return {
+        "removed_runs": removed,
+        "kept_runs": len(remaining),
+        "removed_objects": removed_objects,
+        "freed_bytes": freed,
+        "total_bytes": total,
+    }
+
+
+# Returns {run key: [paths]} for the run directories and report files.
+def _find_runs(output_dir, reports_dir):
+    runs = {}
+    for name in _listdir(output_dir):
+        path = os.path.join(output_dir, name)
+        if RUN_DIR_NAME.match(name) and os.path.isdir(path):
+            runs.setdefault(name, []).append(path)
+    for name in _listdir(reports_dir):
+        match = REPORT_NAME.match(name)
+        if match:
+            runs.setdefault(match.group(1), []).append(os.path.join(reports_dir, name))
+    return runs
+
+
+# Returns (bytes used by the run's own files, set of stored objects it references).
+def _run_usage(paths):
+    size, objects = 0, set()
+    for path in paths:
+        if not os.path.isdir(path):
+            size += _size(path)
+            continue
+        for root, _, files in os.walk(path):
+            for name in files:
+                file_path = os.path.join(root, name)
+                size += _size(file_path)
+                if name.endswith(REF_SUFFIX):
+                    try:
+                        objects.add(_ref_object(file_path))
+                    except (OSError, ValueError, KeyError):
+                        pass
+    return size, objects
+
+
+def _listdir(path):
+    try:
+        return os.listdir(path)
+    except FileNotFoundError:
+        return []
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
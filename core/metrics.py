@@ -0,0 +1,248 @@
+# File: core/metrics.py
+# ---
+# This module gives live visibility into a running suite.
+# RunMetrics is a runner listener that keeps a few counters up to date as tests
+# start and finish: completed tests per status, tests in flight, per-executor
+# duration histograms, and an ETA estimated from historical durations.
+# Two optional front ends read from it:
+#   - MetricsServer serves the counters as Prometheus text on a local HTTP port
+#     (`--metrics-port`), from a daemon thread.
+#   - ProgressBar redraws a one-line progress bar on stderr (`--progress`).
+# Every event only updates a handful of counters under a lock, and the progress
+# bar is redrawn at most a few times per second, so both can stay on for runs of
+# tens of thousands of tests.
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from core.loader import test_name
+
+# Upper bounds (seconds) of the duration histogram buckets
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+
+# Statuses of tests that finished without doing their work; they are taken out
+# of the estimated work instead of counting towards the observed throughput
+NOT_RUN_STATUSES = ("CACHED", "SKIPPED", "DRY_RUN")
+
+# Assumed duration of a test that has no history yet, when no history exists at all
+DEFAULT_DURATION_SEC = 1.0
+
+# Minimum seconds between two redraws of the progress bar
+PROGRESS_INTERVAL_SEC = 0.2
+
+
+class RunMetrics:
+    """Runner listener that keeps live counters of the current run."""
+
+    def __init__(self, durations=None):
+        """
+        Args:
+            durations (dict): Test name -> historical duration in seconds, used for the ETA.
+        """
+        self.durations = durations or {}
+        known = sorted(self.durations.values())
+        self.default_duration = known[len(known) // 2] if known else DEFAULT_DURATION_SEC
+        self.run_id = None
+        self.label = None
+        self.total = 0
+        self.completed = {}
+        self.in_flight = 0
+        self.histograms = {}
+        self.started_at = None
+        self._total_work = 0.0
+        self._remaining_work = 0.0
+        self._lock = threading.Lock()
+
+    def run_started(self, run_id, label, tests):
+        with self._lock:
+            self.run_id, self.label = run_id, label
+            self.total = len(tests)
+            self._total_work = self._remaining_work = sum(self.estimate(test_name(t)) for t in tests)
+            self.started_at = time.monotonic()
+
+    def test_started(self, test):
+        with self._lock:
+            self.in_flight += 1
+
+    def test_finished(self, result):
+        status = result.get("status")
+        executor = result.get("executor") or "unknown"
+        duration = result.get("duration_sec") or 0.0
+        estimate = self.estimate(result.get("name"))
+        with self._lock:
+            self.completed[status] = self.completed.get(status, 0) + 1
+            # The coordinator reports results without a test_started event
+            self.in_flight = max(self.in_flight - 1, 0)
+            self._remaining_work = max(self._remaining_work - estimate, 0.0)
+            if status in NOT_RUN_STATUSES:
+                self._total_work = max(self._total_work - estimate, 0.0)
+                return
+
+            buckets, count_sum = self.histograms.setdefault(executor, ([0] * len(DURATION_BUCKETS), [0, 0.0]))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+            count_sum[0] += 1
+            count_sum[1] += duration
+
+    def estimate(self, name):
+        return self.durations.get(name, self.default_duration)
+
+    def snapshot(self):
+        """Returns a consistent copy of the counters, with elapsed time and ETA."""
+        with self._lock:
+            elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+            done = sum(self.completed.values())
+            done_work = self._total_work - self._remaining_work
+            eta = None
+            if done and done_work > 0 and elapsed > 0:
+                # Observed seconds per second of estimated work, which already
+                # accounts for the parallelism of the run
+                eta = self._remaining_work * elapsed / done_work
+            return {
+                "run_id": self.run_id,
+                "label": self.label,
+                "total": self.total,
+                "done": done,
+                "completed": dict(self.completed),
+                "in_flight": self.in_flight,
+                "pending": max(self.total - done - self.in_flight, 0),
+                "histograms": {e: (list(b), list(cs)) for e, (b, cs) in self.histograms.items()},
+                "elapsed": elapsed,
+                "eta": eta,
+            }
+
+    def prometheus(self):
+        """Renders the counters in the Prometheus text exposition format."""
+        snap = self.snapshot()
+        lines = [
+            "# HELP nztest_run_info Run being executed.",
+            "# TYPE nztest_run_info gauge",
+            f'nztest_run_info{{run_id="{_escape(snap["run_id"])}",label="{_escape(snap["label"])}"}} 1',
+            "# HELP nztest_tests Number of tests selected for the run.",
+            "# TYPE nztest_tests gauge",
+            f"nztest_tests {snap['total']}",
+            "# HELP nztest_tests_completed_total Tests finished, by status.",
+            "# TYPE nztest_tests_completed_total counter",
+        ]
+        for status, count in sorted(snap["completed"].items(), key=lambda item: str(item[0])):
+            lines.append(f'nztest_tests_completed_total{{status="{_escape(status)}"}} {count}')
+        lines += [
+            "# HELP nztest_tests_in_flight Tests running right now.",
+            "# TYPE nztest_tests_in_flight gauge",
+            f"nztest_tests_in_flight {snap['in_flight']}",
+            "# HELP nztest_tests_pending Tests waiting to start.",
+            "# TYPE nztest_tests_pending gauge",
+            f"nztest_tests_pending {snap['pending']}",
+            "# HELP nztest_test_duration_seconds Duration of executed tests, by executor.",
+            "# TYPE nztest_test_duration_seconds histogram",
+        ]
+        for executor, (buckets, (count, total)) in sorted(snap["histograms"].items()):
+            name = _escape(executor)
+            for bound, value in zip(DURATION_BUCKETS, buckets):
+                lines.append(f'nztest_test_duration_seconds_bucket{{executor="{name}",le="{bound}"}} {value}')
+            lines.append(f'nztest_test_duration_seconds_bucket{{executor="{name}",le="+Inf"}} {count}')
+            lines.append(f'nztest_test_duration_seconds_sum{{executor="{name}"}} {total:.6f}')
+            lines.append(f'nztest_test_duration_seconds_count{{executor="{name}"}} {count}')
+        lines += [
+            "# HELP nztest_elapsed_seconds Seconds since the run started.",
+            "# TYPE nztest_elapsed_seconds gauge",
+            f"nztest_elapsed_seconds {snap['elapsed']:.3f}",
+        ]
+        if snap["eta"] is not None:
+            lines += [
+                "# HELP nztest_eta_seconds Estimated seconds until the run finishes.",
+                "# TYPE nztest_eta_seconds gauge",
+                f"nztest_eta_seconds {snap['eta']:.3f}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value or "").replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsServer:
+    """
+    Serves RunMetrics.prometheus() on http://<host>:<port>/metrics from a daemon thread.
+    The port is bound on construction, which raises OSError when it is in use.
+    """
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # Scrapes must not end up in the run's console output
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class ProgressBar:
+    """Runner listener that redraws a one-line progress bar on stderr."""
+
+    def __init__(self, metrics, stream=None, width=30):
+        self.metrics = metrics
+        self.stream = stream or sys.stderr
+        self.width = width
+        self._last_draw = 0.0
+        self._lock = threading.Lock()
+
+    def test_started(self, test):
+        self._draw()
+
+    def test_finished(self, result):
+        self._draw()
+
+    def run_finished(self, results):
+        self._draw(force=True)
+        self.stream.write("\n")
+        self.stream.flush()
+
+    def _draw(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_draw < PROGRESS_INTERVAL_SEC:
+                return
+            self._last_draw = now
+            snap = self.metrics.snapshot()
+            total = snap["total"] or 1
+            filled = self.width * snap["done"] // total
+            failed = sum(count for status, count in snap["completed"].items() if status in ("FAIL", "TIMEOUT", "ERROR"))
+            eta = _format_seconds(snap["eta"]) if snap["eta"] is not None else "--"
+            self.stream.write(
+                f"\r[{'#' * filled}{'.' * (self.width - filled)}] {snap['done']}/{snap['total']}"
+                f"  running {snap['in_flight']}  failed {failed}"
+                f"  elapsed {_format_seconds(snap['elapsed'])}  ETA {eta}\033[K"
+            )
+            self.stream.flush()
+
+
+def _format_seconds(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
@@ -0,0 +1,166 @@
+# File: core/preflight.py
+# ---
+# This module runs the preflight stage of a run: before any test starts, it
+# works out what the selected tests need and checks it once, so that a missing
+# `nzsql` binary or an unreachable NZ_HOST is reported as one clear error instead
+# of hundreds of tests each failing on their own (and each waiting for the
+# connection timeout).
+# What a test needs comes from the `requires` key of its executor's spec (see
+# executors/registry.py):
+#   - executor: the executor must be known
+#   - tool:     every executable in `requires.tools` must be on the PATH
+#   - database: with `requires.database`, the test's `database` (or NZ_DATABASE)
+#     must answer a `SELECT 1` through nzsql within the probe timeout
+# Each distinct need is probed once; the database probes run concurrently.
+# Successful database probes are cached in .nztest_cache/preflight.json for a
+# TTL, keyed by the connection settings, so back-to-back runs skip them. Failed
+# probes are not cached: a server that comes back up is seen by the next run.
+# The tests whose needs are not met get `__preflight_error__` with the reason,
+# and the runner reports them as ERROR without running them.
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from executors.process import child_env, run_process
+from executors.registry import executor_error, requirements
+from utils.helpers import log_line
+from utils.tool_check import find_tools
+
+PREFLIGHT_CACHE_PATH = os.path.join(".nztest_cache", "preflight.json")
+
+# Seconds a successful database probe is trusted
+DEFAULT_TTL_SEC = 300
+
+# Seconds a database gets to answer a probe
+DEFAULT_PROBE_TIMEOUT_SEC = 10
+
+# Database probes run at the same time
+PROBE_WORKERS = 16
+
+# Environment variables that decide where and how nzsql connects
+CONNECTION_ENV = ("NZ_HOST", "NZ_USER", "NZ_PASSWORD", "NZ_PORT")
+
+# Needs are probed and reported in this order, so that a test missing its tool
+# is reported as such rather than as an unreachable database
+PROBE_KINDS = ("executor", "tool", "database")
+
+
+def run_preflight(tests, ttl_sec=DEFAULT_TTL_SEC, timeout=DEFAULT_PROBE_TIMEOUT_SEC, cache_path=PREFLIGHT_CACHE_PATH):
+    """
+    Checks what the tests need and marks the tests that cannot run.
+
+    Args:
+        tests (list): Selected tests; tests that cannot run get `__preflight_error__`.
+        ttl_sec (float): Seconds a successful database probe stays cached; 0 disables the cache.
+        timeout (float): Seconds each database probe may take.
+        cache_path (str): File of the probe cache.
+
+    Returns:
+        int: Number of tests that cannot run.
+    """
+    needs = {}
+    for idx, test in enumerate(tests):
+        if test.get("skip"):
+            continue
+        for need in _needs(test):
+            needs.setdefault(need, []).append(idx)
+    if not needs:
+        return 0
+
+    cache = _read_cache(cache_path) if ttl_sec > 0 else {}
+    now = time.time()
+    errors, todo, cached = {}, [], 0
+    tools = find_tools(sorted({value for kind, value in needs if kind == "tool"}))
+    for need in needs:
+        kind, value = need
+        if kind == "executor":
+            errors[need] = executor_error(value)
+        elif kind == "tool":
+            errors[need] = None if tools[value] else f"'{value}' not found on the PATH"
+        elif now - cache.get(_cache_key(value), 0) < ttl_sec:
+            errors[need] = None
+            cached += 1
+        else:
+            todo.append(need)
+
+    if todo and not tools.get("nzsql", True):
+        # Every database probe would fail the same way; the tool error is reported instead
+        errors.update({need: "'nzsql' not found on the PATH" for need in todo})
+        todo = []
+    if todo:
+        with ThreadPoolExecutor(max_workers=min(PROBE_WORKERS, len(todo))) as pool:
+            for need, error in zip(todo, pool.map(lambda need: _probe_database(need[1], timeout), todo)):
+                errors[need] = error
+                if error is None:
+                    cache[_cache_key(need[1])] = now
+        if ttl_sec > 0:
+            _write_cache(cache_path, cache, now - ttl_sec)
+
+    failed = set()
+    for need in sorted(needs, key=lambda need: (PROBE_KINDS.index(need[0]), need[1])):
+        if not errors[need]:
+            continue
+        blocked = [idx for idx in needs[need] if idx not in failed]
+        for idx in blocked:
+            tests[idx]["__preflight_error__"] = errors[need]
+            failed.add(idx)
+        if blocked:
+            log_line("ERROR", "Preflight failed", f"{errors[need]}: {len(blocked)} tests will not run")
+
+    log_line("INFO", "Preflight", f"{len(needs)} checks ({len(todo)} database probes, {cached} cached), "
+                                  f"{len(failed)} tests cannot run")
+    return len(failed)
+
+
+# Returns the (kind, value) needs of a test.
+def _needs(test):
+    executor = test.get("executor", "bash")
+    requires = requirements(executor)
+    if requires is None:
+        return [("executor", executor)]
+    needs = [("tool", tool) for tool in requires["tools"]]
+    if requires["database"]:
+        needs.append(("database", test.get("database") or os.environ.get("NZ_DATABASE", "")))
+    return needs
+
+
+# Runs `SELECT 1` against a database. Returns None when it answered, or the reason it did not.
+def _probe_database(database, timeout):
+    command = ["nzsql", "-A", "-t", "-c", "SELECT 1"] + (["-d", database] if database else [])
+    where = f"database '{database or '(default)'}' on {os.environ.get('NZ_HOST', '(no NZ_HOST)')}"
+    try:
+        returncode, output, timed_out = run_process(command, env=child_env(), timeout=timeout)
+    except OSError as e:
+        return f"cannot run nzsql for {where}: {e}"
+    if timed_out:
+        return f"{where} did not answer within {timeout:g}s"
+    if returncode != 0:
+        lines = [line.strip() for line in output.splitlines() if line.strip()]
+        return f"{where} is not reachable: {lines[-1] if lines else f'nzsql exited with status {returncode}'}"
+    return None
+
+
+# Cache key of a database probe: the database and the connection settings
+# (the password only as part of the hash)
+def _cache_key(database):
+    settings = [database] + [os.environ.get(var, "") for var in CONNECTION_ENV]
+    return hashlib.sha256(json.dumps(settings).encode()).hexdigest()
+
+
+def _read_cache(path):
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+# Writes the cache without the entries older than `expired`.
+def _write_cache(path, cache, expired):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({key: checked_at for key, checked_at in cache.items() if checked_at > expired}, f)
+    os.replace(tmp_path, path)
@@ -8,15 +8,314 @@
 # The report file is named using the run ID and label, ensuring that each report is unique
 # and can be easily identified later. The results are saved in a JSON format for easy readability
 # and potential further processing or analysis.
+# While the run is going, StreamingReport appends every completed result to a
+# JSON Lines file (<run_id>_<label>.jsonl) next to the final report. The final
+# JSON, HTML and summary are built by reading that stream back, and a run that
+# dies half way still leaves the results of every test that finished.
+# Lines are appended in completion order; each one starts with the test's
+# position in the run (`__index__`), so that the stream is read back in the
+# tests' original order without loading it all into memory.
+# For --rerun-failed, load_report() and rerun_names() find the tests of an
+# earlier report to run again, and merge_results() folds the results of the
+# rerun back into that report's results.
+# load_durations() and load_last_statuses() feed sharding and --order. They ask
+# the history database (core/history.py) when there is one, and otherwise only
+# read the newest reports, so their cost does not grow with every run kept.
+import glob
 import os
 import json
+import re
+import threading
+import time
 from datetime import datetime
+from core.loader import test_name
+
+# Earlier JSON reports read by load_durations() and load_last_statuses() when
+# the history database cannot answer
+MAX_EARLIER_REPORTS = 20
+
+# Seconds between fsync() calls on the result stream
+FSYNC_INTERVAL_SEC = 2.0
+
+# Position of the test at the start of a stream line, as written by StreamingReport
+STREAM_INDEX = re.compile(rb'^\{"__index__": (\d+)')
+
+# Result streams are named <run_id>_<label>.jsonl, with run_id = YYYYMMDD_HHMMSS
+STREAM_NAME = re.compile(r"^(\d{8}_\d{6})_(.+)\.jsonl$")
+# Reports and streams that --rerun-failed reads
+REPORT_NAME = re.compile(r"^(\d{8}_\d{6})_(.+)\.jsonl?$")
+
+# Statuses run again by --rerun-failed, together with the tests they caused
+# to be skipped (failed dependency, fail-fast)
+RERUN_STATUSES = ("FAIL", "ERROR", "TIMEOUT")
 
 
 def write_report(results, label="system", output_dir="reports", run_id=None):
+    """
+    Writes the JSON report, one result at a time.
+
+    Args:
+        results (iterable): Result dictionaries, e.g. read_report_stream().
+        label (str): Run label used in the file name.
+        output_dir (str): Directory of the report.
+        run_id (str): Run ID used in the file name; defaults to the current timestamp.
+
+    Returns:
+        str: Path of the report.
+    """
     os.makedirs(output_dir, exist_ok=True)
     if not run_id:
         run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
     path = f"{output_dir}/{run_id}_{label}.json"
+    # Same layout as json.dump(results, f, indent=2), without holding it all in memory
     with open(path, "w") as f:
-        json.dump(results, f, indent=2)
+        separator = "[\n"
+        for result in results:
+            f.write(separator)
+            f.write("  " + json.dumps(result, indent=2).replace("\n", "\n  "))
+            separator = ",\n"
+        f.write("\n]" if separator == ",\n" else "[]")
+    return path
+
+
+def load_durations(reports_dir="reports", history=None, max_reports=MAX_EARLIER_REPORTS):
+    """
+    Reads the most recent duration of every test, from the history database
+    when it holds any, otherwise from the newest earlier JSON reports.
+
+    Args:
+        reports_dir (str): Directory holding <run_id>_<label>.json reports.
+        history (HistoryStore): History database to read first.
+        max_reports (int): Number of newest reports read without a history.
+
+    Returns:
+        dict: Test name -> duration in seconds.
+    """
+    durations = history.last_durations() if history else {}
+    if durations:
+        return durations
+    for results in _earlier_reports(reports_dir, max_reports):
+        for r in results:
+            if r.get("status") in ("PASS", "FAIL", "TIMEOUT") and r.get("duration_sec"):
+                durations[r["name"]] = r["duration_sec"]
+    return durations
+
+
+def load_last_statuses(reports_dir="reports", history=None, max_reports=MAX_EARLIER_REPORTS):
+    """
+    Reads the status of every test in the most recent run that ran it, from
+    the history database when it holds any, otherwise from the newest earlier
+    JSON reports.
+
+    Skipped, cached and dry-run results do not count as a run.
+
+    Args:
+        reports_dir (str): Directory holding <run_id>_<label>.json reports.
+        history (HistoryStore): History database to read first.
+        max_reports (int): Number of newest reports read without a history.
+
+    Returns:
+        dict: Test name -> status.
+    """
+    statuses = history.last_statuses() if history else {}
+    if statuses:
+        return statuses
+    for results in _earlier_reports(reports_dir, max_reports):
+        for r in results:
+            if r.get("status") not in ("SKIPPED", "CACHED", "DRY_RUN"):
+                statuses[r.get("name")] = r.get("status")
+    return statuses
+
+
+# Yields the result lists of the newest `limit` JSON reports, oldest first
+# (report names start with the run timestamp, so name order is run order).
+def _earlier_reports(reports_dir, limit):
+    for path in sorted(glob.glob(os.path.join(reports_dir, "*.json")))[-limit:]:
+        try:
+            with open(path) as f:
+                results = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if isinstance(results, list):
+            yield [r for r in results if isinstance(r, dict)]
+
+
+def load_report(path):
+    """
+    Reads the results of an earlier run from its JSON report or its .jsonl stream.
+
+    Args:
+        path (str): reports/<run_id>_<label>.json or .jsonl.
+
+    Returns:
+        list: Result dictionaries, in report order.
+
+    Raises:
+        ValueError: If the file cannot be read or holds no result list.
+    """
+    try:
+        if path.endswith(".jsonl"):
+            return list(read_report_stream(path))
+        with open(path) as f:
+            results = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Cannot read report {path}: {e}")
+    if not isinstance(results, list):
+        raise ValueError(f"{path} is not a list of results")
+    return [r for r in results if isinstance(r, dict)]
+
+
+def parse_report_name(path):
+    """Returns (run_id, label) from a .json report or .jsonl stream path, or (None, None)."""
+    match = REPORT_NAME.match(os.path.basename(path))
+    return (match.group(1), match.group(2)) if match else (None, None)
+
+
+def rerun_names(results):
+    """
+    Returns the names of the tests to run again: the failed ones, and the ones
+    skipped because of a failure (not the ones skipped by configuration).
+    """
+    names = set()
+    for r in results:
+        status = r.get("status")
+        if status in RERUN_STATUSES or (status == "SKIPPED" and r.get("skip_reason", "configuration") != "configuration"):
+            names.add(r.get("name"))
+    return names
+
+
+def merge_results(previous, rerun):
+    """
+    Yields the results of an earlier run with those of a rerun in their place.
+
+    A rerun result keeps the earlier status in `previous_status` and is marked
+    flaky when its outcome differs from the earlier one although the test's
+    fingerprint did not change. Rerun results of tests missing from the earlier
+    run come last.
+
+    Args:
+        previous (list): Results of the earlier run (load_report()).
+        rerun (iterable): Results of the rerun, e.g. read_report_stream().
+
+    Yields:
+        dict: Merged results.
+    """
+    rerun = {r.get("name"): r for r in rerun}
+    for old in previous:
+        new = rerun.pop(old.get("name"), None)
+        if new is None:
+            yield old
+            continue
+        new = dict(new, rerun=True, previous_status=old.get("status"))
+        outcomes = [r.get("status") for r in (old, new)]
+        if (all(status == "PASS" or status in RERUN_STATUSES for status in outcomes)
+                and (outcomes[0] == "PASS") != (outcomes[1] == "PASS")
+                and old.get("fingerprint") and old.get("fingerprint") == new.get("fingerprint")):
+            new["flaky"] = True
+        yield new
+    for new in rerun.values():
+        yield dict(new, rerun=True)
+
+
+def stream_path(label="system", output_dir="reports", run_id=None):
+    return f"{output_dir}/{run_id}_{label}.jsonl"
+
+
+def parse_stream_name(path):
+    """Returns (run_id, label) from a result stream path; raises ValueError when it does not match."""
+    match = STREAM_NAME.match(os.path.basename(path))
+    if not match:
+        raise ValueError(f"'{path}' is not named <run_id>_<label>.jsonl")
+    return match.group(1), match.group(2)
+
+
+def read_report_stream(path):
+    """
+    Yields the results stored in a JSON Lines result stream, in the tests'
+    original order.
+
+    Only the position and offset of every line are held in memory; the lines
+    are then read back one at a time in test order. Lines without a position
+    (streams written by earlier versions) keep their completion order, after
+    the others. A last line cut short by a crash is ignored.
+
+    Args:
+        path (str): Path of the .jsonl stream.
+
+    Yields:
+        dict: One result per completed test.
+    """
+    with open(path, "rb") as f:
+        positions = []
+        offset = 0
+        for number, line in enumerate(f):
+            if not line.endswith(b"\n"):
+                break
+            match = STREAM_INDEX.match(line)
+            positions.append((int(match.group(1)) if match else float("inf"), number, offset))
+            offset += len(line)
+        positions.sort()
+
+        for _, _, offset in positions:
+            f.seek(offset)
+            try:
+                result = json.loads(f.readline())
+            except ValueError:
+                continue
+            if isinstance(result, dict):
+                result.pop("__index__", None)
+                yield result
+
+
+class StreamingReport:
+    """
+    Runner listener that appends each completed result to a JSON Lines file.
+
+    Every line is flushed as soon as it is written, so it survives a crash of
+    the runner; the file is fsync'ed at most every fsync_interval seconds and
+    once more when the run finishes.
+    """
+
+    def __init__(self, output_dir="reports", fsync_interval=FSYNC_INTERVAL_SEC):
+        self.output_dir = output_dir
+        self.fsync_interval = fsync_interval
+        self.path = None
+        self._file = None
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+        # Test name -> positions in the run not yet used by a result
+        self._positions = {}
+
+    def run_started(self, run_id, label, tests):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.path = stream_path(label, self.output_dir, run_id)
+        self._file = open(self.path, "a")
+        self._last_sync = time.monotonic()
+        self._positions = {}
+        for idx, test in enumerate(tests):
+            self._positions.setdefault(test_name(test), []).append(idx)
+        for positions in self._positions.values():
+            positions.reverse()
+
+    def test_finished(self, result):
+        with self._lock:
+            positions = self._positions.get(result.get("name"))
+            record = {"__index__": positions.pop()} if positions else {}
+        record.update(result)
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_sync = time.monotonic()
+
+    def run_finished(self, results):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._file and not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
@@ -0,0 +1,162 @@
+# File: core/result_cache.py
+# ---
+# This module provides ResultCache, a content-addressed store of earlier PASS results
+# used by the `--reuse-results` mode of the runner.
+# Every test gets a fingerprint, a SHA-256 over:
+#   - the test definition itself
+#   - the contents of its `command` script (bash) or `sql_file`
+#   - the contents of its `expect: golden` file
+#   - the values of selected environment variables (DEFAULT_FINGERPRINT_ENV plus
+#     the names listed under `fingerprint_env:` in the test)
+#   - the contents of every file matched by the `inputs:` glob list, relative to
+#     the test's directory
+# When a test passes, its result and log are stored under its fingerprint. When a
+# later run finds a stored result for the same fingerprint, the test is not run
+# again: the stored log is copied into the run's output and the result is
+# reported with status CACHED.
+# Tests with setup or teardown fixtures are always run: the variables their
+# setups export are only known once the setups ran.
+# Stored results expire after a maximum age, and the oldest ones are evicted
+# once the store grows beyond a maximum size.
+import glob
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import time
+
+RESULT_CACHE_DIR = os.path.join(".nztest_cache", "results")
+
+# Environment variables that always take part in the fingerprint
+DEFAULT_FINGERPRINT_ENV = ["NZ_HOST", "NZ_DATABASE", "NZ_USER"]
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_MAX_AGE_SEC = 14 * 24 * 3600
+
+
+class ResultCache:
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_age_sec=DEFAULT_MAX_AGE_SEC):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_sec = max_age_sec
+
+    def lookup(self, fp):
+        """Returns the stored result for a fingerprint, or None if there is no fresh one."""
+        meta_path, log_path = self._paths(fp)
+        try:
+            if time.time() - os.path.getmtime(meta_path) > self.max_age_sec:
+                return None
+            with open(meta_path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(log_path):
+            return None
+        entry["log_path"] = log_path
+        return entry
+
+    def store(self, fp, result):
+        """Stores a PASS result and a copy of its log under its fingerprint."""
+        meta_path, log_path = self._paths(fp)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        tmp_suffix = f".{os.getpid()}.tmp"
+        shutil.copyfile(result["output_file"], log_path + tmp_suffix)
+        os.replace(log_path + tmp_suffix, log_path)
+        with open(meta_path + tmp_suffix, "w") as f:
+            json.dump({"result": result, "stored_at": time.time()}, f)
+        os.replace(meta_path + tmp_suffix, meta_path)
+
+    def evict(self):
+        """Removes expired entries, then the oldest ones until the store fits in max_bytes."""
+        entries = []
+        now = time.time()
+        for root, _, files in os.walk(self.cache_dir):
+            for f in files:
+                if not f.endswith(".json"):
+                    continue
+                meta_path = os.path.join(root, f)
+                log_path = meta_path[:-len(".json")] + ".log"
+                try:
+                    mtime = os.path.getmtime(meta_path)
+                    size = os.path.getsize(meta_path) + (os.path.getsize(log_path) if os.path.exists(log_path) else 0)
+                except OSError:
+                    continue
+                if now - mtime > self.max_age_sec:
+                    _remove(meta_path, log_path)
+                else:
+                    entries.append((mtime, size, meta_path, log_path))
+
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, meta_path, log_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            _remove(meta_path, log_path)
+            total -= size
+
+    def _paths(self, fp):
+        base = os.path.join(self.cache_dir, fp[:2], fp)
+        return base + ".json", base + ".log"
+
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def fingerprint(test):
+    """
+    Computes the fingerprint of a test from its definition and its inputs.
+
+    Args:
+        test (dict): Test dictionary with a `__file__` key.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    h = hashlib.sha256()
+    definition = {k: v for k, v in test.items() if k == "__file__" or not k.startswith("__")}
+    definition.pop("skip", None)
+    h.update(json.dumps(definition, sort_keys=True, default=str).encode())
+
+    test_dir = os.path.dirname(test.get("__file__", ""))
+    files = []
+    if test.get("sql_file"):
+        files.append(os.path.join(test_dir, test["sql_file"]))
+    elif test.get("executor", "bash") == "bash" and test.get("command"):
+        try:
+            files.append(os.path.join(test_dir, shlex.split(test["command"])[0]))
+        except (ValueError, IndexError):
+            pass
+    expect = test.get("expect")
+    if isinstance(expect, dict) and expect.get("golden"):
+        files.append(os.path.join(test_dir, expect["golden"]))
+
+    inputs = test.get("inputs") or []
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    for pattern in inputs:
+        files.extend(sorted(p for p in glob.glob(os.path.join(test_dir, pattern), recursive=True) if os.path.isfile(p)))
+
+    for path in files:
+        h.update(b"\0file\0" + path.encode() + b"\0")
+        _hash_file(h, path)
+
+    env_vars = DEFAULT_FINGERPRINT_ENV + list(test.get("fingerprint_env") or [])
+    for var in sorted(set(env_vars)):
+        h.update(f"\0env\0{var}={os.environ.get(var, '')}".encode())
+
+    return h.hexdigest()
+
+
+def _hash_file(h, path):
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+    except OSError:
+        # Missing or unreadable inputs still change the fingerprint
+        h.update(b"\0missing\0")
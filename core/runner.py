@@ -1,8 +1,8 @@
 # File: core/runner.py
 # ---
 # This module contains the main logic for executing test cases.
-# It imports various executor functions for running different types of commands,
-# such as bash scripts, nzsql commands, and nzsql files.
+# It runs each test with its executor from the executor registry
+# (executors/registry.py), such as bash scripts, nzsql commands, and nzsql files.
 # The run_test function is responsible for executing a single test case,
 # managing the output directory structure, and handling the test execution logic.
 # The run_tests function iterates over a list of test cases, executing each one
@@ -13,28 +13,33 @@
 # and analysis after all tests have been executed.
 # The output directory structure is designed to keep results organized by run,
 # making it easier to locate and review test outputs later.
+import asyncio
+import itertools
 import os
+import shutil
+import time
 from datetime import datetime
-from utils.helpers import log_line
-from executors.bash_executor import run_bash
-from executors.nzsql_executor import run_nzsql
-from executors.nz_executor import run_nz
-from executors.nzsql_file_executor import run_nzsql_file
-
-# Maps each executor type to the appropriate function
-# Type of process to run, bash script, nzsql command, or nzsql file
-# The executors are imported from their respective modules
-# This allows for easy extension in the future if new executors are added
-# Each executor function should return a tuple (status, output)
-# where status is a boolean indicating success/failure,
-# and output is the command output or error message.
-# The executors are expected to handle their own logging and output management.
-EXECUTOR_MAP = {
-    'bash': run_bash,
-    'nzsql': run_nzsql,
-    'nz': run_nz,
-    'nzsql_file': run_nzsql_file
-}
+from utils.helpers import log_context, log_line
+from core.expect import OutputExpectations
+from core.fixtures import FixtureManager
+from core.loader import test_name, tests_root
+from core.result_cache import fingerprint
+from core.report import load_durations, load_last_statuses
+from core.scheduler import build_dependency_graph, order_priorities, run_graph, run_graph_async
+from executors.capture import OutputCapture
+from executors.process import RESOURCE_FIELDS
+from executors.registry import capabilities, close_executors, executor_spec, run_executor, run_executor_async
+
+# Execution engines for run_tests():
+#   - "thread": blocking executors on a thread pool of `jobs` workers
+#   - "async":  asyncio executors on one event loop, `jobs` tests in flight
+ENGINES = ("thread", "async")
+
+# Statuses that are run again when the test has `retries` left
+RETRY_STATUSES = ("FAIL", "TIMEOUT")
+
+# Ids of batches, unique within the process
+_batch_ids = itertools.count(1)
 
 # This function runs a single test case, managing the output directory structure
 # and handling the execution logic based on the executor type specified in the test definition.
@@ -53,17 +58,151 @@ EXECUTOR_MAP = {
 # It is expected to be called by the run_tests function, which manages multiple test cases.
 # The function also supports skipping tests based on configuration,
 # allowing for flexible test execution based on user-defined conditions.
-def run_test(test, base_output_dir, dry_run=False):
+# `timeout_sec` (or default_timeout) limits how long the test may run before it
+# is killed and reported as TIMEOUT; FAIL and TIMEOUT results are run again up to
+# `retries` times, waiting `retry_backoff` seconds (doubled per retry) in between.
+def run_test(test, base_output_dir, dry_run=False, result_cache=None, default_timeout=None, fixtures=None,
+             fingerprints=False):
     #name = test.get('name', 'Unnamed Test')
 
+    result = _new_result(test, base_output_dir)
+    if _finish_without_running(test, result, dry_run):
+        return result
+    result_cache = _result_cache_for(test, result_cache, fixtures)
+    if _reuse_cached_result(test, result, result_cache, fingerprints):
+        return result
+    if _preflight_failed(test, result):
+        return result
+    try:
+        env = fixtures.enter(test) if fixtures else None
+    except ValueError as e:
+        _record_error(result, e)
+        return result
+
+    timeout = test.get('timeout_sec', default_timeout)
+    retries, backoff = _retry_policy(test)
+    for attempt in range(1, retries + 2):
+        if attempt > 1:
+            time.sleep(_prepare_retry(result, attempt, backoff))
+        try:
+            log_line("START", "Starting Test", result['name'])
+            start = time.perf_counter()
+
+            expectations = _expectations(test)
+            capture = OutputCapture(result['output_file'], observer=expectations)
+            try:
+                status, output = _execute(test, result, timeout, capture, env)
+                # Messages from executors that produced no output (e.g. an unknown
+                # executor or a command that could not be started) go to the log too.
+                if output and not capture.bytes_written:
+                    capture.write_text(output.rstrip() + "\n")
+            finally:
+                capture.close()
+
+            duration = time.perf_counter() - start
+            _record_result(result, status, output, duration, capture, expectations)
+
+        except Exception as e:
+            _record_error(result, e)
+
+        result['attempts'] = attempt
+        if result['status'] not in RETRY_STATUSES:
+            break
+
+    _store_cached_result(result, result_cache)
+    return result
+
+# Runs the test's executor once, streaming its output to the capture. `env`
+# holds the variables exported by the test's setup fixtures.
+# The executor is looked up (and imported on first use) in executors.registry.
+def _execute(test, result, timeout, capture, env=None):
+    return run_executor(test, timeout=timeout, capture=capture, env=env)
+
+# Asyncio version of run_test(), used by the "async" engine.
+# The executors run as child processes on the event loop, so many tests can be
+# in flight from a single thread.
+async def run_test_async(test, base_output_dir, dry_run=False, result_cache=None, default_timeout=None, fixtures=None,
+                         fingerprints=False):
+    result = _new_result(test, base_output_dir)
+    if _finish_without_running(test, result, dry_run):
+        return result
+    result_cache = _result_cache_for(test, result_cache, fixtures)
+    if _reuse_cached_result(test, result, result_cache, fingerprints):
+        return result
+    if _preflight_failed(test, result):
+        return result
+    try:
+        # Setups are blocking and may have to wait for another test's setup
+        env = await asyncio.get_running_loop().run_in_executor(None, fixtures.enter, test) if fixtures else None
+    except ValueError as e:
+        _record_error(result, e)
+        return result
+
+    timeout = test.get('timeout_sec', default_timeout)
+    retries, backoff = _retry_policy(test)
+    for attempt in range(1, retries + 2):
+        if attempt > 1:
+            await asyncio.sleep(_prepare_retry(result, attempt, backoff))
+        try:
+            log_line("START", "Starting Test", result['name'])
+            start = time.perf_counter()
+
+            expectations = _expectations(test)
+            capture = OutputCapture(result['output_file'], observer=expectations)
+            try:
+                status, output = await _execute_async(test, result, timeout, capture, env)
+                # Messages from executors that produced no output (e.g. an unknown
+                # executor or a command that could not be started) go to the log too.
+                if output and not capture.bytes_written:
+                    capture.write_text(output.rstrip() + "\n")
+            finally:
+                capture.close()
+
+            duration = time.perf_counter() - start
+            _record_result(result, status, output, duration, capture, expectations)
+
+        except Exception as e:
+            _record_error(result, e)
+
+        result['attempts'] = attempt
+        if result['status'] not in RETRY_STATUSES:
+            break
+
+    _store_cached_result(result, result_cache)
+    return result
+
+# Asyncio version of _execute().
+async def _execute_async(test, result, timeout, capture, env=None):
+    return await run_executor_async(test, timeout=timeout, capture=capture, env=env)
+
+# Reads the `retries` and `retry_backoff` keys of a test.
+# Returns (number of retries, seconds to wait before the first retry).
+def _retry_policy(test):
+    retries = max(int(test.get('retries', 0) or 0), 0)
+    backoff = max(float(test.get('retry_backoff', 0) or 0), 0.0)
+    return retries, backoff
+
+# Keeps the log of the failed attempt next to the test log (<name>.attempt<N>.log)
+# and returns the delay before the next attempt. The delay starts at
+# `retry_backoff` and doubles with every further retry.
+def _prepare_retry(result, attempt, backoff):
+    previous = attempt - 1
+    base, ext = os.path.splitext(result['output_file'])
+    try:
+        os.replace(result['output_file'], f"{base}.attempt{previous}{ext}")
+    except OSError:
+        pass
+    log_line("RUN", "Retrying Test", f"{result['name']} (attempt {attempt}, previous: {result['status']})")
+    return backoff * 2 ** (previous - 1)
+
+# Builds the initial result dictionary for a test and creates its output directory.
+def _new_result(test, base_output_dir):
     short_name = test.get('name', 'Unnamed Test')
-    rel_path = os.path.relpath(os.path.dirname(test.get('__file__', 'misc')), 'tests')
-    name = f"{rel_path}/{short_name}"
+    rel_path = os.path.relpath(os.path.dirname(test.get('__file__', 'misc')), tests_root())
+    name = test_name(test)
 
     executor = test.get('executor', 'bash')
     command = test.get('command', '')
-    test_file = test.get('__file__', '')
-    test_dir = os.path.dirname(test_file)
     #test_output_dir = os.path.join(base_output_dir, test_dir)
     test_output_dir = os.path.join(base_output_dir, rel_path)
     os.makedirs(test_output_dir, exist_ok=True)
@@ -72,7 +211,7 @@ def run_test(test, base_output_dir, dry_run=False):
     safe_name = short_name.replace(" ", "_").lower()
     out_path = os.path.join(test_output_dir, f"{safe_name}.log")
 
-    result = {
+    return {
         'name': name,
         'executor': executor,
         'command': command,
@@ -80,96 +219,345 @@ def run_test(test, base_output_dir, dry_run=False):
         'output': '',
         'duration_sec': 0,
         'output_file': out_path,
+        'output_bytes': 0,
+        'output_lines': 0,
+        'output_truncated': False,
+        'attempts': 0,
+        **{field: None for field in RESOURCE_FIELDS},
     }
 
+# Handles skipped tests and dry runs. Returns True when the result is
+# complete and the test must not be executed.
+def _finish_without_running(test, result, dry_run):
     if test.get('skip', False):
+        # Tests skipped by the scheduler (failed dependency, fail-fast) have
+        # a reason and were already logged; --rerun-failed runs them again
+        reason = test.get('__skip_reason__')
         result['status'] = 'SKIPPED'
-        result['output'] = 'Test skipped by configuration.'
-        log_line("SKIP", "Skipping Test", f"{name} (marked skip: true)")
-        return result
+        result['skip_reason'] = reason or 'configuration'
+        if reason:
+            result['output'] = f'Test skipped due to {reason}.'
+        else:
+            result['output'] = 'Test skipped by configuration.'
+            log_line("SKIP", "Skipping Test", f"{result['name']} (marked skip: true)")
+        return True
 
     if dry_run:
         result['status'] = 'DRY_RUN'
-        result['output'] = f"[DRY RUN] Would run: {executor} -> {command}"
-        with open(out_path, "w") as f:
+        result['output'] = f"[DRY RUN] Would run: {result['executor']} -> {result['command']}"
+        with open(result['output_file'], "w") as f:
             #f.write(result['output'])
             f.write(result['output'].rstrip() + "\n")
-        log_line("RUN", "Dry Run", name)
-        return result
+        log_line("RUN", "Dry Run", result['name'])
+        return True
+
+    return False
 
+# Tests that the preflight stage found unable to run (e.g. their database is not
+# reachable) are reported as ERROR with its reason. The reason was logged once
+# for all of them, so nothing is logged per test. Returns True when the test
+# must not run.
+def _preflight_failed(test, result):
+    reason = test.get('__preflight_error__')
+    if not reason:
+        return False
+    result['status'] = 'ERROR'
+    result['output'] = f"Preflight check failed: {reason}"
+    with open(result['output_file'], "w") as f:
+        f.write(result['output'] + "\n")
+    return True
+
+# Fingerprints the test when the fingerprint is used: `fingerprints` asks for
+# it in the result (the history compares the outcomes of runs with the same
+# fingerprint to find flaky tests), and with --reuse-results it is looked up
+# for an earlier PASS. Hashing the inputs of every test costs a few file reads,
+# so runs that use neither skip it. On a hit the stored log is copied to this
+# run's output file and the result is marked CACHED. Returns True when the test
+# must not run.
+def _reuse_cached_result(test, result, result_cache, fingerprints=False):
+    if result_cache is None and not fingerprints:
+        return False
+    fp = fingerprint(test)
+    result['fingerprint'] = fp
+    if result_cache is None:
+        return False
+    entry = result_cache.lookup(fp)
+    if entry is None:
+        return False
+
+    stored = entry['result']
+    shutil.copyfile(entry['log_path'], result['output_file'])
+    for key in ('output', 'output_bytes', 'output_lines', 'output_truncated'):
+        result[key] = stored.get(key, result[key])
+    result['status'] = 'CACHED'
+    result['cached_duration_sec'] = stored.get('duration_sec', 0)
+    log_line("SUCCESS", "Cached Result", f"{result['name']} (fingerprint {fp[:12]})")
+    return True
+
+# Returns the result cache for a test: None for tests with setup or teardown
+# fixtures, as what their setups export is only known once they ran, so neither
+# the fingerprint nor a stored result can account for it.
+def _result_cache_for(test, result_cache, fixtures):
+    if result_cache is not None and fixtures and fixtures.scope_keys(test):
+        return None
+    return result_cache
+
+# Keeps a passing result in the result cache for later runs.
+def _store_cached_result(result, result_cache):
+    if result_cache is None or result['status'] != 'PASS':
+        return
     try:
-        log_line("START", "Starting Test", name)
-        start = datetime.now()
-
-        if executor == "nzsql_file":
-            db = test.get("database")
-            sql_file = os.path.join(test_dir, test["sql_file"])
-            status, output = run_nzsql_file(db, sql_file, output_path=out_path)
-        elif executor == "bash":
-            full_command = os.path.join(test_dir, command)
-            status, output = run_bash(full_command)
-        else:
-            func = EXECUTOR_MAP.get(executor)
-            if func:
-                status, output = func(command)
-            else:
-                status, output = False, f"Unknown executor: {executor}"
+        result_cache.store(result['fingerprint'], result)
+    except OSError as e:
+        log_line("ERROR", "Result cache", str(e))
+
+# Returns the OutputExpectations of a test's `expect:` block, or None.
+# Raises ValueError when the block is invalid, which reports the test as ERROR.
+def _expectations(test):
+    if test.get('expect') is None:
+        return None
+    return OutputExpectations(test['expect'], os.path.dirname(test.get('__file__', '')))
 
-        duration = (datetime.now() - start).total_seconds()
+# Stores the executor outcome in the result.
+# The executor has already streamed the output to the log file through the
+# capture, so the result only keeps the bounded excerpt and the counters.
+# Executors that reap their child with os.wait4() also leave its CPU time,
+# max RSS, block I/O and context switches on the capture (see RESOURCE_FIELDS);
+# these stay None for pooled and batched nzsql sessions, which are shared by
+# several tests and not reaped per test.
+# A child that was killed after its timeout is reported as TIMEOUT.
+# With an `expect:` block, the test passes only if every expectation holds (the
+# block decides which exit codes are a success); the failed ones are listed in
+# result['expect_failures'].
+def _record_result(result, status, output, duration, capture, expectations=None):
+    result.update(capture.stats())
+    if capture.resource_usage:
+        result.update(capture.resource_usage)
+    failures = []
+    if capture.timed_out:
+        result['status'] = 'TIMEOUT'
+    elif expectations is not None:
+        failures = expectations.finish(status, capture.returncode)
+        result['expect_failures'] = failures
+        result['status'] = 'FAIL' if failures else 'PASS'
+    else:
         result['status'] = 'PASS' if status else 'FAIL'
-        result['output'] = output
-        result['duration_sec'] = duration
+    result['output'] = output
+    result['duration_sec'] = duration
 
-        #with open(out_path, "w") as f:
-        #    f.write(output)
-        with open(out_path, "w") as f:
-            f.write(output.rstrip() + "\n")
+    log_line("RUN", "Running Test", result['name'])
+    log_line("SUCCESS" if result['status'] == "PASS" else "FAIL", "Status", f"{result['status']:<6} ({duration:.3f}s)")
+    for failure in failures:
+        log_line("FAIL", "Expectation", failure)
+    log_line("INFO", "Output File", result['output_file'])
 
+# Groups adjacent tests of an executor with batch functions (e.g. nzsql_file
+# tests against the same database, which share one nzsql session, see
+# executors/nzsql_batch_executor.py) into batches of at most `max_size` tests.
+# Tests are adjacent when nothing else is listed between them, and the members
+# of a batch have the same value of the executor's `batch_key`. Each member is tagged with
+# `__batch__` = (batch id, position, size), and the returned `after` sets make
+# it wait for the previous member, pass or fail.
+# A batch never extends across a point that a dependency crosses backwards (a
+# test depending on a test listed after it), so the `after` edges cannot form
+# a cycle with the dependencies.
+def _plan_batches(tests, deps, max_size, fixtures=None):
+    after = [set() for _ in tests]
+    batches = []
+    batch, batch_group = [], None
+    # Highest index that a test seen so far depends on
+    furthest_dep = -1
+    for idx, test in enumerate(tests):
+        test.pop('__batch__', None)
+        group = _batch_group(test, fixtures)
+        if batch and (group is None or group != batch_group or furthest_dep >= idx or len(batch) >= max_size):
+            batches.append(batch)
+            batch = []
+        if group is not None:
+            batch_group = group
+            batch.append(idx)
+        furthest_dep = max(furthest_dep, max(deps[idx], default=-1))
+    batches.append(batch)
 
-        log_line("RUN", "Running Test", name)
-        log_line("SUCCESS" if result['status'] == "PASS" else "FAIL", "Status", f"{result['status']:<6} ({duration:.3f}s)")
-        log_line("INFO", "Output File", out_path)
+    batched = 0
+    for batch in batches:
+        if len(batch) < 2:
+            continue
+        batch_id = next(_batch_ids)
+        for position, idx in enumerate(batch):
+            tests[idx]['__batch__'] = (batch_id, position, len(batch))
+            if position:
+                after[idx].add(batch[position - 1])
+        batched += len(batch)
+    if batched:
+        log_line("INFO", "Batches", f"{batched} tests in {sum(len(b) > 1 for b in batches)} batches")
+    return after
 
-    except Exception as e:
-        result['status'] = 'ERROR'
-        result['output'] = str(e)
-        with open(out_path, "w") as f:
-            #f.write(str(e))
-            f.write(str(e).rstrip() + "\n")
+# Returns what a test must share with the other members of its batch,
+# (executor, value of the executor's batch_key, fixture scopes), or None if it
+# cannot be batched. Members share a session, and with it the environment of
+# the member that started it, so they must have the same setup fixtures.
+def _batch_group(test, fixtures=None):
+    executor = test.get('executor', 'bash')
+    caps = capabilities(executor)
+    if test.get('skip') or not caps or not caps['batch']:
+        return None
+    batch_key = executor_spec(executor).get('batch_key')
+    return (executor, test.get(batch_key) if batch_key else None,
+            fixtures.scope_keys(test) if fixtures else ())
 
-        log_line("ERROR", "Error", str(e))
+# With --archive-logs, moves the test's log, and the logs of its earlier
+# attempts, into the log store. A log that cannot be archived stays in place.
+def archive_test_logs(result, log_store):
+    if log_store is None:
+        return
+    base, ext = os.path.splitext(result['output_file'])
+    paths = [result['output_file']] + [f"{base}.attempt{n}{ext}" for n in range(1, result.get('attempts') or 0)]
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            log_store.archive(path)
+        except OSError as e:
+            log_line("ERROR", "Log store", f"{path}: {e}")
+            continue
+        if path == result['output_file']:
+            result['log_archived'] = True
 
-    return result
+# Marks the result as ERROR after an unexpected exception.
+def _record_error(result, e):
+    result['status'] = 'ERROR'
+    result['output'] = str(e)
+    with open(result['output_file'], "w") as f:
+        #f.write(str(e))
+        f.write(str(e).rstrip() + "\n")
 
-# This function runs a list of tests, executing each one in sequence.
-# It honors the `depends_on_previous` flag, skipping tests if the previous one failed
-# and logging the results. The results are returned along with the output directory
-# and run ID for further processing or reporting.
-def run_tests(tests, dry_run=False, output_dir_base="output", label="system"):
+    log_line("ERROR", "Error", str(e))
+
+# This function runs a list of tests on a bounded worker pool.
+# It honors the `depends_on_previous` and `depends_on` keys, skipping tests whose
+# dependencies did not pass, and logging the results. The results are returned in
+# the original test order along with the output directory and run ID for further
+# processing or reporting.
+def run_tests(tests, dry_run=False, output_dir_base="output", label="system", jobs=1, engine="thread",
+              result_cache=None, run_id=None, listeners=None, default_timeout=None, order="default",
+              max_failures=None, batch_size=None, log_store=None, fingerprints=False, history=None):
     """
-    Executes all test cases provided in the list, honoring `depends_on_previous`.
+    Executes all test cases provided in the list, honoring test dependencies.
 
     Args:
         tests (list): List of test dictionaries.
         dry_run (bool): If True, commands are not executed.
         output_dir_base (str): Base output folder for logs.
         label (str): Custom label used in output folder naming.
+        jobs (int): Maximum number of tests running at the same time.
+        engine (str): "thread" or "async", see ENGINES.
+        result_cache (ResultCache): Reuse earlier PASS results with the same
+            fingerprint instead of running the test again.
+        run_id (str): Run ID to use instead of the current timestamp, e.g. to
+            add results to the output directory of an existing run.
+        listeners (list): Objects notified of the run's progress. Each may implement
+            run_started(run_id, label, tests), test_started(test),
+            test_finished(result) and run_finished(results); test_started and
+            test_finished are called from the worker that runs the test, right
+            before it starts and as soon as its result is complete.
+        default_timeout (float): Timeout in seconds for tests without `timeout_sec`;
+            None lets them run forever.
+        order (str): Order of ready tests, see core.scheduler.ORDERS; "failed-first"
+            uses the statuses and "longest-first" the durations of earlier runs.
+        max_failures (int): Stop starting new tests after this many failures
+            (fail-fast); the remaining tests are reported as SKIPPED.
+        batch_size (int): Run up to this many adjacent tests of an executor with
+            batch functions as one batch, e.g. nzsql_file tests against the same
+            database in one nzsql session; None or 0 runs every test on its own.
+        log_store (LogStore): Move each test's log into this compressed,
+            content-addressed store once the test has finished.
+        fingerprints (bool): Record each test's fingerprint in its result, for
+            the history's flaky test detection and --rerun-failed.
+        history (HistoryStore): Where --order reads the earlier runs, instead
+            of the newest reports.
 
     Returns:
         tuple: (results list, full output directory path, run_id timestamp string)
+
+    Raises:
+        ValueError: If the test dependencies are invalid (unknown name or cycle),
+            the order is unknown, or a setup/teardown fixture is invalid.
     """
-    run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if not run_id:
+        run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
     base_output_dir = os.path.join(output_dir_base, f"{run_id}_{label}")
-    results = []
 
-    for idx, test in enumerate(tests):
-        # If depends_on_previous is set and previous test failed, mark this one as skipped
-        if test.get("depends_on_previous") and idx > 0:
-            prev_status = results[-1].get("status")
-            if prev_status != "PASS":
-                test["skip"] = True
-                log_line("SKIP", "Skipped due to failure in previous test", test["name"])
-        result = run_test(test, base_output_dir, dry_run=dry_run)
-        results.append(result)
+    deps = build_dependency_graph(tests)
+    priorities = order_priorities(
+        tests, deps, order,
+        statuses=load_last_statuses(history=history) if order == "failed-first" else None,
+        durations=load_durations(history=history) if order == "longest-first" else None
+    )
+    fixtures = None if dry_run else FixtureManager(tests, base_output_dir, default_timeout)
+    after = _plan_batches(tests, deps, batch_size, fixtures) if batch_size and not dry_run else None
+    notify_listeners(listeners, "run_started", run_id, label, tests)
+
+    def run_one(test):
+        with log_context(test=test_name(test)):
+            notify_listeners(listeners, "test_started", test)
+            try:
+                result = run_test(test, base_output_dir, dry_run=dry_run, result_cache=result_cache,
+                                  default_timeout=default_timeout, fixtures=fixtures, fingerprints=fingerprints)
+            finally:
+                if fixtures:
+                    fixtures.leave(test)
+            archive_test_logs(result, log_store)
+            notify_listeners(listeners, "test_finished", result)
+        return result
 
+    async def run_one_async(test):
+        task = asyncio.current_task()
+        # Task.get_name() needs Python 3.8
+        worker = getattr(task, "get_name", lambda: f"Task-{id(task):x}")()
+        with log_context(test=test_name(test), worker=worker):
+            notify_listeners(listeners, "test_started", test)
+            try:
+                result = await run_test_async(test, base_output_dir, dry_run=dry_run, result_cache=result_cache,
+                                              default_timeout=default_timeout, fixtures=fixtures,
+                                              fingerprints=fingerprints)
+            finally:
+                if fixtures:
+                    # Teardowns are blocking
+                    await asyncio.get_running_loop().run_in_executor(None, fixtures.leave, test)
+            if log_store is not None:
+                # Hashing and compressing must not hold up the event loop
+                await asyncio.get_running_loop().run_in_executor(None, archive_test_logs, result, log_store)
+            notify_listeners(listeners, "test_finished", result)
+        return result
+
+    try:
+        if engine == "async":
+            results = run_async_event_loop(run_graph_async(tests, deps, run_one_async, jobs=jobs, priorities=priorities,
+                                                           max_failures=max_failures, after=after))
+        else:
+            results = run_graph(tests, deps, run_one, jobs=jobs, priorities=priorities, max_failures=max_failures,
+                                after=after)
+    finally:
+        if fixtures:
+            fixtures.close()
+        # Pooled and batch sessions live for one run
+        close_executors()
+        if result_cache:
+            result_cache.evict()
+
+    notify_listeners(listeners, "run_finished", results)
     return results, base_output_dir, run_id
+
+# Calls `event` on every listener that implements it.
+def notify_listeners(listeners, event, *args):
+    for listener in listeners or ():
+        handler = getattr(listener, event, None)
+        if handler:
+            handler(*args)
+
+# Runs a coroutine on a fresh event loop and returns its result.
+# On Ctrl-C asyncio.run() cancels the coroutine, which kills and reaps every
+# child that is still running.
+def run_async_event_loop(coro):
+    return asyncio.run(coro)
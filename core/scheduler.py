@@ -0,0 +1,347 @@
+# File: core/scheduler.py
+# ---
+# This module turns a list of test definitions into a dependency graph (DAG)
+# and executes it on a bounded worker pool.
+# Dependencies come from two places in the YAML definitions:
+#   - `depends_on_previous: true` links a test to the test listed right before it
+#   - `depends_on: [names]` links a test to any other named test; a bare name is
+#     looked up in the same test directory, a "dir/name" is looked up as-is
+# A test only starts once every test it depends on has finished. If one of its
+# dependencies did not pass, the test is skipped, and so are its own dependents.
+# Results are always returned in the original test order, no matter in which
+# order the workers finished them, so reports stay deterministic.
+# Among the tests that are ready to run, the next one is picked by priority:
+#   - "default":       original order
+#   - "failed-first":  tests that failed in their last run, and the tests they
+#                      depend on, before everything else
+#   - "longest-first": longest remaining dependency chain first (historical
+#                      durations), which packs parallel workers best
+# With a failure limit (fail-fast), no new test is started once that many tests
+# have failed; the remaining tests are reported as SKIPPED.
+# Besides its dependencies, a test may also have to wait for tests it does not
+# depend on (`after`, e.g. the previous member of an nzsql batch): it starts
+# once they have finished, whatever their status.
+import asyncio
+import heapq
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from core.loader import test_name
+from utils.helpers import log_line
+
+# Statuses that satisfy a dependency (CACHED is a reused earlier PASS)
+PASSING_STATUSES = {"PASS", "CACHED"}
+
+# Statuses counted as failures by fail-fast and failed-first ordering
+FAILED_STATUSES = {"FAIL", "TIMEOUT", "ERROR"}
+
+ORDERS = ("default", "failed-first", "longest-first")
+
+# Assumed duration of a test that has no history yet, when no history exists at all
+DEFAULT_DURATION_SEC = 1.0
+
+
+# Resolves a `depends_on` entry to the index of the test it names.
+# Returns None when no test with that name was loaded.
+def _resolve_dependency(dep, test, by_name):
+    if "/" in dep:
+        return by_name.get(dep)
+    rel_dir = test_name(test).rsplit("/", 1)[0]
+    return by_name.get(f"{rel_dir}/{dep}")
+
+
+# Raises ValueError if the dependency graph contains a cycle.
+def _check_acyclic(tests, deps):
+    order = _topological_order(deps, _dependents(deps))
+    if len(order) != len(tests):
+        visited = set(order)
+        cycle = [test_name(tests[idx]) for idx in range(len(tests)) if idx not in visited]
+        raise ValueError(f"Dependency cycle between tests: {', '.join(cycle)}")
+
+
+def _dependents(deps):
+    dependents = [[] for _ in deps]
+    for idx, parents in enumerate(deps):
+        for parent in sorted(parents):
+            dependents[parent].append(idx)
+    return dependents
+
+
+def build_dependency_graph(tests):
+    """
+    Builds the dependency graph for a list of tests.
+
+    Args:
+        tests (list): List of test dictionaries, in their original order.
+
+    Returns:
+        list: One set per test holding the indices of the tests it depends on.
+
+    Raises:
+        ValueError: If a `depends_on` name is unknown or the graph has a cycle.
+    """
+    by_name = {}
+    for idx, test in enumerate(tests):
+        by_name.setdefault(test_name(test), idx)
+
+    deps = [set() for _ in tests]
+    for idx, test in enumerate(tests):
+        if test.get("depends_on_previous") and idx > 0:
+            deps[idx].add(idx - 1)
+
+        depends_on = test.get("depends_on") or []
+        if isinstance(depends_on, str):
+            depends_on = [depends_on]
+        for dep in depends_on:
+            target = _resolve_dependency(dep, test, by_name)
+            if target is None:
+                raise ValueError(f"{test_name(test)}: unknown dependency '{dep}'")
+            if target == idx:
+                raise ValueError(f"{test_name(test)}: test depends on itself")
+            deps[idx].add(target)
+
+    _check_acyclic(tests, deps)
+    return deps
+
+
+def connected_components(deps):
+    """
+    Groups tests that are linked by dependencies, in either direction.
+
+    Tests in different groups never wait on each other, so each group can be
+    run separately (e.g. by another worker) without breaking any dependency.
+
+    Args:
+        deps (list): Dependency graph from build_dependency_graph().
+
+    Returns:
+        list: Lists of test indices, each sorted, ordered by their first index.
+    """
+    parent = list(range(len(deps)))
+
+    def find(idx):
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+
+    for idx, parents in enumerate(deps):
+        for dep in parents:
+            parent[find(dep)] = find(idx)
+
+    groups = {}
+    for idx in range(len(deps)):
+        groups.setdefault(find(idx), []).append(idx)
+    return sorted(groups.values(), key=lambda group: group[0])
+
+
+def order_priorities(tests, deps, order="default", statuses=None, durations=None):
+    """
+    Computes the scheduling priority of every test; lower runs first.
+
+    Priorities are propagated along dependencies, so the tests an urgent test
+    depends on (e.g. the start of its `depends_on_previous` chain) are just as
+    urgent, and the dependencies themselves are still always honored.
+
+    Args:
+        tests (list): List of test dictionaries, in their original order.
+        deps (list): Dependency graph from build_dependency_graph().
+        order (str): One of ORDERS.
+        statuses (dict): Test name -> status of its last run, for "failed-first".
+        durations (dict): Test name -> historical duration, for "longest-first".
+
+    Returns:
+        list: One sortable priority per test.
+
+    Raises:
+        ValueError: If the order is unknown.
+    """
+    if order not in ORDERS:
+        raise ValueError(f"Unknown order '{order}', expected one of {', '.join(ORDERS)}")
+    if order == "default":
+        return list(range(len(tests)))
+
+    dependents = _dependents(deps)
+    # Dependents come later in the topological order, so a reverse pass sees
+    # every dependent of a test before the test itself
+    reverse_topo = _topological_order(deps, dependents)[::-1]
+
+    if order == "failed-first":
+        statuses = statuses or {}
+        urgent = [statuses.get(test_name(test)) in FAILED_STATUSES for test in tests]
+        for idx in reverse_topo:
+            urgent[idx] = urgent[idx] or any(urgent[child] for child in dependents[idx])
+        return [(0 if urgent[idx] else 1, idx) for idx in range(len(tests))]
+
+    durations = durations or {}
+    known = sorted(durations.values())
+    default = known[len(known) // 2] if known else DEFAULT_DURATION_SEC
+    chain = [0.0] * len(tests)
+    for idx in reverse_topo:
+        longest_child = max((chain[child] for child in dependents[idx]), default=0.0)
+        chain[idx] = durations.get(test_name(tests[idx]), default) + longest_child
+    return [(-chain[idx], idx) for idx in range(len(tests))]
+
+
+def _topological_order(deps, dependents):
+    waiting = [len(d) for d in deps]
+    ready = [idx for idx, count in enumerate(waiting) if count == 0]
+    order = []
+    while ready:
+        idx = ready.pop()
+        order.append(idx)
+        for child in dependents[idx]:
+            waiting[child] -= 1
+            if waiting[child] == 0:
+                ready.append(child)
+    return order
+
+
+# Tracks which tests are ready to run while the graph is executed.
+# Shared by the thread pool and the asyncio versions of the scheduler.
+class _GraphState:
+    def __init__(self, tests, deps, priorities=None, max_failures=None, after=None):
+        self.tests = tests
+        self.deps = deps
+        self.results = [None] * len(tests)
+        waits_for = [d | a for d, a in zip(deps, after)] if after else deps
+        self.waiting = [len(w) for w in waits_for]
+        self.dependents = _dependents(waits_for)
+        # Ready tests are picked lowest priority first; by default the priority
+        # is the index, so a single worker runs the tests in exactly the order
+        # they were loaded.
+        self.priorities = priorities or list(range(len(tests)))
+        self.ready = [(self.priorities[idx], idx) for idx, count in enumerate(self.waiting) if count == 0]
+        heapq.heapify(self.ready)
+        self.max_failures = max_failures
+        self.failures = 0
+
+    def next_ready(self):
+        return heapq.heappop(self.ready)[1]
+
+    def finish(self, idx, result):
+        self.results[idx] = result
+        if result["status"] in FAILED_STATUSES:
+            self.failures += 1
+        for child in self.dependents[idx]:
+            self.waiting[child] -= 1
+            if self.waiting[child] == 0:
+                heapq.heappush(self.ready, (self.priorities[child], child))
+
+    # If a dependency did not pass, or the failure limit was reached, the test
+    # is marked as skipped so that running it only records the SKIPPED result,
+    # with the reason in `__skip_reason__`.
+    def blocked(self, idx):
+        if self.max_failures and self.failures >= self.max_failures:
+            test = self.tests[idx]
+            test["skip"] = True
+            test["__skip_reason__"] = "fail-fast"
+            log_line("SKIP", "Skipped by fail-fast", f"{test_name(test)} ({self.failures} failures)")
+            return True
+
+        deps, results = self.deps[idx], self.results
+        failed = [d for d in sorted(deps) if results[d]["status"] not in PASSING_STATUSES]
+        if not failed:
+            return False
+        test = self.tests[idx]
+        test["skip"] = True
+        test["__skip_reason__"] = "failed dependency"
+        if failed == [idx - 1] and test.get("depends_on_previous"):
+            log_line("SKIP", "Skipped due to failure in previous test", test_name(test))
+        else:
+            log_line("SKIP", "Skipped due to failed dependency", f"{test_name(test)} <- {results[failed[0]]['name']}")
+        return True
+
+
+def run_graph(tests, deps, run_one, jobs=1, priorities=None, max_failures=None, after=None):
+    """
+    Runs every test once all of its dependencies have finished.
+
+    Args:
+        tests (list): List of test dictionaries, in their original order.
+        deps (list): Dependency graph from build_dependency_graph().
+        run_one (callable): Called with a test dictionary, returns its result.
+        jobs (int): Maximum number of tests running at the same time.
+        priorities (list): Priority of each test, see order_priorities().
+        max_failures (int): Skip the tests not started yet once this many
+            tests have failed; None or 0 runs everything.
+        after (list): One set per test holding the indices of tests that must
+            finish before it starts, whether they pass or not. Together with
+            deps they must not form a cycle.
+
+    Returns:
+        list: Results in the original test order.
+    """
+    state = _GraphState(tests, deps, priorities, max_failures, after)
+
+    if jobs <= 1:
+        while state.ready:
+            idx = state.next_ready()
+            state.blocked(idx)
+            state.finish(idx, run_one(tests[idx]))
+        return state.results
+
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while state.ready or in_flight:
+            while state.ready and len(in_flight) < jobs:
+                idx = state.next_ready()
+                if state.blocked(idx):
+                    state.finish(idx, run_one(tests[idx]))
+                    continue
+                in_flight[pool.submit(run_one, tests[idx])] = idx
+
+            if not in_flight:
+                continue
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                state.finish(in_flight.pop(future), future.result())
+
+    return state.results
+
+
+async def run_graph_async(tests, deps, run_one, jobs=1, priorities=None, max_failures=None, after=None):
+    """
+    Asyncio version of run_graph(): every test runs as a task on the
+    current event loop, with at most `jobs` tasks in flight.
+
+    Args:
+        tests (list): List of test dictionaries, in their original order.
+        deps (list): Dependency graph from build_dependency_graph().
+        run_one (callable): Coroutine function called with a test dictionary,
+            returns its result.
+        jobs (int): Maximum number of tests running at the same time.
+        priorities (list): Priority of each test, see order_priorities().
+        max_failures (int): Skip the tests not started yet once this many
+            tests have failed; None or 0 runs everything.
+        after (list): One set per test holding the indices of tests that must
+            finish before it starts, whether they pass or not. Together with
+            deps they must not form a cycle.
+
+    Returns:
+        list: Results in the original test order.
+    """
+    state = _GraphState(tests, deps, priorities, max_failures, after)
+    jobs = max(jobs, 1)
+    in_flight = {}
+    try:
+        while state.ready or in_flight:
+            while state.ready and len(in_flight) < jobs:
+                idx = state.next_ready()
+                if state.blocked(idx):
+                    state.finish(idx, await run_one(tests[idx]))
+                    continue
+                in_flight[asyncio.ensure_future(run_one(tests[idx]))] = idx
+
+            if not in_flight:
+                continue
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                state.finish(in_flight.pop(task), task.result())
+    finally:
+        # On cancellation (e.g. Ctrl-C), cancel the running tests and wait
+        # for them so their child processes are killed and reaped.
+        for task in in_flight:
+            task.cancel()
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+    return state.results
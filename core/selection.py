@@ -0,0 +1,214 @@
+# File: core/selection.py
+# ---
+# This module selects the tests of a run without loading the whole test tree.
+# It keeps a persistent selection index (.nztest_cache/index.pickle) with, for
+# every YAML file, its stat key and a few fields of each test in it: name, tags,
+# executor and dependencies. Selecting tests only stats the YAML files to find
+# the ones that changed (those are parsed again and re-indexed); the filters are
+# then resolved on the index, and only the YAML files holding selected tests are
+# loaded.
+# Filters:
+#   - tags: tests having at least one of the tags
+#   - executors: tests run by one of the executors
+#   - name_glob: shell patterns matched against the test name ("dir/name"); a
+#     pattern without "/" is matched against the short name
+#   - changed_since: tests whose YAML file, or any file in the YAML file's
+#     directory tree, changed since a git ref (committed, staged, unstaged or
+#     untracked)
+#   - names: exact test names, e.g. the failed tests of an earlier report
+#     (--rerun-failed)
+# The dependencies of selected tests (`depends_on`, `depends_on_previous`) are
+# always selected with them, so a filtered run never fails on a missing test.
+import fnmatch
+import os
+import pickle
+import subprocess
+from core.loader import find_yaml_files, load_documents, test_name, tests_root
+
+INDEX_PATH = os.path.join(".nztest_cache", "index.pickle")
+INDEX_VERSION = 1
+
+# Each test is indexed as a tuple (full name, tags, executor, depends_on,
+# depends_on_previous): tuples load from the pickle several times faster
+# than one dict per test. Names depend on the tests root, so the index is
+# rebuilt when the root changes.
+
+# Up to this many selected files are parsed directly: reading the whole
+# parsed-test cache costs more than parsing a few small files
+DIRECT_PARSE_MAX_FILES = 16
+
+
+def select_tests(test_dirs, tags=None, executors=None, name_glob=None, changed_since=None, use_cache=True,
+                 names=None):
+    """
+    Loads the tests matching every given filter, plus their dependencies.
+
+    Args:
+        test_dirs (list): Directories to walk for YAML files.
+        tags (set): Keep tests with at least one of these tags; None or empty keeps all.
+        executors (set): Keep tests run by one of these executors.
+        name_glob (list): Keep tests whose name matches one of these patterns.
+        changed_since (str): Keep tests affected by changes since this git ref.
+        use_cache (bool): Use the selection index and the parsed-test cache.
+        names (set): Keep only tests with these full names (dir/name), e.g. the
+            failures of an earlier report.
+
+    Returns:
+        tuple: (tests list in load order, number of tests added as dependencies)
+
+    Raises:
+        ValueError: If changed_since is not a valid git ref.
+    """
+    paths = [path for d in test_dirs for path in find_yaml_files(d)]
+    index = _refresh_index(paths, use_cache)
+
+    flat = [(path, i, meta) for path in paths for i, meta in enumerate(index[path]["tests"])]
+    changed_dirs = _changed_dirs(_changed_files(changed_since)) if changed_since else None
+
+    selected = set()
+    for pos, (path, _, (full_name, test_tags, executor, _, _)) in enumerate(flat):
+        if tags and not tags.intersection(test_tags):
+            continue
+        if executors and executor not in executors:
+            continue
+        if name_glob and not _matches_name(full_name, name_glob):
+            continue
+        if names is not None and full_name not in names:
+            continue
+        if changed_dirs is not None and os.path.dirname(os.path.abspath(path)) not in changed_dirs:
+            continue
+        selected.add(pos)
+
+    matched = len(selected)
+    _add_dependencies(flat, selected)
+
+    wanted = sorted(selected)
+    files = sorted({flat[pos][0] for pos in wanted})
+    docs = load_documents(files, use_cache=use_cache and len(files) > DIRECT_PARSE_MAX_FILES)
+    tests = []
+    for pos in wanted:
+        path, i, _ = flat[pos]
+        test = dict(docs[path]["tests"][i])
+        test["__file__"] = path
+        tests.append(test)
+    return tests, len(tests) - matched
+
+
+def _matches_name(full_name, patterns):
+    short_name = full_name.rsplit("/", 1)[-1]
+    for pattern in patterns:
+        if fnmatch.fnmatchcase(full_name if "/" in pattern else short_name, pattern):
+            return True
+    return False
+
+
+# Returns every directory that contains a changed file, at any depth: a test is
+# affected when the directory of its YAML file is one of them.
+def _changed_dirs(changed):
+    dirs = set()
+    for path in changed:
+        parent = os.path.dirname(path)
+        while parent not in dirs and parent != os.path.dirname(parent):
+            dirs.add(parent)
+            parent = os.path.dirname(parent)
+    return dirs
+
+
+# Adds the tests that selected tests depend on, transitively, with the same
+# resolution rules as the scheduler.
+def _add_dependencies(flat, selected):
+    by_name = {}
+    for pos, (_, _, (full_name, _, _, _, _)) in enumerate(flat):
+        by_name.setdefault(full_name, pos)
+
+    todo = list(selected)
+    while todo:
+        pos = todo.pop()
+        full_name, _, _, depends_on, depends_on_previous = flat[pos][2]
+        targets = []
+        if depends_on_previous and pos > 0:
+            targets.append(pos - 1)
+        rel_dir = full_name.rsplit("/", 1)[0]
+        for dep in depends_on:
+            target = by_name.get(dep if "/" in dep else f"{rel_dir}/{dep}")
+            # Unknown names are reported by the scheduler
+            if target is not None:
+                targets.append(target)
+        for target in targets:
+            if target not in selected:
+                selected.add(target)
+                todo.append(target)
+
+
+def _changed_files(ref):
+    """Returns the absolute paths of files changed since a git ref, untracked files included."""
+    try:
+        top = _git("rev-parse", "--show-toplevel").strip()
+        names = _git("diff", "--name-only", ref, "--").splitlines()
+        names += _git("ls-files", "--others", "--exclude-standard", "--full-name", cwd=top).splitlines()
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"Cannot list files changed since '{ref}': {e.stderr.strip() or e}")
+    except OSError as e:
+        raise ValueError(f"Cannot list files changed since '{ref}': {e}")
+    return {os.path.join(top, name) for name in names if name}
+
+
+def _git(*args, cwd=None):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout
+
+
+# Returns the index entry of every path, re-indexing the files that changed.
+def _refresh_index(paths, use_cache):
+    index = _read_index() if use_cache else {}
+    stale = []
+    for path in paths:
+        st = os.stat(path)
+        entry = index.get(path)
+        if not entry or entry["mtime_ns"] != st.st_mtime_ns or entry["size"] != st.st_size:
+            stale.append((path, st))
+
+    if stale:
+        docs = load_documents([path for path, _ in stale], use_cache=use_cache)
+        for path, st in stale:
+            index[path] = {
+                "mtime_ns": st.st_mtime_ns,
+                "size": st.st_size,
+                "tests": [_index_test(test, path) for test in docs[path].get("tests", [])],
+            }
+        if use_cache:
+            _write_index(index, set(paths))
+    return index
+
+
+# Index tuple of one test
+def _index_test(test, path):
+    tags = test.get("tags") or []
+    depends_on = test.get("depends_on") or []
+    return (
+        test_name({"name": test.get("name", "Unnamed Test"), "__file__": path}),
+        (tags,) if isinstance(tags, str) else tuple(tags),
+        test.get("executor", "bash"),
+        (depends_on,) if isinstance(depends_on, str) else tuple(depends_on),
+        bool(test.get("depends_on_previous")),
+    )
+
+
+def _read_index():
+    try:
+        with open(INDEX_PATH, "rb") as f:
+            index = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        return {}
+    if index.get("version") != INDEX_VERSION or index.get("tests_root") != tests_root():
+        return {}
+    return index["entries"]
+
+
+# Entries of deleted files are dropped whenever the index is written.
+def _write_index(index, walked):
+    entries = {path: entry for path, entry in index.items() if path in walked or os.path.exists(path)}
+    os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
+    tmp_path = f"{INDEX_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"version": INDEX_VERSION, "tests_root": tests_root(), "entries": entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, INDEX_PATH)
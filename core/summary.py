@@ -1,12 +1,18 @@
 # File: core/summary.py
 # ---
 # This module contains functions to print a summary of test results.
-# It aggregates the results by status (PASS, FAIL, ERROR, DRY_RUN,
-# SKIPPED and prints a formatted summary to the console.
+# It aggregates the results by status (PASS, FAIL, TIMEOUT, ERROR, DRY_RUN,
+# SKIPPED, CACHED) and prints a formatted summary to the console.
 # It also generates a summary file in the output directory.
 # The summary includes the count of each status and the total number of tests run.
 # Additionally, it lists the generated report files and their locations.
-from utils.helpers import log_line, USE_EMOJIS
+from utils.helpers import log_line, log_text, USE_EMOJIS
+
+# Statuses listed in the summary, in display order
+# (CACHED results were reused from an earlier PASS by --reuse-results,
+# TIMEOUT tests were killed after their timeout_sec). Flaky tests, found
+# in the history or by --rerun-failed, are listed after the counts.
+STATUSES = ["PASS", "CACHED", "FAIL", "TIMEOUT", "ERROR", "DRY_RUN", "SKIPPED"]
 
 # Function to print a summary of test results
 # It aggregates results by status and prints a formatted summary.
@@ -14,24 +20,38 @@ from utils.helpers import log_line, USE_EMOJIS
 # The summary includes counts of each status and the total number of tests run.
 # Additionally, it lists the generated report files and their locations.
 def print_summary(results, label, output_dir, run_id):
-    summary = {"PASS": 0, "FAIL": 0, "ERROR": 0, "DRY_RUN": 0, "SKIPPED": 0}
+    # results may be a stream read back from the report, so it is only iterated once
+    summary = {status: 0 for status in STATUSES}
+    total = 0
+    flaky = []
     for r in results:
         summary[r["status"]] = summary.get(r["status"], 0) + 1
+        total += 1
+        if r.get("flaky"):
+            flaky.append(r["name"])
 
-    print()
+    log_text()
     log_line("", "Test Summary")
-    for status in ["PASS", "FAIL", "ERROR", "DRY_RUN", "SKIPPED"]:
+    for status in STATUSES:
         log_line("", f"{status:<10}", summary.get(status, 0), indent=2)
-    log_line("", f"{'TOTAL':<10}", len(results), indent=2)
+    log_line("", f"{'TOTAL':<10}", total, indent=2)
+    if flaky:
+        log_line("", f"{'FLAKY':<10}", len(flaky), indent=2)
+        for name in flaky:
+            log_line("", "", name, indent=4)
 
     summary_path = f"{output_dir}/{run_id}_{label}_summary.txt"
     with open(summary_path, "w") as f:
         f.write("Test Summary\n")
-        for status in ["PASS", "FAIL", "ERROR", "DRY_RUN", "SKIPPED"]:
+        for status in STATUSES:
             f.write(f"{status:<8}: {summary.get(status, 0)}\n")
-        f.write(f"{'TOTAL':<8}: {len(results)}\n")
+        f.write(f"{'TOTAL':<8}: {total}\n")
+        if flaky:
+            f.write(f"{'FLAKY':<8}: {len(flaky)}\n")
+            for name in flaky:
+                f.write(f"  {name}\n")
 
-    print()
+    log_text()
     if USE_EMOJIS:
         log_line("🗂️", "Generated Files")
         log_line("📄", "JSON Report", f"reports/{run_id}_{label}.json")
@@ -0,0 +1,127 @@
+# File: executors/async_process.py
+# ---
+# This module provides the asyncio subprocess helper shared by the async executors.
+# A child process is started by spawn_process() (see executors/process.py), its
+# stdout and stderr are streamed in chunks without blocking the event loop (to
+# an OutputCapture when one is given), and it is killed when the per-test
+# timeout expires or when the awaiting task is cancelled, so no child is ever
+# left running behind the test runner. Each child runs in its own session so
+# that the kill reaches its whole process tree.
+# The children are not started through asyncio.create_subprocess_exec/shell:
+# asyncio's child watcher reaps them with waitpid(), which throws their
+# resource usage away. Instead the helper waits for the child to exit and reaps
+# it with os.wait4() like the thread engine, so async results get the same
+# resource usage fields. On Linux the exit is awaited on a pidfd (no helper
+# thread per child); elsewhere the child is polled.
+# In fast-spawn mode, shell commands without shell syntax are started directly
+# with os.posix_spawnp() instead of through /bin/sh, as in the thread engine.
+import asyncio
+import os
+from executors.capture import CHUNK_SIZE
+from executors.process import close_output, kill_group, spawn_process, wait_process
+
+# Longest pause between two checks of a child that has closed its output, on
+# platforms without pidfds
+MAX_POLL_SEC = 0.05
+
+
+async def run_process_async(args, shell=False, env=None, timeout=None, capture=None):
+    """
+    Runs a child process on the current event loop, streaming its output.
+
+    Args:
+        args (str or list): Command line string when shell is True, argument list otherwise.
+        shell (bool): Run the command through /bin/sh.
+        env (dict): Environment for the child; defaults to the current environment.
+        timeout (float): Seconds to wait before the child is killed; None waits forever.
+        capture (OutputCapture): Optional sink that receives the output as it arrives.
+
+    Returns:
+        tuple: (returncode, output, timed_out); returncode is None on timeout.
+            output is the capture excerpt when a capture is given.
+    """
+    chunks = []
+    sink = capture.write if capture else chunks.append
+
+    pid, fd, proc = spawn_process(args, shell, env)
+    timed_out = False
+    try:
+        returncode, usage = await asyncio.wait_for(_stream(pid, fd, proc, sink), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        kill_group(pid)
+        returncode, usage = await _wait(pid, proc)
+    except BaseException:
+        # The task was cancelled (e.g. Ctrl-C), or the capture failed: the
+        # child is killed, and reaped before this returns to the event loop
+        kill_group(pid)
+        wait_process(pid, proc)
+        raise
+    finally:
+        close_output(fd, proc)
+
+    if capture:
+        capture.resource_usage = usage
+        capture.returncode = returncode
+    if timed_out:
+        returncode = None
+        sink(f"\nTimed out after {timeout}s\n".encode())
+        if capture:
+            capture.timed_out = True
+
+    if capture:
+        return returncode, capture.excerpt(), timed_out
+    return returncode, b"".join(chunks).decode(errors="replace"), timed_out
+
+
+# Feeds the child's output to the sink chunk by chunk until every process
+# holding the pipe has closed it, then waits for the child to exit.
+# Returns (returncode, resource usage dict or None).
+async def _stream(pid, fd, proc, sink):
+    loop = asyncio.get_running_loop()
+    os.set_blocking(fd, False)
+    readable = asyncio.Event()
+    loop.add_reader(fd, readable.set)
+    try:
+        while True:
+            try:
+                chunk = os.read(fd, CHUNK_SIZE)
+            except BlockingIOError:
+                readable.clear()
+                await readable.wait()
+                continue
+            if not chunk:
+                break
+            sink(chunk)
+    finally:
+        loop.remove_reader(fd)
+    return await _wait(pid, proc)
+
+
+# Waits for the child to exit without blocking the event loop, then reaps it.
+# A pidfd (Linux 5.3+, Python 3.9+) becomes readable when the child exits;
+# without one the child is polled with a growing pause.
+# Returns (returncode, resource usage dict or None).
+async def _wait(pid, proc):
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    if pidfd is not None:
+        loop = asyncio.get_running_loop()
+        exited = asyncio.Event()
+        loop.add_reader(pidfd, exited.set)
+        try:
+            await exited.wait()
+        finally:
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+        return wait_process(pid, proc)
+
+    pause = 0.001
+    while True:
+        waited = wait_process(pid, proc, block=False)
+        if waited is not None:
+            return waited
+        await asyncio.sleep(pause)
+        pause = min(pause * 2, MAX_POLL_SEC)
@@ -1,17 +1,24 @@
 # File: executors/bash_executor.py
 # ---
 # This module provides a function to run bash commands using subprocess.
-import subprocess
+# When an OutputCapture is passed, the output is streamed to the test log file
+# and the returned output is only a bounded excerpt. `env` holds variables added
+# to the environment of the command (e.g. exported by setup fixtures).
+from executors.async_process import run_process_async
+from executors.process import child_env, run_process
 
-def run_bash(command):
+def run_bash(command, timeout=None, capture=None, env=None):
     try:
-        result = subprocess.run(
-            command, shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            check=False,
-            text=True
-        )
-        return result.returncode == 0, result.stdout
+        returncode, output, timed_out = run_process(command, shell=True, env=child_env(env) if env else None, timeout=timeout, capture=capture)
+        return returncode == 0, output
+    except Exception as e:
+        return False, f"Error running bash command: {str(e)}"
+
+
+# Asyncio version of run_bash(), killed after `timeout` seconds.
+async def run_bash_async(command, timeout=None, capture=None, env=None):
+    try:
+        returncode, output, timed_out = await run_process_async(command, shell=True, env=child_env(env) if env else None, timeout=timeout, capture=capture)
+        return returncode == 0, output
     except Exception as e:
         return False, f"Error running bash command: {str(e)}"
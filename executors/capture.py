@@ -0,0 +1,98 @@
+# File: executors/capture.py
+# ---
+# This module provides OutputCapture, which streams a child's output to the
+# per-test log file while it is produced.
+# Only a bounded excerpt (the first and last few KiB) is kept in memory, together
+# with byte and line counts, so the memory used per test stays the same however
+# large the output is. The excerpt is what ends up in result['output'] and in the
+# reports; the full output is only ever in the log file.
+# An observer (e.g. the test's OutputExpectations) can be given to see every
+# chunk as it is written.
+import os
+
+# Bytes kept from the start and from the end of the output for the excerpt
+EXCERPT_HEAD_BYTES = 16 * 1024
+EXCERPT_TAIL_BYTES = 16 * 1024
+
+# Size of the chunks read from a child's stdout pipe
+CHUNK_SIZE = 64 * 1024
+
+
+class OutputCapture:
+    def __init__(self, path, head_bytes=EXCERPT_HEAD_BYTES, tail_bytes=EXCERPT_TAIL_BYTES, observer=None):
+        self.path = path
+        self.observer = observer
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.bytes_written = 0
+        self.newlines = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._last_byte = b""
+        # Set by the executor to the child's resource usage, when it was measured
+        self.resource_usage = None
+        # Set by the executor when the child was killed after its timeout
+        self.timed_out = False
+        # Set by the executor to the child's exit status, when it exited
+        self.returncode = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "wb")
+
+    def write(self, chunk):
+        """Appends a chunk of raw output (bytes) to the log file and the counters."""
+        if not chunk:
+            return
+        self._file.write(chunk)
+        self.bytes_written += len(chunk)
+        self.newlines += chunk.count(b"\n")
+        self._last_byte = chunk[-1:]
+        if self.observer is not None:
+            self.observer.feed(chunk)
+
+        if len(self._head) < self.head_bytes:
+            self._head += chunk[:self.head_bytes - len(self._head)]
+        if len(chunk) >= self.tail_bytes:
+            self._tail = bytearray(chunk[-self.tail_bytes:])
+        else:
+            self._tail += chunk
+            del self._tail[:-self.tail_bytes]
+
+    def write_text(self, text):
+        """Appends a message (str), e.g. an executor error, to the output."""
+        self.write(text.encode())
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    @property
+    def lines(self):
+        # A last line without a trailing newline still counts as a line
+        if self.bytes_written and self._last_byte != b"\n":
+            return self.newlines + 1
+        return self.newlines
+
+    @property
+    def truncated(self):
+        return self.bytes_written > self.head_bytes + self.tail_bytes
+
+    def excerpt(self):
+        """Returns the output as text, with the middle cut out if it was too large."""
+        total = self.bytes_written
+        if total <= self.head_bytes:
+            data = bytes(self._head)
+        elif not self.truncated:
+            data = bytes(self._head) + bytes(self._tail[-(total - self.head_bytes):])
+        else:
+            omitted = total - len(self._head) - len(self._tail)
+            marker = f"\n... [{omitted} bytes omitted, full output in {self.path}] ...\n".encode()
+            data = bytes(self._head) + marker + bytes(self._tail)
+        return data.decode(errors="replace")
+
+    def stats(self):
+        """Returns the output counters stored in the test result."""
+        return {
+            'output_bytes': self.bytes_written,
+            'output_lines': self.lines,
+            'output_truncated': self.truncated,
+        }
@@ -2,20 +2,26 @@
 # ---
 # This module provides a function to run nz commands using subprocess.
 # It handles the execution of nz commands, capturing their output and return status.
-import subprocess
-import os
+# When an OutputCapture is passed, the output is streamed to the test log file
+# and the returned output is only a bounded excerpt. `env` holds variables added
+# to the environment of the command (e.g. exported by setup fixtures).
+from executors.async_process import run_process_async
+from executors.process import child_env, run_process
 
-def run_nz(command):
-    env = os.environ.copy()
+def run_nz(command, timeout=None, capture=None, env=None):
+    env = child_env(env)
     try:
-        result = subprocess.run(
-            command, shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            env=env,
-            check=False,
-            text=True
-        )
-        return result.returncode == 0, result.stdout
+        returncode, output, timed_out = run_process(command, shell=True, env=env, timeout=timeout, capture=capture)
+        return returncode == 0, output
+    except Exception as e:
+        return False, f"Error running nz command: {str(e)}"
+
+
+# Asyncio version of run_nz(), killed after `timeout` seconds.
+async def run_nz_async(command, timeout=None, capture=None, env=None):
+    env = child_env(env)
+    try:
+        returncode, output, timed_out = await run_process_async(command, shell=True, env=env, timeout=timeout, capture=capture)
+        return returncode == 0, output
     except Exception as e:
         return False, f"Error running nz command: {str(e)}"
@@ -0,0 +1,82 @@
+# File: executors/nzsql_batch_executor.py
+# ---
+# This module runs batches of `nzsql_file` tests in one nzsql session.
+# The runner groups adjacent `nzsql_file` tests against the same database into
+# a batch (see core/runner.py) and runs its members one after the other. The
+# first member starts an `nzsql -d <database>` session, every member runs its
+# SQL file in it with `\i <file>`, and the session is handed on to the next
+# member. Each file is followed by an `\echo` sentinel (see NzsqlSession), so
+# each test still gets its own status, output, log file and duration.
+# A member that fails, dies or times out closes the session, and the next
+# member starts a fresh one: a failure never leaves an aborted transaction or
+# unread output behind, and never hides the results of the other members.
+# The session is started with the `env` of the member that starts it; the
+# runner only batches tests that share the same setup fixtures.
+import asyncio
+import functools
+import threading
+from executors.nzsql_pool_executor import NzsqlSession
+from executors.process import child_env
+
+# Batch id -> session handed on to the next member of the batch
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def run_nzsql_batched(database, sql_file, batch, capture=None, timeout=None, env=None):
+    """
+    Runs one member of an nzsql_file batch.
+
+    Args:
+        database (str): Database of the batch.
+        sql_file (str): SQL file of the test.
+        batch (tuple): (batch id, position in the batch, batch size).
+        capture (OutputCapture): Sink that receives the output as it arrives.
+        timeout (float): Seconds the file may run; None waits forever.
+        env (dict): Variables added to the environment of a new session.
+
+    Returns:
+        tuple: (success, output)
+    """
+    batch_id, position, size = batch
+    with _sessions_lock:
+        session = _sessions.pop(batch_id, None)
+
+    if session is None:
+        try:
+            session = NzsqlSession(database, env=child_env(env) if env else None)
+        except Exception as e:
+            return False, f"Error starting nzsql session: {str(e)}"
+
+    success = False
+    try:
+        success, output = session.run(f"\\i {sql_file}", capture=capture, timeout=timeout)
+        return success, output
+    except Exception as e:
+        session.broken = True
+        return False, f"Error executing nzsql script: {str(e)}"
+    finally:
+        if success and position < size - 1:
+            with _sessions_lock:
+                _sessions[batch_id] = session
+        else:
+            session.close()
+
+
+# Asyncio version of run_nzsql_batched(). Sessions are blocking pipes, so the
+# file runs on the event loop's default thread pool.
+async def run_nzsql_batched_async(database, sql_file, batch, capture=None, timeout=None, env=None):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None,
+        functools.partial(run_nzsql_batched, database, sql_file, batch, capture=capture, timeout=timeout, env=env)
+    )
+
+
+def close_batch_sessions():
+    """Closes the sessions left open by batches whose last members did not run (e.g. skipped)."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
@@ -2,26 +2,39 @@
 # ---
 # This module provides a function to run nzsql commands using subprocess.
 # It handles the execution of nzsql commands, capturing their output and return status.
-import subprocess
-import os
+# When an OutputCapture is passed, the output is streamed to the test log file
+# and the returned output is only a bounded excerpt. `env` holds variables added
+# to the environment of the command (e.g. exported by setup fixtures).
+# The command runs against the test's `database`, or NZ_DATABASE without one.
+from executors.async_process import run_process_async
+from executors.process import child_env, run_process
 
-def run_nzsql(command):
-    env = os.environ.copy()
+def run_nzsql(command, timeout=None, capture=None, env=None, database=None):
+    env = child_env(env)
     nzsql_cmd = [
         "nzsql",
-        "-d", env.get("NZ_DATABASE", ""),
+        "-d", database or env.get("NZ_DATABASE", ""),
         "-c", command
     ]
 
     try:
-        result = subprocess.run(
-            nzsql_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            env=env,
-            check=False,
-            text=True
-        )
-        return result.returncode == 0, result.stdout
+        returncode, output, timed_out = run_process(nzsql_cmd, env=env, timeout=timeout, capture=capture)
+        return returncode == 0, output
+    except Exception as e:
+        return False, f"Error executing nzsql: {str(e)}"
+
+
+# Asyncio version of run_nzsql(), killed after `timeout` seconds.
+async def run_nzsql_async(command, timeout=None, capture=None, env=None, database=None):
+    env = child_env(env)
+    nzsql_cmd = [
+        "nzsql",
+        "-d", database or env.get("NZ_DATABASE", ""),
+        "-c", command
+    ]
+
+    try:
+        returncode, output, timed_out = await run_process_async(nzsql_cmd, env=env, timeout=timeout, capture=capture)
+        return returncode == 0, output
     except Exception as e:
         return False, f"Error executing nzsql: {str(e)}"
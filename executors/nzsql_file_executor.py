@@ -2,12 +2,16 @@
 # ---
 # This module provides a function to run nzsql files using subprocess.
 # It handles the execution of nzsql files, capturing their output and return status.
+# When an OutputCapture is passed, the output is streamed to the test log file
+# and the returned output is only a bounded excerpt. `env` holds variables added
+# to the environment of the command (e.g. exported by setup fixtures).
 
-import subprocess
 import os
+from executors.async_process import run_process_async
+from executors.process import child_env, run_process
 
-def run_nzsql_file(database, sql_file, output_path=None):
-    env = os.environ.copy()
+def run_nzsql_file(database, sql_file, output_path=None, timeout=None, capture=None, env=None):
+    env = child_env(env)
     nzsql_cmd = [
         "nzsql",
         "-d", database,
@@ -15,23 +19,39 @@ def run_nzsql_file(database, sql_file, output_path=None):
     ]
 
     try:
-        result = subprocess.run(
-            nzsql_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            env=env,
-            check=False,
-            text=True
-        )
-        output = result.stdout.strip()
-
-        # Write to output file if requested
-        if output_path:
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            with open(output_path, "w") as f:
-                f.write(output)
-
-        success = result.returncode == 0
+        returncode, output, timed_out = run_process(nzsql_cmd, env=env, timeout=timeout, capture=capture)
+        output = output.strip()
+        _write_output(output, output_path, capture)
+
+        success = returncode == 0
         return success, output
     except Exception as e:
         return False, f"Error executing nzsql script: {str(e)}"
+
+
+# Asyncio version of run_nzsql_file(), killed after `timeout` seconds.
+async def run_nzsql_file_async(database, sql_file, output_path=None, timeout=None, capture=None, env=None):
+    env = child_env(env)
+    nzsql_cmd = [
+        "nzsql",
+        "-d", database,
+        "-f", sql_file,
+    ]
+
+    try:
+        returncode, output, timed_out = await run_process_async(nzsql_cmd, env=env, timeout=timeout, capture=capture)
+        output = output.strip()
+        _write_output(output, output_path, capture)
+
+        return returncode == 0, output
+    except Exception as e:
+        return False, f"Error executing nzsql script: {str(e)}"
+
+
+# Write to output file if requested
+# (a capture has already streamed the output to its own log file)
+def _write_output(output, output_path, capture):
+    if output_path and capture is None:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, "w") as f:
+            f.write(output)
@@ -0,0 +1,265 @@
+# File: executors/nzsql_pool_executor.py
+# ---
+# This module provides the `nzsql_pooled` executor, which runs SQL on a pool of
+# long-lived nzsql sessions instead of starting a new nzsql client (and a new
+# connection and login to NZ_HOST) for every test.
+# Each session is an `nzsql -d <database>` process fed over stdin. After every
+# statement the session is asked to `\echo` a unique sentinel line; everything
+# printed before the sentinel is the output of that statement. Lines reporting
+# an ERROR mark the statement as failed.
+# Statements are terminated with a ';' on a line of its own, so that a trailing
+# `-- comment` cannot swallow it (which would leave the statement in nzsql's
+# query buffer, to run in front of the next one).
+# A session that fails a statement, dies or times out is recycled: it is closed
+# and the next test gets a fresh one, so no aborted transaction or half-read
+# output can leak into the next test. A session that timed out or died is
+# killed together with its process group instead of being asked to quit.
+import asyncio
+import functools
+import os
+import re
+import select
+import subprocess
+import threading
+import time
+import uuid
+from executors.capture import CHUNK_SIZE
+from executors.process import kill_process_group
+
+# Sessions kept open per database
+DEFAULT_POOL_SIZE = 4
+
+# Matches error lines from the server ("ERROR:  ...") and from the client
+# ("nzsql:<stdin>:3: ERROR:  ...")
+ERROR_LINE = re.compile(rb"^(?:nzsql:\S*:\d+: )?ERROR:")
+
+
+class NzsqlSession:
+    def __init__(self, database, env=None):
+        self.database = database
+        self.broken = False
+        self._token = uuid.uuid4().hex
+        self._count = 0
+        self._buffer = b""
+        self.proc = subprocess.Popen(
+            ["nzsql", "-d", database],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=env,
+            start_new_session=True
+        )
+
+    def run(self, statement, capture=None, timeout=None):
+        """
+        Runs one statement (or backslash command) in this session.
+
+        Args:
+            statement (str): SQL text; a ';' line is added when it does not end with ';'.
+            capture (OutputCapture): Optional sink that receives the output as it arrives.
+            timeout (float): Seconds to wait for the sentinel; None waits forever.
+
+        Returns:
+            tuple: (success, output); output is the capture excerpt when a capture is given.
+        """
+        chunks = []
+        sink = capture.write if capture else chunks.append
+
+        self._count += 1
+        sentinel = f"__NZTEST_{self._token}_{self._count}__".encode()
+        script = statement.strip()
+        if not script.startswith("\\") and not script.endswith(";"):
+            script += "\n;"
+
+        failed = False
+        try:
+            self.proc.stdin.write(script.encode() + b"\n\\echo " + sentinel + b"\n")
+            self.proc.stdin.flush()
+            deadline = time.monotonic() + timeout if timeout else None
+            at_line_start = True
+            while True:
+                piece = self._read_piece(deadline)
+                if piece is None:
+                    self.broken = failed = True
+                    sink(b"nzsql session ended unexpectedly\n")
+                    break
+                # Output without a final newline puts the sentinel at the end
+                # of its last line rather than on a line of its own
+                line = piece.rstrip(b"\r\n")
+                if line.endswith(sentinel) and line != piece:
+                    if len(line) > len(sentinel):
+                        sink(line[:-len(sentinel)] + b"\n")
+                    break
+                if at_line_start and ERROR_LINE.match(piece):
+                    failed = True
+                sink(piece)
+                at_line_start = piece.endswith(b"\n")
+        except TimeoutError:
+            self.broken = failed = True
+            sink(f"\nTimed out after {timeout}s\n".encode())
+            if capture:
+                capture.timed_out = True
+        except OSError as e:
+            self.broken = failed = True
+            sink(f"nzsql session ended unexpectedly: {e}\n".encode())
+
+        if capture:
+            return not failed, capture.excerpt()
+        return not failed, b"".join(chunks).decode(errors="replace")
+
+    # Returns the next line from the session, or a piece of a very long line.
+    # Returns None when the session has exited and raises TimeoutError once
+    # the deadline has passed.
+    def _read_piece(self, deadline):
+        fd = self.proc.stdout.fileno()
+        while True:
+            newline = self._buffer.find(b"\n")
+            if newline >= 0 or len(self._buffer) >= CHUNK_SIZE:
+                end = newline + 1 if newline >= 0 else len(self._buffer)
+                piece, self._buffer = self._buffer[:end], self._buffer[end:]
+                return piece
+
+            wait = None if deadline is None else deadline - time.monotonic()
+            if wait is not None and wait <= 0:
+                raise TimeoutError()
+            readable, _, _ = select.select([fd], [], [], wait)
+            if not readable:
+                continue
+            chunk = os.read(fd, CHUNK_SIZE)
+            if not chunk:
+                piece, self._buffer = self._buffer, b""
+                return piece or None
+            self._buffer += chunk
+
+    def close(self):
+        if self.broken:
+            kill_process_group(self.proc)
+        try:
+            if not self.broken:
+                self.proc.stdin.write(b"\\q\n")
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            kill_process_group(self.proc)
+            self.proc.wait()
+        self.proc.stdout.close()
+
+
+class NzsqlPool:
+    def __init__(self, size=DEFAULT_POOL_SIZE, env=None):
+        self.size = max(size, 1)
+        self.env = env
+        self._idle = {}
+        self._open = {}
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def acquire(self, database):
+        """Returns an idle session for the database, starting one if the pool is not full."""
+        with self._cond:
+            while True:
+                idle = self._idle.get(database)
+                if idle:
+                    return idle.pop()
+                if self._open.get(database, 0) < self.size:
+                    self._open[database] = self._open.get(database, 0) + 1
+                    break
+                self._cond.wait()
+
+        try:
+            return NzsqlSession(database, env=self.env)
+        except Exception:
+            with self._cond:
+                self._open[database] -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, session, recycle=False):
+        """
+        Returns a session to the pool, or closes it when it must be recycled:
+        after a failure, a timeout or a lost sentinel (the session is then
+        `broken`), or once the pool was closed.
+        """
+        with self._cond:
+            if not (recycle or session.broken or self._closed):
+                self._idle.setdefault(session.database, []).append(session)
+                self._cond.notify()
+                return
+        session.close()
+        with self._cond:
+            self._open[session.database] -= 1
+            self._cond.notify()
+
+    def close(self):
+        """Closes every idle session; sessions still in use are closed when they are released."""
+        with self._cond:
+            self._closed = True
+            sessions = [s for idle in self._idle.values() for s in idle]
+            for database, idle in self._idle.items():
+                self._open[database] -= len(idle)
+            self._idle.clear()
+        for session in sessions:
+            session.close()
+
+
+_pool = None
+_pool_size = DEFAULT_POOL_SIZE
+_pool_lock = threading.Lock()
+
+
+def configure_pool(size):
+    """Sets the number of sessions kept per database; closes the current pool."""
+    global _pool_size
+    close_pool()
+    _pool_size = size
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = NzsqlPool(_pool_size)
+        return _pool
+
+
+def close_pool():
+    """Closes all pooled sessions; the next pooled test starts a new pool."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool:
+        pool.close()
+
+
+def run_nzsql_pooled(command, database=None, sql_file=None, capture=None, timeout=None):
+    database = database or os.environ.get("NZ_DATABASE", "")
+    statement = f"\\i {sql_file}" if sql_file else command
+    pool = get_pool()
+
+    try:
+        session = pool.acquire(database)
+    except Exception as e:
+        return False, f"Error starting nzsql session: {str(e)}"
+
+    success = False
+    try:
+        success, output = session.run(statement, capture=capture, timeout=timeout)
+        return success, output
+    except Exception as e:
+        session.broken = True
+        return False, f"Error executing nzsql: {str(e)}"
+    finally:
+        pool.release(session, recycle=not success)
+
+
+# Asyncio version of run_nzsql_pooled(). Sessions are blocking pipes, so the
+# statement runs on the event loop's default thread pool.
+async def run_nzsql_pooled_async(command, database=None, sql_file=None, timeout=None, capture=None):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None,
+        functools.partial(run_nzsql_pooled, command, database=database, sql_file=sql_file, capture=capture, timeout=timeout)
+    )
@@ -0,0 +1,280 @@
+# File: executors/process.py
+# ---
+# This module provides the blocking subprocess helper shared by the executors.
+# The child's stdout and stderr are read from a pipe in fixed-size chunks.
+# When an OutputCapture is given, each chunk goes straight to the per-test log
+# file and only a bounded excerpt is kept in memory; without one, the chunks are
+# joined and returned as the full output text.
+# Each child runs in its own session; when the timeout expires its whole process
+# group is killed, so grandchildren (e.g. the commands of a shell script) cannot
+# keep the test running or hold the stdout pipe open.
+# The child is reaped with os.wait4(), which also returns its resource usage
+# (including that of the grandchildren it waited for, e.g. the commands of a
+# shell script); the usage is stored on the capture for the test result.
+# In fast-spawn mode (--fast-spawn, see configure_fast_spawn()) the spawn cost of
+# each test is cut down for suites of many tiny scripts:
+#   - a shell command without shell syntax (see shell_free_args()) is run
+#     directly instead of through an extra /bin/sh;
+#   - direct commands are started with os.posix_spawnp(), which uses vfork or
+#     clone(CLONE_VFORK) instead of the fork + error pipe of subprocess.Popen;
+#   - the environment is snapshotted once and shared by every child instead of
+#     copying os.environ for each test.
+# A command that cannot be started directly (e.g. a shell builtin, or a script
+# without a #! line) falls back to the shell, so the results do not change.
+import errno
+import os
+import re
+import select
+import signal
+import subprocess
+import time
+from executors.capture import CHUNK_SIZE
+
+# Resource usage fields stored in each test result, and the rusage attribute
+# each one comes from. ru_maxrss is in kilobytes on Linux.
+RESOURCE_FIELDS = {
+    'cpu_user_sec': 'ru_utime',
+    'cpu_sys_sec': 'ru_stime',
+    'max_rss_kb': 'ru_maxrss',
+    'io_in_blocks': 'ru_inblock',
+    'io_out_blocks': 'ru_oublock',
+    'ctx_voluntary': 'ru_nvcsw',
+    'ctx_involuntary': 'ru_nivcsw',
+}
+
+# Characters that give a command line a meaning only the shell knows:
+# operators, quoting, expansions, globs, comments, redirections
+SHELL_SYNTAX = re.compile(r"""[|&;<>()$`\\"'*?\[\]#~=%{}!\n]""")
+
+# Commands run by the shell even without shell syntax: builtins and keywords,
+# and utilities whose builtin version behaves differently from the binary
+SHELL_WORDS = frozenset((
+    ".", ":", "[", "alias", "bg", "break", "case", "cd", "command", "continue", "do", "done", "echo",
+    "elif", "else", "esac", "eval", "exec", "exit", "export", "false", "fc", "fg", "fi", "for",
+    "function", "getopts", "hash", "if", "jobs", "kill", "local", "printf", "pwd", "read", "readonly",
+    "return", "select", "set", "shift", "source", "test", "then", "time", "times", "trap", "true",
+    "type", "ulimit", "umask", "unalias", "unset", "until", "wait", "while",
+))
+
+# Errors of a direct start after which the command is run by the shell instead
+SHELL_FALLBACK_ERRORS = (errno.ENOENT, errno.EACCES, errno.ENOEXEC, errno.ENOTDIR)
+
+# Environment snapshot shared by every child in fast-spawn mode; None when the mode is off
+_fast_spawn_env = None
+
+
+def configure_fast_spawn(enabled=True):
+    """
+    Turns fast-spawn mode on or off. Turning it on snapshots os.environ, which
+    must then not change while the mode is on (call it again after a change).
+    """
+    global _fast_spawn_env
+    _fast_spawn_env = dict(os.environ) if enabled else None
+
+
+def fast_spawn_enabled():
+    return _fast_spawn_env is not None
+
+
+def shell_free_args(command):
+    """
+    Returns the argument list of a shell command line that the shell would only
+    split on blanks, or None when the command needs the shell.
+    """
+    if SHELL_SYNTAX.search(command):
+        return None
+    args = command.split()
+    if not args or args[0] in SHELL_WORDS:
+        return None
+    return args
+
+
+def run_process(args, shell=False, env=None, timeout=None, capture=None):
+    """
+    Runs a child process to completion, streaming its output.
+
+    Args:
+        args (str or list): Command line string when shell is True, argument list otherwise.
+        shell (bool): Run the command through /bin/sh.
+        env (dict): Environment for the child; defaults to the current environment.
+        timeout (float): Seconds to wait before the child is killed; None waits forever.
+        capture (OutputCapture): Optional sink that receives the output as it arrives.
+
+    Returns:
+        tuple: (returncode, output, timed_out); returncode is None on timeout.
+            output is the capture excerpt when a capture is given.
+    """
+    chunks = []
+    sink = capture.write if capture else chunks.append
+
+    pid, fd, proc = spawn_process(args, shell, env)
+    deadline = time.monotonic() + timeout if timeout else None
+    timed_out = False
+    try:
+        while True:
+            if deadline is not None:
+                wait = deadline - time.monotonic()
+                if wait <= 0 or not select.select([fd], [], [], wait)[0]:
+                    timed_out = True
+                    break
+            chunk = os.read(fd, CHUNK_SIZE)
+            if not chunk:
+                break
+            sink(chunk)
+    except BaseException:
+        # E.g. the capture file hit a full disk, or Ctrl-C: the child must not
+        # keep running, nor be left unreaped
+        kill_group(pid)
+        wait_process(pid, proc)
+        raise
+    finally:
+        close_output(fd, proc)
+
+    if timed_out:
+        kill_group(pid)
+    returncode, usage = wait_process(pid, proc)
+    if capture:
+        capture.resource_usage = usage
+        capture.returncode = returncode
+    if timed_out:
+        returncode = None
+        sink(f"\nTimed out after {timeout}s\n".encode())
+        if capture:
+            capture.timed_out = True
+
+    if capture:
+        return returncode, capture.excerpt(), timed_out
+    return returncode, b"".join(chunks).decode(errors="replace"), timed_out
+
+
+def spawn_process(args, shell=False, env=None):
+    """
+    Starts a child process in a new session, its stdout and stderr on one pipe.
+    In fast-spawn mode commands that need no shell are started with
+    os.posix_spawnp(), the others with subprocess.Popen.
+
+    Args:
+        args (str or list): Command line string when shell is True, argument list otherwise.
+        shell (bool): Run the command through /bin/sh.
+        env (dict): Environment for the child; defaults to the current environment.
+
+    Returns:
+        tuple: (pid, read end of the pipe, Popen object or None). The pipe is
+            closed with close_output() and the child reaped with wait_process().
+    """
+    pid, fd = _fast_spawn(args, shell, env) if _fast_spawn_env is not None else (None, None)
+    if pid is not None:
+        return pid, fd, None
+    proc = subprocess.Popen(
+        args, shell=shell,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        # The snapshot is the current environment: inheriting it is cheaper than passing it
+        env=None if env is _fast_spawn_env else env,
+        start_new_session=True
+    )
+    return proc.pid, proc.stdout.fileno(), proc
+
+
+def close_output(fd, proc=None):
+    """Closes the output pipe of a child started by spawn_process()."""
+    if proc:
+        proc.stdout.close()
+    else:
+        os.close(fd)
+
+
+# Starts a command with os.posix_spawnp() in a new session, its stdout and
+# stderr on a pipe. Returns (pid, read end of the pipe), or (None, None) when
+# the command must be started by subprocess.Popen: it needs the shell, or
+# posix_spawn is not available.
+def _fast_spawn(args, shell, env):
+    if not hasattr(os, "posix_spawnp"):
+        return None, None
+    argv = shell_free_args(args) if shell else list(args)
+    if argv is None:
+        return None, None
+    if env is not None and "/" not in argv[0] and env.get("PATH") != os.environ.get("PATH"):
+        # posix_spawnp() searches the PATH of this process, not the child's
+        return None, None
+    read_fd, write_fd = os.pipe()
+    actions = [
+        (os.POSIX_SPAWN_DUP2, write_fd, 1),
+        (os.POSIX_SPAWN_DUP2, write_fd, 2),
+    ]
+    try:
+        pid = os.posix_spawnp(argv[0], argv, _fast_spawn_env if env is None else env,
+                              file_actions=actions, setsid=True)
+    except OSError as e:
+        os.close(read_fd)
+        if shell and e.errno in SHELL_FALLBACK_ERRORS:
+            return None, None
+        raise
+    finally:
+        os.close(write_fd)
+    return pid, read_fd
+
+
+def child_env(overlay=None):
+    """
+    Returns the environment of a child process: the current environment with
+    `overlay` on top. In fast-spawn mode the environment snapshot is returned as
+    is when there is no overlay; it must not be modified.
+    """
+    if _fast_spawn_env is not None and not overlay:
+        return _fast_spawn_env
+    env = dict(os.environ if _fast_spawn_env is None else _fast_spawn_env)
+    if overlay:
+        env.update(overlay)
+    return env
+
+
+def kill_process_group(proc):
+    """Kills a child started with start_new_session=True and everything it started."""
+    kill_group(proc.pid)
+
+
+def kill_group(pid):
+    """Kills the session of a child started by spawn_process(), by pid."""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def wait_process(pid, proc=None, block=True):
+    """
+    Reaps a child started by spawn_process().
+
+    Args:
+        pid (int): Process id of the child.
+        proc (Popen): The child's Popen object, when it was started by Popen.
+        block (bool): Wait for the child to exit; otherwise only reap it if it
+            already has.
+
+    Returns:
+        tuple: (returncode, resource usage dict or None), or None when block is
+            False and the child is still running.
+    """
+    options = 0 if block else os.WNOHANG
+    if hasattr(os, "wait4"):
+        reaped, status, rusage = os.wait4(pid, options)
+        usage = {field: getattr(rusage, attr) for field, attr in RESOURCE_FIELDS.items()}
+    else:
+        (reaped, status), usage = os.waitpid(pid, options), None
+    if not reaped:
+        return None
+    returncode = _exit_code(status)
+    if proc:
+        # Popen must not try to reap the child again
+        proc.returncode = returncode
+    return returncode, usage
+
+
+# Returncode of a wait status, as subprocess reports it: the exit status, or
+# minus the signal that killed the child (os.waitstatus_to_exitcode() needs
+# Python 3.9).
+def _exit_code(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
@@ -0,0 +1,410 @@
+# File: executors/registry.py
+# ---
+# This module is the registry of executors. It maps each executor name used
+# in the tests to a spec that names its functions, so the runner no longer
+# imports every executor module up front: a module is imported the first time
+# a test uses one of its executors.
+# Executors come from three places, looked up in this order:
+#   - a config file (executors.yaml, or --executors-config), see load_config()
+#   - the built-in executors below
+#   - installed packages that declare a `nztest.executors` entry point named
+#     after the executor; entry points are only scanned for unknown names, and
+#     an entry point that cannot be loaded only fails the tests that use it
+# A spec is a dict. Functions are given as "module:function" strings, or as
+# callables when a spec is registered from Python:
+#   run          blocking function returning (success, output)
+#   run_async    coroutine function with the same arguments (optional)
+#   arguments    how the test is passed to the functions, see ARGUMENT_STYLES
+#   batch        function running one member of a batch, with the same
+#                arguments plus `batch=(batch id, position, size)` (optional)
+#   batch_async  coroutine version of `batch` (optional)
+#   batch_key    test key whose value must be the same for all members of a
+#                batch, e.g. "database" (optional)
+#   close        function called without arguments at the end of every run,
+#                to close pooled sessions or connections (optional)
+#   streaming    whether the functions accept `capture` (default true); the
+#                output of other executors is written to the log afterwards
+#   env          whether the functions accept `env`, variables to add to the
+#                environment of the test, such as the exports of setup fixtures
+#                (default false)
+#   requires     what the tests need before they can run, checked once by the
+#                preflight stage (core/preflight.py): `tools`, executables that
+#                must be on the PATH, and `database: true` for executors that
+#                connect to the test's `database` (or NZ_DATABASE) (optional)
+# At least one of run and run_async is required. Every function also gets the
+# `timeout` keyword. What a spec declares is what the executor can do (see
+# capabilities()), and the runner takes the fastest path it offers: the async
+# engine awaits run_async when there is one and runs the blocking function on
+# a thread otherwise, and --batch uses the batch functions.
+import asyncio
+import functools
+import importlib
+import os
+import threading
+import yaml
+from utils.helpers import log_line
+
+# Entry point group of executors provided by installed packages
+ENTRY_POINT_GROUP = "nztest.executors"
+
+# Config file read when it exists and no other is given
+DEFAULT_CONFIG = "executors.yaml"
+
+SPEC_KEYS = ("run", "run_async", "arguments", "batch", "batch_async", "batch_key", "close", "streaming", "env",
+             "requires", "description")
+REQUIRES_KEYS = ("tools", "database")
+FUNCTION_KEYS = ("run", "run_async", "batch", "batch_async", "close")
+
+# How a test is passed to an executor's functions:
+#   - "command":  the test's `command` string
+#   - "script":   the test's `command`, relative to the test's YAML file
+#   - "sql_file": the test's `database` and `sql_file` (relative to the YAML file)
+#   - "sql_command": the `command`, with `database` as a keyword
+#   - "pooled":   the `command`, with `database` and `sql_file` as keywords
+#   - "test":     the whole test dict (with `__file__`), for plugin executors
+ARGUMENT_STYLES = ("command", "script", "sql_file", "sql_command", "pooled", "test")
+
+BUILTIN_EXECUTORS = {
+    "bash": {
+        "run": "executors.bash_executor:run_bash",
+        "run_async": "executors.bash_executor:run_bash_async",
+        "arguments": "script",
+        "env": True,
+    },
+    "nzsql": {
+        "run": "executors.nzsql_executor:run_nzsql",
+        "run_async": "executors.nzsql_executor:run_nzsql_async",
+        "arguments": "sql_command",
+        "env": True,
+        "requires": {"tools": ["nzsql"], "database": True},
+    },
+    "nz": {
+        "run": "executors.nz_executor:run_nz",
+        "run_async": "executors.nz_executor:run_nz_async",
+        "arguments": "command",
+        "env": True,
+    },
+    "nzsql_file": {
+        "run": "executors.nzsql_file_executor:run_nzsql_file",
+        "run_async": "executors.nzsql_file_executor:run_nzsql_file_async",
+        "arguments": "sql_file",
+        "batch": "executors.nzsql_batch_executor:run_nzsql_batched",
+        "batch_async": "executors.nzsql_batch_executor:run_nzsql_batched_async",
+        "batch_key": "database",
+        "close": "executors.nzsql_batch_executor:close_batch_sessions",
+        "env": True,
+        "requires": {"tools": ["nzsql"], "database": True},
+    },
+    "nzsql_pooled": {
+        "run": "executors.nzsql_pool_executor:run_nzsql_pooled",
+        "run_async": "executors.nzsql_pool_executor:run_nzsql_pooled_async",
+        "arguments": "pooled",
+        "close": "executors.nzsql_pool_executor:close_pool",
+        "requires": {"tools": ["nzsql"], "database": True},
+    },
+}
+
+# Name -> (spec, source) of the executors registered from config files or Python
+_registered = {}
+# Name -> spec of the executors found through entry points (None: not found)
+_entry_points = {}
+# Name -> why the entry point of that name cannot be used
+_broken_entry_points = {}
+# Name -> spec with its functions imported, for the executors used so far
+_loaded = {}
+_lock = threading.Lock()
+
+
+def register_executor(name, spec, source="python"):
+    """
+    Registers an executor, replacing any executor of the same name.
+
+    Args:
+        name (str): Executor name used in the tests' `executor` key.
+        spec (dict): Executor spec, see the top of this module.
+        source (str): Where the spec comes from, shown by `main.py executors`.
+
+    Raises:
+        ValueError: If the spec is not valid.
+    """
+    _validate(name, spec)
+    with _lock:
+        _registered[name] = (dict(spec), source)
+        _loaded.pop(name, None)
+
+
+def load_config(path=None):
+    """
+    Registers the executors of a YAML config file:
+
+        executors:
+          teradata:
+            run: inhouse.teradata:run_bteq
+            arguments: test
+
+    Args:
+        path (str): Config file; None reads DEFAULT_CONFIG when it exists.
+
+    Raises:
+        ValueError: If the file cannot be read or an executor spec is not valid.
+    """
+    if path is None:
+        if not os.path.exists(DEFAULT_CONFIG):
+            return
+        path = DEFAULT_CONFIG
+    try:
+        with open(path) as f:
+            data = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        raise ValueError(f"Cannot read executor config {path}: {e}")
+    executors = data.get("executors") if isinstance(data, dict) else None
+    if not isinstance(executors, dict):
+        raise ValueError(f"Executor config {path} has no 'executors' mapping")
+    for name, spec in executors.items():
+        register_executor(str(name), spec, source=path)
+
+
+def executor_spec(name):
+    """
+    Returns the spec of an executor without importing its functions, or None
+    when no executor of that name is known.
+    """
+    with _lock:
+        if name in _registered:
+            return _registered[name][0]
+    if name in BUILTIN_EXECUTORS:
+        return BUILTIN_EXECUTORS[name]
+    return _entry_point_spec(name)
+
+
+def capabilities(name):
+    """
+    Returns what an executor can do, as declared by its spec:
+    {"async": bool, "batch": bool, "pooled": bool, "streaming": bool, "env": bool},
+    or None for an unknown executor.
+    """
+    spec = executor_spec(name)
+    if spec is None:
+        return None
+    return {
+        "async": bool(spec.get("run_async")),
+        "batch": bool(spec.get("batch") or spec.get("batch_async")),
+        "pooled": bool(spec.get("close")),
+        "streaming": spec.get("streaming", True),
+        "env": spec.get("env", False),
+    }
+
+
+def requirements(name):
+    """
+    Returns what the tests of an executor need, as declared by its spec:
+    {"tools": [executables], "database": bool}, or None for an unknown executor.
+    """
+    spec = executor_spec(name)
+    if spec is None:
+        return None
+    requires = spec.get("requires") or {}
+    return {"tools": list(requires.get("tools") or []), "database": bool(requires.get("database"))}
+
+
+def executor_error(name):
+    """Returns why tests cannot use an executor (unknown, or a broken entry point), or None when they can."""
+    if executor_spec(name) is not None:
+        return None
+    with _lock:
+        reason = _broken_entry_points.get(name)
+    return f"Broken executor '{name}': {reason}" if reason else f"Unknown executor '{name}'"
+
+
+def list_executors():
+    """Returns [(name, source)] of the known executors, entry points included, sorted by name."""
+    names = {name: f"entry point ({ENTRY_POINT_GROUP})" for name in _entry_point_names()}
+    names.update({name: "built-in" for name in BUILTIN_EXECUTORS})
+    with _lock:
+        names.update({name: source for name, (_, source) in _registered.items()})
+    return sorted(names.items())
+
+
+def run_executor(test, timeout=None, capture=None, env=None):
+    """
+    Runs a test with its executor, in the calling thread.
+
+    Args:
+        test (dict): The test; `__batch__` set by the runner selects the batch function.
+        timeout (float): Seconds the test may run; None waits forever.
+        capture (OutputCapture): Sink that receives the output as it arrives.
+        env (dict): Variables to add to the environment, passed on to executors
+            that accept them.
+
+    Returns:
+        tuple: (success, output)
+    """
+    executor = _load(test.get('executor', 'bash'))
+    if executor is None:
+        return False, executor_error(test.get('executor', 'bash'))
+    args, kwargs = _call_arguments(executor, test, timeout, capture, env)
+    batched = bool(test.get("__batch__") and (executor["batch"] or executor["batch_async"]))
+    func = executor["batch"] if batched else executor["run"]
+    if func:
+        return func(*args, **kwargs)
+    # Only a coroutine function: run it on an event loop of this thread
+    return asyncio.run(executor["batch_async" if batched else "run_async"](*args, **kwargs))
+
+
+async def run_executor_async(test, timeout=None, capture=None, env=None):
+    """Asyncio version of run_executor(); blocking executors run on the loop's default thread pool."""
+    executor = _load(test.get('executor', 'bash'))
+    if executor is None:
+        return False, executor_error(test.get('executor', 'bash'))
+    args, kwargs = _call_arguments(executor, test, timeout, capture, env)
+    batched = bool(test.get("__batch__") and (executor["batch"] or executor["batch_async"]))
+    func = executor["batch_async"] if batched else executor["run_async"]
+    if func:
+        return await func(*args, **kwargs)
+    blocking = executor["batch"] if batched else executor["run"]
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(blocking, *args, **kwargs))
+
+
+def close_executors():
+    """Calls the close functions of the executors used so far, e.g. to close pooled sessions."""
+    with _lock:
+        hooks = [executor["close"] for executor in _loaded.values() if executor["close"]]
+    for hook in hooks:
+        hook()
+
+
+# Returns the spec of a used executor with its functions imported (cached).
+def _load(name):
+    with _lock:
+        if name in _loaded:
+            return _loaded[name]
+    spec = executor_spec(name)
+    if spec is None:
+        return None
+    executor = {key: spec.get(key) for key in SPEC_KEYS}
+    executor["arguments"] = spec.get("arguments", "command")
+    executor["streaming"] = spec.get("streaming", True)
+    executor["env"] = spec.get("env", False)
+    for key in FUNCTION_KEYS:
+        if executor[key]:
+            executor[key] = _resolve(executor[key], name, key)
+    with _lock:
+        _loaded[name] = executor
+    return executor
+
+
+# Imports the function named by "module:function" (callables are returned as is).
+def _resolve(ref, name, key):
+    if callable(ref):
+        return ref
+    module_name, _, attr = ref.partition(":")
+    try:
+        func = importlib.import_module(module_name)
+        for part in attr.split("."):
+            func = getattr(func, part)
+    except Exception as e:
+        # Whatever the module raises on import, e.g. a SyntaxError or a RuntimeError
+        raise ValueError(f"Executor '{name}': cannot load {key} function {ref}: {type(e).__name__}: {e}")
+    return func
+
+
+# Positional and keyword arguments of a call for the test.
+def _call_arguments(executor, test, timeout, capture, env):
+    style = executor["arguments"]
+    test_dir = os.path.dirname(test.get('__file__', ''))
+    command = test.get('command', '')
+    kwargs = {"timeout": timeout}
+    if executor["streaming"]:
+        kwargs["capture"] = capture
+    if env and executor["env"]:
+        kwargs["env"] = env
+    if test.get("__batch__"):
+        kwargs["batch"] = test["__batch__"]
+
+    if style == "script":
+        return (os.path.join(test_dir, command),), kwargs
+    if style == "sql_file":
+        return (test.get("database"), os.path.join(test_dir, test["sql_file"])), kwargs
+    if style == "sql_command":
+        kwargs["database"] = test.get("database")
+        return (command,), kwargs
+    if style == "pooled":
+        kwargs["database"] = test.get("database")
+        kwargs["sql_file"] = os.path.join(test_dir, test["sql_file"]) if test.get("sql_file") else None
+        return (command,), kwargs
+    if style == "test":
+        return (test,), kwargs
+    return (command,), kwargs
+
+
+def _validate(name, spec):
+    if not isinstance(spec, dict):
+        raise ValueError(f"Executor '{name}': spec must be a mapping")
+    unknown = sorted(set(spec) - set(SPEC_KEYS))
+    if unknown:
+        raise ValueError(f"Executor '{name}': unknown keys {', '.join(unknown)} (expected {', '.join(SPEC_KEYS)})")
+    if not spec.get("run") and not spec.get("run_async"):
+        raise ValueError(f"Executor '{name}': needs a run or run_async function")
+    for key in FUNCTION_KEYS:
+        ref = spec.get(key)
+        if ref is not None and not callable(ref) and not (isinstance(ref, str) and ":" in ref):
+            raise ValueError(f"Executor '{name}': {key} must be 'module:function'")
+    if spec.get("arguments", "command") not in ARGUMENT_STYLES:
+        raise ValueError(f"Executor '{name}': arguments must be one of {', '.join(ARGUMENT_STYLES)}")
+    for key in ("streaming", "env"):
+        if not isinstance(spec.get(key, key == "streaming"), bool):
+            raise ValueError(f"Executor '{name}': {key} must be true or false")
+    requires = spec.get("requires")
+    if requires is not None:
+        if not isinstance(requires, dict) or set(requires) - set(REQUIRES_KEYS):
+            raise ValueError(f"Executor '{name}': requires must be a mapping with {' and/or '.join(REQUIRES_KEYS)}")
+        tools = requires.get("tools") or []
+        if not isinstance(tools, list) or not all(isinstance(tool, str) for tool in tools):
+            raise ValueError(f"Executor '{name}': requires.tools must be a list of executable names")
+        if not isinstance(requires.get("database", False), bool):
+            raise ValueError(f"Executor '{name}': requires.database must be true or false")
+
+
+# Spec of the entry point named `name`. The entry point refers either to a
+# spec dict or to a run function taking the whole test. An entry point that
+# cannot be imported (whatever its module raises on import) or has no valid
+# spec is logged once and treated as not found, so only the tests using it fail
+# (see executor_error()).
+def _entry_point_spec(name):
+    with _lock:
+        if name in _entry_points:
+            return _entry_points[name]
+    spec, reason = None, None
+    for entry_point in _entry_points_of_group():
+        if entry_point.name == name:
+            try:
+                target = entry_point.load()
+                spec = {"run": target, "arguments": "test"} if callable(target) else target
+                _validate(name, spec)
+            except Exception as e:
+                # A broken plugin must not stop the run, whatever it raises
+                spec, reason = None, f"cannot load entry point {entry_point.value}: {type(e).__name__}: {e}"
+                log_line("ERROR", "Broken executor", f"{name}: {reason}")
+            break
+    with _lock:
+        _entry_points[name] = spec
+        if reason:
+            _broken_entry_points[name] = reason
+    return spec
+
+
+def _entry_point_names():
+    return [entry_point.name for entry_point in _entry_points_of_group()]
+
+
+# The `group` keyword of entry_points() needs Python 3.10; older versions return
+# a dict of all groups, and Python 3.7 has no importlib.metadata at all.
+def _entry_points_of_group():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return []
+    try:
+        return list(entry_points(group=ENTRY_POINT_GROUP))
+    except TypeError:
+        return list(entry_points().get(ENTRY_POINT_GROUP, []))
@@ -1,33 +1,141 @@
 import argparse
 import os
-from core.loader import load_tests
-from core.runner import run_tests
-from core.report import write_report
+import sys
+from datetime import datetime
+from core.distributed import DEFAULT_WORKER_TIMEOUT_SEC, parse_shard, run_coordinator, run_worker, shard_tests
+from core.loader import configure_tests_root, test_name
+from core.history import DEFAULT_HISTORY_DB, HistoryRecorder, HistoryStore, percentile, report_paths
+from core.log_store import LogStore, collect_garbage, open_log
+from core.selection import select_tests
+from core.metrics import MetricsServer, ProgressBar, RunMetrics
+from core.preflight import DEFAULT_PROBE_TIMEOUT_SEC, DEFAULT_TTL_SEC, run_preflight
+from core.runner import run_tests, ENGINES
+from core.scheduler import ORDERS
+from core.report import (StreamingReport, load_durations, load_report, merge_results, parse_report_name,
+                         parse_stream_name, read_report_stream, rerun_names, write_report)
+from core.result_cache import ResultCache
 from core.summary import print_summary
+from executors.process import configure_fast_spawn
+from executors.registry import capabilities, executor_error, list_executors, load_config
 from utils.env_check import check_env_vars
 from utils import helpers
-from utils.report_utils import generate_html_report
+from utils.report_utils import HTML_MODES, generate_html_report
 
 def main():
+    # Subcommands
+    if len(sys.argv) > 1 and sys.argv[1] == "history":
+        history_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "report":
+        report_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "gc":
+        gc_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "log":
+        log_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "executors":
+        executors_main(sys.argv[2:])
+        return
+
     # Parse command-line arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("--tags", help="Comma-separated tag filter", default="")
-    parser.add_argument("--label", help="Label for this run (e.g., 'nextgen')", default="system")
+    parser.add_argument("--label", help="Label for this run (e.g., 'nextgen'; default: system, or the label of the --rerun-failed report)")
     parser.add_argument("--test-dir", default="tests", help="Root directory containing test folders")
     parser.add_argument("--dry-run", action="store_true", help="Echo commands without running")
     parser.add_argument("--emoji", action="store_true", help="Enable emoji output")
     parser.add_argument("--include-tests", nargs="*", help="List of test subdirectories to include")
     parser.add_argument("--exclude-tests", nargs="*", help="List of test subdirectories to exclude")
+    parser.add_argument("--name-glob", nargs="*", help="Only tests whose name (dir/name, or name alone for patterns without '/') matches one of these patterns")
+    parser.add_argument("--executor", nargs="*", help="Only tests run by one of these executors")
+    parser.add_argument("--changed-since", metavar="GIT_REF", help="Only tests whose YAML file or test directory changed since this git ref")
+    parser.add_argument("--rerun-failed", metavar="REPORT", help="Run only the failed tests of an earlier report (reports/<run_id>_<label>.json or .jsonl) and the tests they skipped, then report them merged with its other results")
+    parser.add_argument("--no-cache", action="store_true", help="Parse every test YAML file instead of using the parsed-test cache")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of tests to run in parallel")
+    parser.add_argument("--nzsql-pool-size", type=int, help="nzsql sessions kept open per database by the nzsql_pooled executor (default: 4)")
+    parser.add_argument("--batch", "--nzsql-batch", dest="batch", type=int, metavar="N", help="Run up to N adjacent tests of a batching executor as one batch, e.g. nzsql_file tests against the same database in one nzsql session")
+    parser.add_argument("--executors-config", help="YAML file registering more executors (default: ./executors.yaml when it exists)")
+    parser.add_argument("--fast-spawn", action="store_true", help="Start commands without shell syntax directly (posix_spawn) instead of through /bin/sh, with the environment built once")
+    parser.add_argument("--reuse-results", action="store_true", help="Reuse earlier PASS results of tests whose fingerprint did not change")
+    parser.add_argument("--result-cache-max-mb", type=int, default=1024, help="Size limit of the --reuse-results store")
+    parser.add_argument("--result-cache-max-age-days", type=float, default=14, help="Age limit of entries in the --reuse-results store")
+    parser.add_argument("--default-timeout", type=float, help="Seconds after which a test without timeout_sec is killed and reported as TIMEOUT")
+    parser.add_argument("--html-report", choices=HTML_MODES, default="full", help="HTML layout: one full page, or a compact index that loads outputs on demand")
+    parser.add_argument("--order", choices=ORDERS, default="default", help="Order of ready tests: as loaded, last failures first, or longest dependency chain first")
+    parser.add_argument("--fail-fast", type=int, metavar="N", help="Stop starting new tests after N failures; the rest are reported as SKIPPED")
+    parser.add_argument("--engine", choices=ENGINES, default="thread", help="Execution engine: thread pool or asyncio event loop")
+    parser.add_argument("--no-preflight", action="store_true", help="Do not check the tools and databases the tests need before running them")
+    parser.add_argument("--preflight-ttl", type=float, default=DEFAULT_TTL_SEC, help="Seconds a successful database check is cached (0: always check)")
+    parser.add_argument("--preflight-timeout", type=float, default=DEFAULT_PROBE_TIMEOUT_SEC, help="Seconds each database gets to answer the preflight check")
+    parser.add_argument("--archive-logs", action="store_true", help="Store test logs compressed and deduplicated in output/.store (read them with 'log')")
+    parser.add_argument("--history-db", default=DEFAULT_HISTORY_DB, help="SQLite database that keeps every test result")
+    parser.add_argument("--no-history", action="store_true", help="Do not record results in the history database")
+    parser.add_argument("--json-log", help="Structured JSON log of every event (default: output/<run_id>_<label>/log.jsonl)")
+    parser.add_argument("--metrics-port", type=int, help="Serve live Prometheus metrics of the run on this local port")
+    parser.add_argument("--progress", action="store_true", help="Show a live progress bar on stderr")
+    parser.add_argument("--shard", help="Run only shard i of N (e.g. 2/4), balanced by earlier report durations")
+    parser.add_argument("--coordinator", metavar="QUEUE_DIR", help="Publish the tests to a shared queue directory and merge the workers' results")
+    parser.add_argument("--spawn-workers", type=int, default=0, help="Local workers started by --coordinator")
+    parser.add_argument("--worker-timeout", type=float, default=DEFAULT_WORKER_TIMEOUT_SEC,
+                        help="Seconds --coordinator waits while no worker holds a unit before it fails the "
+                             f"units left (default {DEFAULT_WORKER_TIMEOUT_SEC:g}, 0 waits forever)")
+    parser.add_argument("--worker", metavar="QUEUE_DIR", help="Run tests from a coordinator's queue directory, then exit")
 
     args = parser.parse_args()
+    if args.coordinator:
+        # Workers run each unit on their own; these options need the whole run in one process
+        unsupported = [option for option, used in (
+            ("--order", args.order != "default"),
+            ("--fail-fast", args.fail_fast is not None),
+            ("--batch", args.batch is not None),
+            ("--engine", args.engine != "thread"),
+            ("--reuse-results", args.reuse_results),
+        ) if used]
+        if unsupported:
+            parser.error(f"--coordinator does not support {', '.join(unsupported)}")
 
     # Emojis are off by default unless --emoji is passed
     helpers.USE_EMOJIS = args.emoji
+    try:
+        load_config(args.executors_config)
+    except ValueError as e:
+        helpers.log_line("ERROR", "Invalid executors", str(e))
+        exit(1)
+    if args.fast_spawn:
+        configure_fast_spawn()
+    if args.nzsql_pool_size is not None:
+        # Only imported when configured, like every executor module
+        from executors.nzsql_pool_executor import configure_pool
+        configure_pool(args.nzsql_pool_size)
+
+    # Workers get their tests from the coordinator's queue
+    if args.worker:
+        helpers.configure_json_log(args.json_log)
+        run_worker(args.worker, jobs=args.jobs)
+        return
+
+    # --rerun-failed: the tests to run are the failures of an earlier report
+    previous_results, rerun = None, None
+    if args.rerun_failed:
+        try:
+            previous_results = load_report(args.rerun_failed)
+        except ValueError as e:
+            helpers.log_line("ERROR", "Invalid report", str(e))
+            exit(1)
+        rerun = rerun_names(previous_results)
+        if not rerun:
+            helpers.log_line("INFO", "Nothing to rerun", f"no failed tests in {args.rerun_failed}")
+            return
+        helpers.log_line("INFO", "Rerun", f"{len(rerun)} failed or skipped tests of {args.rerun_failed}")
+    args.label = args.label or (args.rerun_failed and parse_report_name(args.rerun_failed)[1]) or "system"
 
     selected_tags = set(t.strip() for t in args.tags.split(",") if t.strip())
 
     # Determine which test directories to run
     test_root = args.test_dir
+    configure_tests_root(test_root)
     all_dirs = [
         d for d in os.listdir(test_root)
         if os.path.isdir(os.path.join(test_root, d))
@@ -43,10 +151,27 @@ def main():
 
     test_dirs = [os.path.join(test_root, d) for d in selected_dirs]
 
-    # Load all tests from final list of directories
-    all_tests = []
-    for test_dir in test_dirs:
-        all_tests.extend(load_tests(test_dir))
+    # Select the tests through the selection index; only the YAML files holding
+    # selected tests are loaded
+    try:
+        all_tests, added = select_tests(
+            test_dirs,
+            tags=selected_tags,
+            executors=set(args.executor or []),
+            name_glob=args.name_glob,
+            changed_since=args.changed_since,
+            use_cache=not args.no_cache,
+            names=rerun
+        )
+    except ValueError as e:
+        helpers.log_line("ERROR", "Invalid selection", str(e))
+        exit(1)
+    if added:
+        helpers.log_line("INFO", "Dependencies", f"{added} tests added for selected tests")
+    if rerun:
+        missing = rerun.difference(test_name(t) for t in all_tests)
+        if missing:
+            helpers.log_line("INFO", "Not found", f"{len(missing)} tests of the report: {', '.join(sorted(missing))}")
 
     if not all_tests:
         helpers.log_line("ERROR", "No test cases found", "Exiting.")
@@ -54,18 +179,279 @@ def main():
 
     check_env_vars(all_tests)
 
-    if selected_tags:
-        all_tests = [t for t in all_tests if selected_tags & set(t.get("tags", []))]
+    # Durations for sharding and ordering come from the history when it is kept
+    history = None if args.no_history else HistoryStore(args.history_db)
+
+    try:
+        if args.shard:
+            shard_index, shard_count = parse_shard(args.shard)
+            all_tests = shard_tests(all_tests, shard_index, shard_count, load_durations(history=history))
+            helpers.log_line("INFO", "Shard", f"{shard_index}/{shard_count}: {len(all_tests)} tests")
+    except ValueError as e:
+        helpers.log_line("ERROR", "Invalid shard", str(e))
+        exit(1)
+
+    # Tools and databases are checked once; the tests that cannot run are
+    # reported as ERROR together instead of failing one by one
+    if not args.dry_run and not args.no_preflight:
+        run_preflight(all_tests, ttl_sec=args.preflight_ttl, timeout=args.preflight_timeout)
+
+    result_cache = None
+    if args.reuse_results:
+        result_cache = ResultCache(
+            max_bytes=args.result_cache_max_mb * 1024 * 1024,
+            max_age_sec=args.result_cache_max_age_days * 24 * 3600
+        )
+
+    run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    helpers.configure_json_log(args.json_log or os.path.join("output", f"{run_id}_{args.label}", "log.jsonl"))
 
-    results, output_dir, run_id = run_tests(
-        all_tests,
-        dry_run=args.dry_run,
-        label=args.label
+    # Results are streamed to reports/<run_id>_<label>.jsonl as tests finish;
+    # the final reports are built from that stream.
+    stream = StreamingReport()
+    listeners = [stream] + ([HistoryRecorder(history)] if history else [])
+    # Fingerprints are only worth their hashing when the history keeps them
+    # for flaky test detection or a rerun compares them with the earlier run
+    fingerprints = history is not None or bool(args.rerun_failed)
+
+    metrics_server = None
+    if args.metrics_port is not None or args.progress:
+        # The ETA is based on the median duration of each test in the history
+        if history:
+            durations = {name: percentile(d, 50) for name, d in history.durations().items()}
+        else:
+            durations = load_durations()
+        metrics = RunMetrics(durations)
+        listeners.append(metrics)
+        if args.progress:
+            listeners.append(ProgressBar(metrics))
+        if args.metrics_port is not None:
+            # The metrics are optional: a port in use must not stop the run
+            try:
+                metrics_server = MetricsServer(metrics, args.metrics_port).start()
+            except OSError as e:
+                helpers.log_line("ERROR", "Metrics", f"cannot serve on port {args.metrics_port} ({e}), running without the exporter")
+            else:
+                helpers.log_line("INFO", "Metrics", f"http://127.0.0.1:{metrics_server.port}/metrics")
+
+    try:
+        if args.coordinator:
+            worker_command = [sys.executable, os.path.abspath(__file__), "--worker", args.coordinator, "--jobs", str(args.jobs)]
+            if args.executors_config:
+                worker_command += ["--executors-config", args.executors_config]
+            if args.fast_spawn:
+                worker_command.append("--fast-spawn")
+            results, output_dir, run_id = run_coordinator(
+                all_tests,
+                args.coordinator,
+                dry_run=args.dry_run,
+                label=args.label,
+                durations=load_durations(history=history),
+                worker_command=worker_command,
+                spawn_workers=args.spawn_workers,
+                default_timeout=args.default_timeout,
+                listeners=listeners,
+                run_id=run_id,
+                archive_logs=args.archive_logs,
+                fingerprints=fingerprints,
+                worker_timeout=args.worker_timeout or None
+            )
+        else:
+            results, output_dir, run_id = run_tests(
+                all_tests,
+                dry_run=args.dry_run,
+                label=args.label,
+                jobs=args.jobs,
+                engine=args.engine,
+                result_cache=result_cache,
+                listeners=listeners,
+                default_timeout=args.default_timeout,
+                run_id=run_id,
+                order=args.order,
+                max_failures=args.fail_fast,
+                batch_size=args.batch,
+                log_store=LogStore() if args.archive_logs else None,
+                fingerprints=fingerprints,
+                history=history
+            )
+    except ValueError as e:
+        helpers.log_line("ERROR", "Invalid tests", str(e))
+        exit(1)
+    finally:
+        if metrics_server:
+            metrics_server.close()
+
+    # With --rerun-failed, the reports hold the earlier results with the rerun
+    # ones in their place
+    def final_results():
+        results = read_report_stream(stream.path)
+        return merge_results(previous_results, results) if previous_results is not None else results
+
+    # Tests whose outcome flipped in the history with unchanged inputs are flagged flaky
+    flaky = set()
+    if history:
+        flaky = {row[0] for row in history.flaky(r.get("name") for r in final_results())}
+    write_report(mark_flaky(final_results(), flaky), label=args.label, run_id=run_id)
+    generate_html_report(mark_flaky(final_results(), flaky), label=args.label, timestamp=run_id, mode=args.html_report)
+    print_summary(mark_flaky(final_results(), flaky), label=args.label, output_dir="reports", run_id=run_id)
+
+# Yields the results with `flaky: True` added to those of the given test names
+def mark_flaky(results, names):
+    for result in results:
+        if result.get("name") in names and not result.get("flaky"):
+            result = dict(result, flaky=True)
+        yield result
+
+# `report` subcommand: builds the JSON, HTML and summary from a result stream,
+# e.g. the partial stream left behind by a run that did not finish
+def report_main(argv):
+    parser = argparse.ArgumentParser(prog="nztest report", description="Build reports from a .jsonl result stream")
+    parser.add_argument("stream", help="Result stream, reports/<run_id>_<label>.jsonl")
+    parser.add_argument("--html-report", choices=HTML_MODES, default="full", help="HTML layout")
+    args = parser.parse_args(argv)
+    helpers.USE_EMOJIS = False
+
+    try:
+        run_id, label = parse_stream_name(args.stream)
+    except ValueError as e:
+        helpers.log_line("ERROR", "Invalid result stream", str(e))
+        exit(1)
+
+    write_report(read_report_stream(args.stream), label=label, run_id=run_id)
+    generate_html_report(read_report_stream(args.stream), label=label, timestamp=run_id, mode=args.html_report)
+    print_summary(read_report_stream(args.stream), label=label, output_dir="reports", run_id=run_id)
+
+# `gc` subcommand: removes old runs (output directories and reports) and the
+# archived logs that no remaining run uses
+def gc_main(argv):
+    parser = argparse.ArgumentParser(prog="nztest gc", description="Remove old runs and unused archived logs")
+    parser.add_argument("--keep", type=int, help="Number of most recent runs to keep")
+    parser.add_argument("--max-bytes", type=parse_size, help="Then remove the oldest runs until output and reports fit in this size (e.g. 500M, 20G)")
+    parser.add_argument("--output-dir", default="output", help="Directory of the run output directories")
+    parser.add_argument("--reports-dir", default="reports", help="Directory of the reports")
+    parser.add_argument("--dry-run", action="store_true", help="Only show what would be removed")
+    args = parser.parse_args(argv)
+    helpers.USE_EMOJIS = False
+    if args.keep is None and args.max_bytes is None:
+        parser.error("give --keep and/or --max-bytes")
+    if args.keep is not None and args.keep < 1:
+        parser.error("--keep must be at least 1")
+
+    summary = collect_garbage(
+        keep=args.keep,
+        max_bytes=args.max_bytes,
+        output_dir=args.output_dir,
+        reports_dir=args.reports_dir,
+        store_root=os.path.join(args.output_dir, ".store"),
+        dry_run=args.dry_run
     )
+    verb = "Would remove" if args.dry_run else "Removed"
+    for key in summary["removed_runs"]:
+        helpers.log_line("INFO", f"{verb} run", key)
+    helpers.log_line("SUMMARY", "Runs kept", summary["kept_runs"])
+    helpers.log_line("SUMMARY", f"{verb} logs", f"{summary['removed_objects']} unused archived logs")
+    helpers.log_line("SUMMARY", "Space freed", f"{summary['freed_bytes'] / (1024 * 1024):.1f} MB")
+    helpers.log_line("SUMMARY", "Space used", f"{summary['total_bytes'] / (1024 * 1024):.1f} MB")
+
+# Parses a byte size such as 1048576, 500K, 20M or 1.5G
+def parse_size(text):
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    text = text.strip().upper().rstrip("B")
+    try:
+        if text and text[-1] in units:
+            return int(float(text[:-1]) * units[text[-1]])
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size '{text}'")
+
+# `log` subcommand: prints test logs, plain or archived
+def log_main(argv):
+    parser = argparse.ArgumentParser(prog="nztest log", description="Print test logs, whether plain or archived")
+    parser.add_argument("paths", nargs="+", help="Log paths as shown in the reports (output/<run>/<dir>/<name>.log)")
+    args = parser.parse_args(argv)
+
+    for path in args.paths:
+        try:
+            with open_log(path) as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    sys.stdout.buffer.write(chunk)
+        except (OSError, ValueError) as e:
+            sys.stdout.flush()
+            print(f"Cannot read log {path}: {e}", file=sys.stderr)
+            exit(1)
+    sys.stdout.flush()
+
+# `executors` subcommand: lists the known executors and what they can do,
+# without importing them
+def executors_main(argv):
+    parser = argparse.ArgumentParser(prog="nztest executors", description="List the registered executors")
+    parser.add_argument("--executors-config", help="YAML file registering more executors (default: ./executors.yaml when it exists)")
+    args = parser.parse_args(argv)
+    helpers.USE_EMOJIS = False
+    try:
+        load_config(args.executors_config)
+    except ValueError as e:
+        helpers.log_line("ERROR", "Invalid executors", str(e))
+        exit(1)
+
+    print(f"{'EXECUTOR':<16} {'ASYNC':<6} {'BATCH':<6} {'POOLED':<7} {'STREAM':<7} {'ENV':<4} SOURCE")
+    for name, source in list_executors():
+        caps = capabilities(name)
+        if caps is None:
+            print(f"{name:<16} invalid: {executor_error(name)}")
+            continue
+        flags = ["yes" if caps[key] else "-" for key in ("async", "batch", "pooled", "streaming", "env")]
+        print(f"{name:<16} {flags[0]:<6} {flags[1]:<6} {flags[2]:<7} {flags[3]:<7} {flags[4]:<4} {source}")
+
+# `history` subcommand: duration statistics and flaky tests from the history database
+def history_main(argv):
+    parser = argparse.ArgumentParser(prog="nztest history", description="Test duration history, regressions and flaky tests")
+    parser.add_argument("--db", default=DEFAULT_HISTORY_DB, help="History database")
+    actions = parser.add_subparsers(dest="action")
+    actions.required = True
+
+    stats = actions.add_parser("stats", help="p50/p95 duration per test")
+    stats.add_argument("--label", help="Only runs with this label")
+
+    slowest = actions.add_parser("slowest", help="Tests with the highest median duration")
+    slowest.add_argument("-n", type=int, default=20, help="Number of tests to show")
+    slowest.add_argument("--label", help="Only runs with this label")
+
+    regressions = actions.add_parser("regressions", help="Tests that got slower than in a baseline label")
+    regressions.add_argument("--baseline", required=True, help="Run label to compare against")
+    regressions.add_argument("--label", help="Run label to check (default: every other label)")
+    regressions.add_argument("--factor", type=float, default=1.5, help="Minimum slowdown ratio")
+    regressions.add_argument("--min-delta", type=float, default=0.1, help="Minimum slowdown in seconds")
+
+    flaky = actions.add_parser("flaky", help="Tests whose outcome flipped between runs with the same fingerprint")
+    flaky.add_argument("--label", help="Only runs with this label")
+
+    bulk_import = actions.add_parser("import", help="Import earlier reports/*.json files")
+    bulk_import.add_argument("paths", nargs="*", help="Report files (default: reports/*.json)")
+
+    args = parser.parse_args(argv)
+    helpers.USE_EMOJIS = False
+    store = HistoryStore(args.db)
+
+    if args.action == "import":
+        count = store.import_reports(args.paths or report_paths())
+        helpers.log_line("INFO", "Imported reports", count)
+    elif args.action in ("stats", "slowest"):
+        rows = store.percentiles(args.label) if args.action == "stats" else store.slowest(args.n, args.label)
+        print(f"{'TEST':<50} {'RUNS':>5} {'P50 (s)':>9} {'P95 (s)':>9} {'MAX (s)':>9}")
+        for name, runs, p50, p95, longest in rows:
+            print(f"{name:<50} {runs:>5} {p50:>9.3f} {p95:>9.3f} {longest:>9.3f}")
+    elif args.action == "flaky":
+        print(f"{'TEST':<50} {'FINGERPRINT':<12} {'RUNS':>5} {'PASS':>5} {'FAIL':>5} {'FLIPS':>6} LAST")
+        for name, fp, runs, passes, failures, flips, last in store.flaky(label=args.label):
+            print(f"{name:<50} {fp[:12]:<12} {runs:>5} {passes:>5} {failures:>5} {flips:>6} {last}")
+    else:
+        rows = store.regressions(args.baseline, args.label, factor=args.factor, min_delta_sec=args.min_delta)
+        print(f"{'TEST':<50} {'BASE P50':>9} {'P50':>9} {'RATIO':>7}")
+        for name, old, new, ratio in rows:
+            print(f"{name:<50} {old:>9.3f} {new:>9.3f} {ratio:>6.2f}x")
 
-    write_report(results, label=args.label, run_id=run_id)
-    generate_html_report(results, label=args.label, timestamp=run_id)
-    print_summary(results, label=args.label, output_dir="reports", run_id=run_id)
+    store.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,42 @@
+# File: unit_tests/conftest.py
+# ---
+# Shared pytest fixtures for the framework's own tests (tests/ holds YAML test
+# suites, which main.py runs; these are run with `python -m pytest unit_tests`).
+# The nzsql tests use the fake client in tools/fake_nzsql, so no appliance is
+# needed.
+import os
+import sys
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+FAKE_NZSQL_DIR = os.path.join(REPO_ROOT, "tools", "fake_nzsql")
+
+
+@pytest.fixture
+def fake_nzsql(monkeypatch):
+    """Puts the fake nzsql first on the PATH."""
+    monkeypatch.setenv("PATH", FAKE_NZSQL_DIR + os.pathsep + os.environ.get("PATH", ""))
+    monkeypatch.delenv("FAKE_NZSQL_CONNECT_DELAY", raising=False)
+    monkeypatch.delenv("FAKE_NZSQL_QUERY_DELAY", raising=False)
+
+
+@pytest.fixture
+def write_suite(tmp_path, monkeypatch):
+    """
+    Returns a function that writes files under tmp_path/tests from a
+    {relative path: text} dict (*.sh files are made executable) and returns
+    the tests directory. The working directory is tmp_path.
+    """
+    monkeypatch.chdir(tmp_path)
+
+    def write(files):
+        for rel_path, text in files.items():
+            path = tmp_path / "tests" / rel_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text)
+            if rel_path.endswith(".sh"):
+                path.chmod(0o755)
+        return os.path.join("tests")
+    return write
@@ -0,0 +1,86 @@
+# File: unit_tests/test_async_engine.py
+# ---
+# Tests of the asyncio engine: children run concurrently on one event loop,
+# and a child is killed with its whole process group when its timeout expires
+# or when the awaiting task is cancelled.
+import asyncio
+import os
+import time
+from core.loader import load_tests
+from core.runner import run_tests
+from executors.async_process import run_process_async
+
+
+def _running(pid):
+    """Whether a process is still alive a moment later; a killed grandchild may
+    stay a zombie until init reaps it."""
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                if f.read().rsplit(")", 1)[1].split()[0] == "Z":
+                    return False
+        except FileNotFoundError:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_output_and_returncode():
+    returncode, output, timed_out = asyncio.run(run_process_async("echo out; echo err >&2; exit 3", shell=True))
+    assert (returncode, timed_out) == (3, False)
+    assert output == "out\nerr\n"
+
+
+def test_children_run_concurrently():
+    async def run_all():
+        return await asyncio.gather(*(run_process_async(["sleep", "0.3"]) for _ in range(10)))
+
+    start = time.monotonic()
+    results = asyncio.run(run_all())
+    assert time.monotonic() - start < 2
+    assert [r[0] for r in results] == [0] * 10
+
+
+def test_timeout_kills_the_process_group(tmp_path):
+    pid_file = tmp_path / "grandchild.pid"
+    command = f"sleep 30 & echo $! > {pid_file}; wait"
+
+    start = time.monotonic()
+    returncode, output, timed_out = asyncio.run(run_process_async(command, shell=True, timeout=0.5))
+    assert time.monotonic() - start < 5
+    assert (returncode, timed_out) == (None, True)
+    assert "Timed out after 0.5s" in output
+    assert not _running(int(pid_file.read_text()))
+
+
+def test_cancelled_task_kills_its_child(tmp_path):
+    pid_file = tmp_path / "grandchild.pid"
+
+    async def cancel_soon():
+        task = asyncio.ensure_future(run_process_async(f"sleep 30 & echo $! > {pid_file}; wait", shell=True))
+        while not pid_file.exists() or not pid_file.read_text().strip():
+            await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(cancel_soon())
+    assert not _running(int(pid_file.read_text()))
+
+
+def test_run_tests_with_the_async_engine(write_suite):
+    files = {f"suite/t{idx}.sh": f"#!/bin/sh\necho test {idx}\n" for idx in range(4)}
+    files["suite/suite.yaml"] = "tests:\n" + "".join(f"  - name: t{idx}\n    command: t{idx}.sh\n" for idx in range(4))
+    files["suite/suite.yaml"] += "  - name: failing\n    command: missing.sh\n"
+    tests = load_tests(write_suite(files), use_cache=False)
+
+    results, output_dir, _ = run_tests(tests, output_dir_base="output", jobs=4, engine="async")
+
+    assert [r["name"] for r in results] == [f"suite/t{idx}" for idx in range(4)] + ["suite/failing"]
+    assert [r["status"] for r in results] == ["PASS"] * 4 + ["FAIL"]
+    with open(results[2]["output_file"]) as f:
+        assert f.read() == "test 2\n"
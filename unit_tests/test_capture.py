@@ -0,0 +1,97 @@
+# File: unit_tests/test_capture.py
+# ---
+# Tests of the streamed output capture: the full output goes to the log file
+# while only a head/tail excerpt and the counters are kept in memory, and the
+# child is killed when writing its output fails.
+import os
+import time
+import pytest
+from executors.capture import OutputCapture
+from executors.process import run_process
+
+
+def _capture(tmp_path, **kwargs):
+    return OutputCapture(str(tmp_path / "logs" / "test.log"), **kwargs)
+
+
+def test_small_output_is_kept_whole(tmp_path):
+    capture = _capture(tmp_path, head_bytes=16, tail_bytes=16)
+    for chunk in (b"one\n", b"two\n", b"three"):
+        capture.write(chunk)
+    capture.close()
+
+    assert capture.excerpt() == "one\ntwo\nthree"
+    assert capture.stats() == {'output_bytes': 13, 'output_lines': 3, 'output_truncated': False}
+    with open(capture.path, "rb") as f:
+        assert f.read() == b"one\ntwo\nthree"
+
+
+def test_output_between_head_and_tail_is_not_cut(tmp_path):
+    capture = _capture(tmp_path, head_bytes=4, tail_bytes=8)
+    capture.write(b"abcdef")
+    capture.write(b"ghij")
+    assert capture.excerpt() == "abcdefghij"
+    assert not capture.truncated
+
+
+def test_large_output_keeps_head_and_tail(tmp_path):
+    capture = _capture(tmp_path, head_bytes=10, tail_bytes=10)
+    data = b"".join(b"line %04d\n" % idx for idx in range(1000))
+    for start in range(0, len(data), 7):
+        capture.write(data[start:start + 7])
+    capture.close()
+
+    excerpt = capture.excerpt()
+    assert excerpt.startswith("line 0000\n\n... [9980 bytes omitted, full output in ")
+    assert excerpt.endswith("] ...\nline 0999\n")
+    assert capture.stats() == {'output_bytes': 10000, 'output_lines': 1000, 'output_truncated': True}
+    with open(capture.path, "rb") as f:
+        assert f.read() == data
+
+
+def test_chunk_larger_than_the_tail(tmp_path):
+    capture = _capture(tmp_path, head_bytes=2, tail_bytes=3)
+    capture.write(b"0123456789")
+    assert capture.excerpt().endswith("] ...\n789")
+
+
+def test_observer_sees_every_chunk(tmp_path):
+    class Observer:
+        def __init__(self):
+            self.chunks = []
+
+        def feed(self, chunk):
+            self.chunks.append(chunk)
+
+    observer = Observer()
+    capture = _capture(tmp_path, observer=observer)
+    capture.write(b"a")
+    capture.write(b"")
+    capture.write_text("b")
+    assert observer.chunks == [b"a", b"b"]
+
+
+def test_run_process_streams_to_the_capture(tmp_path):
+    capture = _capture(tmp_path, head_bytes=100, tail_bytes=100)
+    returncode, output, timed_out = run_process("seq 1 100000", shell=True, capture=capture)
+    capture.close()
+
+    assert (returncode, timed_out) == (0, False)
+    assert output == capture.excerpt()
+    assert capture.stats()["output_lines"] == 100000
+    assert os.path.getsize(capture.path) == capture.bytes_written
+
+
+def test_failing_capture_kills_the_child(tmp_path):
+    class FullDisk(OutputCapture):
+        def write(self, chunk):
+            raise OSError(28, "No space left on device")
+
+    pid_file = tmp_path / "child.pid"
+    capture = FullDisk(str(tmp_path / "test.log"))
+    start = time.monotonic()
+    with pytest.raises(OSError):
+        run_process(f"echo $$ > {pid_file}; echo started; sleep 30", shell=True, capture=capture)
+    assert time.monotonic() - start < 5
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
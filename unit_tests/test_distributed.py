@@ -0,0 +1,77 @@
+# File: unit_tests/test_distributed.py
+# ---
+# Tests of the coordinator/worker mode: local workers started by the
+# coordinator return one result per test, and the unit of a worker that died
+# is handed out again once its lease expires.
+import os
+import sys
+import threading
+import time
+import pytest
+from conftest import REPO_ROOT
+from core.distributed import WorkQueue, run_coordinator, run_worker
+from core.loader import load_tests
+
+
+@pytest.fixture
+def suite(tmp_path, monkeypatch):
+    """A tests/ tree of 4 files with 3 tests each, the last two chained; cwd is its parent."""
+    suite_dir = tmp_path / "tests" / "suite"
+    suite_dir.mkdir(parents=True)
+    script = suite_dir / "ok.sh"
+    script.write_text("#!/bin/sh\necho \"ran $0\"\n")
+    script.chmod(0o755)
+    for f in range(4):
+        (suite_dir / f"file{f}.yaml").write_text(
+            "tests:\n"
+            f"  - name: f{f}_a\n    command: ok.sh\n"
+            f"  - name: f{f}_b\n    command: ok.sh\n"
+            f"  - name: f{f}_c\n    command: ok.sh\n    depends_on_previous: true\n"
+        )
+    monkeypatch.chdir(tmp_path)
+    return load_tests(os.path.join("tests", "suite"), use_cache=False)
+
+
+def _wait_until_published(queue_dir):
+    queue = WorkQueue(queue_dir)
+    deadline = time.monotonic() + 30
+    while not queue.closed():
+        assert time.monotonic() < deadline, "the coordinator did not publish the run"
+        time.sleep(0.05)
+    return queue
+
+
+def test_coordinator_with_two_local_workers(suite):
+    worker_command = [sys.executable, os.path.join(REPO_ROOT, "main.py"), "--worker", "queue"]
+    results, output_dir, _ = run_coordinator(suite, "queue", output_dir_base="output",
+                                             worker_command=worker_command, spawn_workers=2)
+
+    assert [r["name"] for r in results] == [f"suite/{t['name']}" for t in suite]
+    assert [r["status"] for r in results] == ["PASS"] * len(suite)
+    workers = {WorkQueue("queue").result(name[:-len(".json")])["worker"] for name in os.listdir(os.path.join("queue", "results"))}
+    assert len(workers) <= 2
+    for result in results:
+        assert result["output_file"].startswith(output_dir)
+        assert os.path.exists(result["output_file"])
+
+
+def test_unit_of_a_dead_worker_is_requeued(suite):
+    coordinated = {}
+    coordinator = threading.Thread(target=lambda: coordinated.update(
+        results=run_coordinator(suite, "queue", output_dir_base="output", lease_sec=0.5)[0]))
+    coordinator.start()
+    try:
+        queue = _wait_until_published("queue")
+        # A worker claims a unit and dies without ever renewing its lease
+        dead_unit = queue.claim("deadhost-1")
+        assert dead_unit is not None
+
+        assert run_worker("queue") == len(os.listdir(os.path.join("queue", "results")))
+    finally:
+        coordinator.join(timeout=60)
+    assert not coordinator.is_alive()
+
+    results = coordinated["results"]
+    assert [r["status"] for r in results] == ["PASS"] * len(suite)
+    assert queue.result(dead_unit["id"])["worker"] != "deadhost-1"
+    assert os.listdir(os.path.join("queue", "claimed")) == []
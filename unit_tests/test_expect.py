@@ -0,0 +1,110 @@
+# File: unit_tests/test_expect.py
+# ---
+# Tests of `expect:` blocks: text, pattern, line and row checks on streamed
+# output split at any point, the normalized golden checksum, exit codes, and
+# tests run with an expectation that fails or an invalid block.
+import hashlib
+import pytest
+from core.expect import OutputExpectations, normalized_sha256
+from core.loader import load_tests
+from core.runner import run_tests
+
+OUTPUT = (b"LOAD started\n"
+          b" id | name \n"
+          b"----+------\n"
+          b"  42 | x  \r\n"
+          b"(1 row)\n"
+          b"Time: 12 ms\n"
+          b"LOAD OK\n")
+
+
+def _check(spec, output=OUTPUT, chunk_size=None, success=True, returncode=0, test_dir=""):
+    """Feeds the output in chunks of chunk_size bytes (all at once by default) and returns the failures."""
+    expectations = OutputExpectations(spec, test_dir)
+    step = chunk_size or len(output) or 1
+    for start in range(0, len(output), step):
+        expectations.feed(output[start:start + step])
+    return expectations.finish(success, returncode)
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 5])
+def test_expectations_hold_whatever_the_chunking(chunk_size):
+    spec = {"contains": ["LOAD OK", "started"], "not_contains": "ERROR", "regex": [r"^ +42 \| x\b"],
+            "not_regex": ["WARN(ING)?"], "lines": {"min": 5, "max": 7}, "rows": 1}
+    assert _check(spec, chunk_size=chunk_size) == []
+
+
+def test_failed_expectations_are_listed():
+    spec = {"contains": ["COMMIT"], "regex": ["^done$"], "not_contains": ["Time:"], "lines": 3, "rows": {"min": 2}}
+    assert _check(spec) == [
+        "output does not contain 'COMMIT'",
+        "no output line matches /^done$/",
+        "line 6 contains forbidden text 'Time:'",
+        "expected 3 lines, got 7",
+        "expected at least 2 rows, got 1",
+    ]
+
+
+def test_last_line_without_newline_is_counted():
+    assert _check({"lines": 2, "contains": "end"}, output=b"start\nend") == []
+
+
+def test_exit_code():
+    assert _check({}, success=False, returncode=3) == ["command exited with status 3"]
+    assert _check({"exit_code": 3}, success=False, returncode=3) == []
+    # Sessions have no exit status of their own
+    assert _check({"exit_code": 1}, success=False, returncode=None) == []
+    assert _check({"exit_code": 0}, success=True, returncode=2) == ["expected exit code 0, got 2"]
+
+
+def test_golden_ignores_trailing_whitespace_and_ignored_lines(tmp_path):
+    (tmp_path / "expected").mkdir()
+    golden = tmp_path / "expected" / "load.out"
+    golden.write_bytes(OUTPUT.replace(b"  \r\n", b"\n").replace(b"Time: 12 ms", b"Time: 99 ms") + b"\n\n")
+    spec = {"golden": "expected/load.out", "ignore_lines": ["^Time: "]}
+
+    assert _check(spec, chunk_size=3, test_dir=str(tmp_path)) == []
+    failures = _check(spec, output=OUTPUT.replace(b"42", b"43"), test_dir=str(tmp_path))
+    assert len(failures) == 1
+    assert "does not match golden file" in failures[0]
+
+
+def test_sha256_of_normalized_output(tmp_path):
+    normalized = b"a\n  b\n"
+    digest = hashlib.sha256(normalized).hexdigest()
+    assert _check({"sha256": digest.upper()}, output=b"a   \n  b\r\n\n\n") == []
+    (tmp_path / "out").write_bytes(b"a\t\n  b")
+    assert normalized_sha256(str(tmp_path / "out")) == digest
+
+
+@pytest.mark.parametrize("spec, message", [
+    (["contains"], "must be a mapping"),
+    ({"contain": "x"}, "unknown keys contain"),
+    ({"exit_code": True}, "exit_code must be an integer"),
+    ({"regex": ["("]}, "invalid pattern"),
+    ({"lines": {"least": 1}}, "lines must be a count"),
+    ({"contains": [1]}, "contains must be a string or a list of strings"),
+    ({"golden": "missing.out"}, "golden file missing.out not found"),
+])
+def test_invalid_blocks_are_rejected(spec, message):
+    with pytest.raises(ValueError, match=message):
+        OutputExpectations(spec)
+
+
+def test_tests_with_expect_blocks(write_suite):
+    test_dir = write_suite({
+        "suite/suite.yaml": (
+            "tests:\n"
+            "  - name: ok\n    command: out.sh\n    expect:\n      contains: LOAD OK\n      rows: 1\n"
+            "  - name: missing_text\n    command: out.sh\n    expect:\n      contains: COMMIT\n"
+            "  - name: failing_command_expected\n    command: fail.sh\n    expect:\n      exit_code: 2\n"
+            "  - name: invalid\n    command: out.sh\n    expect:\n      lines: many\n"
+        ),
+        "suite/out.sh": "#!/bin/sh\nprintf ' id \\n----\\n  1\\n(1 row)\\nLOAD OK\\n'\n",
+        "suite/fail.sh": "#!/bin/sh\nexit 2\n",
+    })
+    results, _, _ = run_tests(load_tests(test_dir, use_cache=False), output_dir_base="output")
+
+    assert [r["status"] for r in results] == ["PASS", "FAIL", "PASS", "ERROR"]
+    assert results[0]["expect_failures"] == []
+    assert results[1]["expect_failures"] == ["output does not contain 'COMMIT'"]
@@ -0,0 +1,139 @@
+# File: unit_tests/test_fast_spawn.py
+# ---
+# Tests of fast-spawn mode: which command lines run without a shell, direct
+# starts through posix_spawn, the shell fallback for builtins, scripts without
+# a #! line and missing commands, the shared environment snapshot, and test
+# results that are the same with and without the mode.
+import os
+import time
+import pytest
+from core.loader import load_tests
+from core.runner import run_tests
+from executors import process
+from executors.process import child_env, configure_fast_spawn, run_process, shell_free_args, spawn_process
+
+needs_posix_spawn = pytest.mark.skipif(not hasattr(os, "posix_spawnp"), reason="needs os.posix_spawnp")
+
+
+@pytest.fixture
+def fast_spawn():
+    configure_fast_spawn(True)
+    yield
+    configure_fast_spawn(False)
+
+
+def _spawned_with_popen(args, shell=True, env=None):
+    """Starts a command with spawn_process(), waits for it and returns whether Popen started it."""
+    pid, fd, proc = spawn_process(args, shell=shell, env=env)
+    try:
+        while os.read(fd, 65536):
+            pass
+    finally:
+        process.close_output(fd, proc)
+    process.wait_process(pid, proc)
+    return proc is not None
+
+
+@pytest.mark.parametrize("command, expected", [
+    ("scripts/load.sh --rows 10", ["scripts/load.sh", "--rows", "10"]),
+    ("  ls   -l  ", ["ls", "-l"]),
+    ("grep x file | wc -l", None),
+    ("FOO=1 run.sh", None),
+    ("echo $HOME", None),
+    ("cat 'a b'", None),
+    ("ls *.sql", None),
+    ("run.sh > out.txt", None),
+    ("echo hello", None),
+    ("cd /tmp", None),
+    ("", None),
+])
+def test_shell_free_args(command, expected):
+    assert shell_free_args(command) == expected
+
+
+@needs_posix_spawn
+def test_plain_commands_skip_popen(fast_spawn, tmp_path):
+    assert not _spawned_with_popen("ls -d /")
+    assert not _spawned_with_popen(["ls", "-d", "/"], shell=False)
+    assert _spawned_with_popen("ls -d / | cat")
+    assert _spawned_with_popen("echo builtin")
+    # posix_spawnp() would search this process's PATH, not the child's
+    assert _spawned_with_popen("ls -d /", env=child_env({"PATH": f"{tmp_path}{os.pathsep}/bin:/usr/bin"}))
+
+
+def test_mode_off_always_uses_popen():
+    assert _spawned_with_popen("ls -d /")
+
+
+@needs_posix_spawn
+def test_commands_that_cannot_start_directly_fall_back_to_the_shell(fast_spawn, tmp_path):
+    script = tmp_path / "no_shebang.sh"
+    script.write_text("echo from the shell\n")
+    script.chmod(0o755)
+    assert run_process(str(script), shell=True)[:2] == (0, "from the shell\n")
+
+    returncode, output, _ = run_process("no-such-command-xyz --flag", shell=True)
+    assert returncode == 127
+    assert "not found" in output
+    # Without a shell there is nothing to fall back to
+    with pytest.raises(FileNotFoundError):
+        run_process(["no-such-command-xyz"])
+
+
+@needs_posix_spawn
+def test_direct_children_are_killed_on_timeout(fast_spawn):
+    start = time.monotonic()
+    returncode, output, timed_out = run_process("sleep 5", shell=True, timeout=0.3)
+    assert time.monotonic() - start < 3
+    assert (returncode, timed_out) == (None, True)
+    assert "Timed out after 0.3s" in output
+
+
+def test_environment_snapshot(fast_spawn, monkeypatch):
+    snapshot = child_env()
+    assert child_env() is snapshot
+    assert child_env({}) is snapshot
+
+    env = child_env({"NZTEST_EXTRA": "1"})
+    assert env is not snapshot
+    assert env["NZTEST_EXTRA"] == "1"
+    assert "NZTEST_EXTRA" not in snapshot
+
+    # The snapshot does not follow later changes of os.environ
+    monkeypatch.setenv("NZTEST_LATER", "1")
+    assert "NZTEST_LATER" not in child_env()
+    configure_fast_spawn(False)
+    assert child_env()["NZTEST_LATER"] == "1"
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_results_are_the_same_with_fast_spawn(write_suite, engine):
+    test_dir = write_suite({
+        "s/s.yaml": (
+            "tests:\n"
+            "  - name: shebang\n    command: with_shebang.sh one two\n"
+            "  - name: no_shebang\n    command: no_shebang.sh\n"
+            "  - name: syntax\n    command: with_shebang.sh piped | tr a-z A-Z\n"
+            "  - name: failing\n    command: fail.sh\n"
+        ),
+        "s/with_shebang.sh": "#!/bin/sh\necho \"args: $*\"\n",
+        "s/no_shebang.sh": "echo plain script\n",
+        "s/fail.sh": "#!/bin/sh\necho failing\nexit 4\n",
+    })
+    runs = []
+    for enabled in (False, True):
+        configure_fast_spawn(enabled)
+        try:
+            results, _, _ = run_tests(load_tests(test_dir, use_cache=False), output_dir_base=f"output{enabled}",
+                                      engine=engine)
+        finally:
+            configure_fast_spawn(False)
+        outputs = []
+        for result in results:
+            with open(result["output_file"]) as f:
+                outputs.append(f.read())
+        runs.append(([r["status"] for r in results], outputs, [r["cpu_user_sec"] is not None for r in results]))
+
+    assert runs[0] == runs[1]
+    assert runs[1][0] == ["PASS", "PASS", "PASS", "FAIL"]
+    assert runs[1][1][:3] == ["args: one two\n", "plain script\n", "ARGS: PIPED\n"]
@@ -0,0 +1,105 @@
+# File: unit_tests/test_fixtures.py
+# ---
+# Tests of setup and teardown fixtures: file, directory and run scopes each set
+# up once, variables exported by sourced bash setups and through $NZTEST_ENV,
+# teardowns after the last test of their scope, and the tests of a scope whose
+# setup failed reported as ERROR.
+import pytest
+from core.fixtures import FixtureManager
+from core.loader import load_tests
+from core.runner import run_tests
+
+# Every fixture appends its name to events.txt in the working directory
+SUITE = {
+    "fixtures.yaml": (
+        "setup:\n  - name: global\n    command: global.sh\n    scope: run\n"
+        "teardown:\n  - name: global_down\n    command: log.sh global_down\n    scope: run\n"
+    ),
+    "global.sh": "echo global >> events.txt\nexport GLOBAL=g1\n",
+    "log.sh": "echo \"$1\" >> events.txt\n",
+    "a/fixtures.yaml": (
+        "setup:\n  - name: dir_setup\n    command: dir.sh\n"
+        "teardown:\n  - name: dir_down\n    command: ../log.sh dir_down\n"
+    ),
+    "a/dir.sh": "echo dir_setup >> events.txt\necho \"DIRVAR=d1\" >> \"$NZTEST_ENV\"\n",
+    "a/a1.yaml": (
+        "setup:\n  - name: file_setup\n    command: file.sh\n"
+        "tests:\n"
+        "  - name: t1\n    command: show.sh\n"
+        "  - name: t2\n    command: show.sh\n"
+    ),
+    "a/file.sh": "echo file_setup >> events.txt\nexport FILEVAR=\"$GLOBAL-f1\"\n",
+    "a/a2.yaml": "tests:\n  - name: t3\n    command: show.sh\n",
+    "a/show.sh": "#!/bin/sh\necho \"GLOBAL=$GLOBAL DIRVAR=$DIRVAR FILEVAR=$FILEVAR\"\n",
+    "b/b.yaml": (
+        "setup:\n  - name: broken\n    command: broken.sh\n"
+        "teardown:\n  - name: b_down\n    command: ../log.sh b_down\n"
+        "tests:\n"
+        "  - name: t4\n    command: show.sh\n"
+        "  - name: t5\n    command: show.sh\n"
+    ),
+    "b/broken.sh": "echo broken >> events.txt\nfalse\n",
+    "b/show.sh": "#!/bin/sh\necho never\n",
+}
+
+
+def _events(tmp_path):
+    return (tmp_path / "events.txt").read_text().split()
+
+
+def _output(result):
+    with open(result["output_file"]) as f:
+        return f.read().strip()
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_scopes_are_set_up_once_and_torn_down_last(write_suite, tmp_path, engine):
+    tests = load_tests(write_suite(SUITE), use_cache=False)
+    results, _, _ = run_tests(tests, output_dir_base="output", jobs=4, engine=engine)
+    by_name = {r["name"]: r for r in results}
+
+    events = _events(tmp_path)
+    assert sorted(events) == sorted(["global", "dir_setup", "file_setup", "broken",
+                                     "dir_down", "b_down", "global_down"])
+    assert events[0] == "global"
+    assert events[-1] == "global_down"
+    assert events.index("dir_setup") < events.index("file_setup") < events.index("dir_down")
+
+    assert _output(by_name["a/t1"]) == "GLOBAL=g1 DIRVAR=d1 FILEVAR=g1-f1"
+    assert _output(by_name["a/t2"]) == "GLOBAL=g1 DIRVAR=d1 FILEVAR=g1-f1"
+    assert _output(by_name["a/t3"]) == "GLOBAL=g1 DIRVAR=d1 FILEVAR="
+    assert [by_name[f"a/t{n}"]["status"] for n in (1, 2, 3)] == ["PASS"] * 3
+
+
+def test_failed_setup_reports_its_tests_as_error(write_suite, tmp_path):
+    tests = load_tests(write_suite(SUITE), use_cache=False)
+    results, output_dir, _ = run_tests(tests, output_dir_base="output", jobs=2)
+    by_name = {r["name"]: r for r in results}
+
+    assert by_name["b/t4"]["status"] == by_name["b/t5"]["status"] == "ERROR"
+    assert "Setup fixture b/broken failed" in _output(by_name["b/t4"])
+    assert "never" not in _output(by_name["b/t5"])
+    # The setup ran once for both tests and its log is kept
+    assert _events(tmp_path).count("broken") == 1
+    assert (tmp_path / output_dir / "b" / "b.broken.setup.log").exists()
+
+
+def test_skipped_scope_is_not_set_up(write_suite, tmp_path):
+    tests = load_tests(write_suite(SUITE), use_cache=False)
+    tests = [dict(test, skip=True) if test["name"] != "t3" else test for test in tests]
+    run_tests(tests, output_dir_base="output")
+
+    assert _events(tmp_path) == ["global", "dir_setup", "dir_down", "global_down"]
+
+
+@pytest.mark.parametrize("declaration, message", [
+    ("setup:\n  - command: x.sh\n", "every setup fixture needs a name"),
+    ("setup:\n  - name: s\n    command: x.sh\n    scope: session\n", "unknown scope 'session'"),
+    ("teardown:\n  - name: s\n    command: x.sh\n    when: always\n", "unknown keys when"),
+    ("setup: s.sh\n", "setup must be a list of fixtures"),
+])
+def test_invalid_fixtures_are_rejected(write_suite, declaration, message):
+    tests = load_tests(write_suite({"c/c.yaml": declaration + "tests:\n  - name: t\n    command: x.sh\n"}),
+                       use_cache=False)
+    with pytest.raises(ValueError, match=message):
+        FixtureManager(tests, "output")
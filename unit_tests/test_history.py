@@ -0,0 +1,102 @@
+# File: unit_tests/test_history.py
+# ---
+# Tests of the duration history database: recording results, the percentile,
+# slowest-test and regression queries, importing earlier reports, and
+# upgrading a database created before the fingerprint and attempts columns.
+import json
+import sqlite3
+import pytest
+from core.history import HistoryRecorder, HistoryStore, percentile
+
+
+@pytest.fixture
+def store(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.sqlite"))
+    yield history
+    history.close()
+
+
+def _record(store, run_id, label, durations, status="PASS"):
+    for name, duration in durations.items():
+        store.record(run_id, label, {"name": name, "status": status, "duration_sec": duration})
+
+
+def test_percentile_is_nearest_rank():
+    values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert percentile(values, 50) == 5
+    assert percentile(values, 95) == 10
+    assert percentile([4.0], 50) == 4.0
+    assert percentile([], 50) == 0.0
+
+
+def test_durations_only_count_timed_results(store):
+    _record(store, "r1", "nightly", {"a": 2.0, "b": 1.0})
+    _record(store, "r2", "nightly", {"a": 1.0})
+    _record(store, "r3", "nightly", {"a": 9.0}, status="SKIPPED")
+    _record(store, "r4", "nightly", {"b": 3.0}, status="TIMEOUT")
+
+    assert store.durations() == {"a": [1.0, 2.0], "b": [1.0, 3.0]}
+
+
+def test_recording_a_result_twice_keeps_the_first(store):
+    _record(store, "r1", "nightly", {"a": 2.0})
+    _record(store, "r1", "nightly", {"a": 5.0})
+    assert store.durations() == {"a": [2.0]}
+
+
+def test_percentiles_and_slowest(store):
+    for run in range(10):
+        _record(store, f"r{run}", "nightly", {"fast": 0.1, "steady": 1.0, "spiky": 5.0 if run == 9 else 0.5})
+
+    rows = store.percentiles()
+    assert [row[0] for row in rows] == ["spiky", "steady", "fast"]
+    assert rows[0] == ("spiky", 10, 0.5, 5.0, 5.0)
+    assert [row[0] for row in store.slowest(2)] == ["steady", "spiky"]
+
+
+def test_regressions_compare_median_against_a_baseline(store):
+    for run in range(3):
+        _record(store, f"b{run}", "release-1.4", {"grew": 1.0, "same": 1.0, "tiny": 0.01})
+        _record(store, f"n{run}", "nightly", {"grew": 2.0, "same": 1.1, "tiny": 0.05, "new": 3.0})
+
+    rows = store.regressions("release-1.4")
+    assert rows == [("grew", 1.0, 2.0, 2.0)]
+    assert store.regressions("release-1.4", label="nightly", factor=1.05) == [
+        ("grew", 1.0, 2.0, 2.0), ("same", 1.0, 1.1, pytest.approx(1.1)),
+    ]
+
+
+def test_import_reports(store, tmp_path):
+    reports = tmp_path / "reports"
+    reports.mkdir()
+    (reports / "20250101_010101_nightly.json").write_text(json.dumps([{"name": "a", "status": "PASS", "duration_sec": 1.5}]))
+    (reports / "20250102_010101_nightly.json").write_text(json.dumps([{"name": "a", "status": "PASS", "duration_sec": 2.5}]))
+    (reports / "notes.json").write_text("[]")
+    (reports / "20250103_010101_broken.json").write_text("{")
+
+    assert store.import_reports(sorted(str(p) for p in reports.iterdir())) == 2
+    assert store.durations("nightly") == {"a": [1.5, 2.5]}
+
+
+def test_recorder_appends_results_as_they_finish(store):
+    recorder = HistoryRecorder(store)
+    recorder.run_started("r1", "nightly", [])
+    recorder.test_finished({"name": "a", "status": "FAIL", "duration_sec": 0.4, "fingerprint": "f1", "attempts": 2})
+    assert store.durations("nightly") == {"a": [0.4]}
+
+
+def test_database_of_an_earlier_version_is_upgraded(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE results (run_id TEXT NOT NULL, label TEXT NOT NULL, name TEXT NOT NULL, executor TEXT, "
+                 "status TEXT, duration_sec REAL, output_bytes INTEGER, recorded_at TEXT, UNIQUE (run_id, label, name))")
+    conn.execute("INSERT INTO results (run_id, label, name, status, duration_sec) VALUES ('r0', 'old', 'a', 'PASS', 1.0)")
+    conn.commit()
+    conn.close()
+
+    store = HistoryStore(path)
+    try:
+        store.record("r1", "new", {"name": "a", "status": "PASS", "duration_sec": 2.0, "fingerprint": "f", "attempts": 1})
+        assert store.durations() == {"a": [1.0, 2.0]}
+    finally:
+        store.close()
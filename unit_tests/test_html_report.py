@@ -0,0 +1,75 @@
+# File: unit_tests/test_html_report.py
+# ---
+# Tests of the HTML reports: the "index" layout keeps the outputs out of the
+# page, in chunk files loaded on demand, and the "full" layout renders one row
+# per test, including the resource usage columns.
+import json
+import os
+import pytest
+from utils import report_utils
+from utils.report_utils import INDEX_COLUMNS, generate_html_report
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def _results(count):
+    return [
+        {"name": f"suite/t{idx:03d}", "status": "FAIL" if idx % 10 == 0 else "PASS", "duration_sec": 0.5,
+         "executor": "bash", "output": f"output of test {idx}", "output_file": f"output/run/suite/t{idx:03d}.log",
+         "output_lines": 1, "output_bytes": 20, "description": f"test {idx}"}
+        for idx in range(count)
+    ]
+
+
+def _script_data(path, prefix):
+    with open(path) as f:
+        text = f.read()
+    assert text.startswith(prefix) and text.endswith(");\n")
+    return json.loads(text[len(prefix):-len(");\n")])
+
+
+def test_index_layout_splits_outputs_into_chunks(monkeypatch):
+    monkeypatch.setattr(report_utils, "CHUNK_TESTS", 100)
+    results = _results(250)
+
+    page = generate_html_report(iter(results), label="nightly", timestamp="20250101_000000", mode="index")
+
+    assert page == os.path.join("reports", "20250101_000000_nightly.html")
+    data_dir = os.path.join("reports", "20250101_000000_nightly_data")
+    assert sorted(os.listdir(data_dir)) == ["outputs_00000.js", "outputs_00001.js", "outputs_00002.js", "rows.js"]
+
+    rows = _script_data(os.path.join(data_dir, "rows.js"), "nzReport.rows(")
+    assert rows["columns"] == INDEX_COLUMNS
+    assert rows["chunkTests"] == 100
+    assert len(rows["rows"]) == 250
+    assert rows["rows"][42][:2] == ["suite/t042", "PASS"]
+
+    last = _script_data(os.path.join(data_dir, "outputs_00002.js"), "nzReport.outputs(2,")
+    assert sorted(last, key=int) == [str(idx) for idx in range(200, 250)]
+    assert last["249"] == "output of test 249"
+
+    with open(page) as f:
+        html = f.read()
+    assert "output of test" not in html
+    assert "20250101_000000_nightly_data/rows.js" in html
+
+
+def test_full_layout_renders_every_result():
+    results = _results(3)
+    results[1].update(cpu_user_sec=0.25, cpu_sys_sec=0.125, max_rss_kb=2048, io_in_blocks=1, io_out_blocks=2,
+                      ctx_voluntary=3, ctx_involuntary=4)
+    results[2].update(log_archived=True)
+
+    page = generate_html_report(iter(results), label="nightly", timestamp="20250101_000000")
+
+    with open(page) as f:
+        html = f.read()
+    assert html.count('<tr class="PASS">') == 2
+    assert html.count('<tr class="FAIL">') == 1
+    assert "0.250 / 0.125" in html
+    assert "<td>2048</td>" in html
+    assert html.count("not measured") == 2
+    assert "output/run/suite/t002.log.ref" in html
@@ -0,0 +1,111 @@
+# File: unit_tests/test_loader_cache.py
+# ---
+# Tests of the parsed-test cache of core/loader.py: unchanged files are not
+# parsed again, edited files are, touched files only refresh their stat key,
+# and entries of deleted files are dropped.
+import os
+import pickle
+import pytest
+from core import loader
+from core.loader import CACHE_PATH, load_tests
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Records the YAML texts parsed by the loader."""
+    parsed = []
+    parse = loader._parse_yaml
+
+    def counting_parse(data):
+        parsed.append(data)
+        return parse(data)
+    monkeypatch.setattr(loader, "_parse_yaml", counting_parse)
+    return parsed
+
+
+def _yaml(*names):
+    return "tests:\n" + "".join(f"  - name: {name}\n    command: ok.sh\n" for name in names)
+
+
+def _names(tests):
+    return [test["name"] for test in tests]
+
+
+def test_unchanged_files_are_read_from_the_cache(write_suite, parses):
+    tests_dir = write_suite({"a/one.yaml": _yaml("a1", "a2"), "b/two.yaml": _yaml("b1")})
+    first = load_tests(tests_dir)
+    assert len(parses) == 2
+
+    second = load_tests(tests_dir)
+    assert len(parses) == 2
+    assert second == first
+    assert sorted(_names(second)) == ["a1", "a2", "b1"]
+    assert {test["__file__"] for test in second if test["name"] == "a1"} == {os.path.join("tests", "a", "one.yaml")}
+
+
+def test_edited_file_is_parsed_again(write_suite, parses):
+    tests_dir = write_suite({"a/one.yaml": _yaml("a1"), "b/two.yaml": _yaml("b1")})
+    load_tests(tests_dir)
+
+    path = os.path.join(tests_dir, "a", "one.yaml")
+    st = os.stat(path)
+    with open(path, "w") as f:
+        f.write(_yaml("a1", "a_new"))
+    # Same mtime as before, as on a coarse-grained file system: the size differs
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    assert sorted(_names(load_tests(tests_dir))) == ["a1", "a_new", "b1"]
+    assert len(parses) == 3
+
+
+def test_touched_file_is_not_parsed_again(write_suite, parses):
+    tests_dir = write_suite({"a/one.yaml": _yaml("a1")})
+    load_tests(tests_dir)
+    path = os.path.join(tests_dir, "a", "one.yaml")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+
+    assert _names(load_tests(tests_dir)) == ["a1"]
+    assert len(parses) == 1
+    # The new mtime was stored, so the next run skips hashing as well
+    with open(CACHE_PATH, "rb") as f:
+        entry = pickle.load(f)["entries"][path]
+    assert entry["mtime_ns"] == os.stat(path).st_mtime_ns
+
+
+def test_deleted_file_is_dropped_from_the_cache(write_suite):
+    tests_dir = write_suite({"a/one.yaml": _yaml("a1"), "a/two.yaml": _yaml("a2")})
+    load_tests(tests_dir)
+    os.remove(os.path.join(tests_dir, "a", "two.yaml"))
+    write_suite({"a/three.yaml": _yaml("a3")})
+
+    assert sorted(_names(load_tests(tests_dir))) == ["a1", "a3"]
+    with open(CACHE_PATH, "rb") as f:
+        entries = pickle.load(f)["entries"]
+    assert sorted(os.path.basename(path) for path in entries) == ["one.yaml", "three.yaml"]
+
+
+def test_cache_of_another_version_is_ignored(write_suite, parses):
+    tests_dir = write_suite({"a/one.yaml": _yaml("a1")})
+    load_tests(tests_dir)
+    with open(CACHE_PATH, "rb") as f:
+        cache = pickle.load(f)
+    cache["version"] = -1
+    with open(CACHE_PATH, "wb") as f:
+        pickle.dump(cache, f)
+
+    assert _names(load_tests(tests_dir)) == ["a1"]
+    assert len(parses) == 2
+
+
+def test_corrupt_cache_is_ignored(write_suite):
+    tests_dir = write_suite({"a/one.yaml": _yaml("a1")})
+    load_tests(tests_dir)
+    with open(CACHE_PATH, "wb") as f:
+        f.write(b"not a pickle")
+    assert _names(load_tests(tests_dir)) == ["a1"]
+
+
+def test_many_changed_files_are_parsed_in_worker_processes(write_suite, monkeypatch):
+    monkeypatch.setattr(loader, "PARALLEL_PARSE_MIN_FILES", 4)
+    tests_dir = write_suite({f"d/f{idx:02d}.yaml": _yaml(f"t{idx:02d}") for idx in range(10)})
+    assert sorted(_names(load_tests(tests_dir))) == [f"t{idx:02d}" for idx in range(10)]
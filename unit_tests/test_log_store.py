@@ -0,0 +1,132 @@
+# File: unit_tests/test_log_store.py
+# ---
+# Tests of the archived log store: identical logs stored once and read back
+# through their reference files, and the garbage collector that removes old
+# runs, then the objects no remaining run references, but never the newest run
+# or an object archived moments ago.
+import os
+import pytest
+from core import log_store
+from core.log_store import LogStore, collect_garbage, open_log, read_log
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return LogStore(os.path.join("output", ".store"), codec="gz")
+
+
+def _write_run(key, logs):
+    """Writes output/<key>/<name>.log for each {name: text} and reports/<key>.json."""
+    run_dir = os.path.join("output", key)
+    os.makedirs(run_dir, exist_ok=True)
+    paths = []
+    for name, text in logs.items():
+        path = os.path.join(run_dir, f"{name}.log")
+        with open(path, "w") as f:
+            f.write(text)
+        paths.append(path)
+    os.makedirs("reports", exist_ok=True)
+    with open(os.path.join("reports", f"{key}.json"), "w") as f:
+        f.write("[]")
+    return paths
+
+
+def _objects(root=os.path.join("output", ".store", "objects")):
+    return sorted(name for _, _, files in os.walk(root) for name in files)
+
+
+def _age_objects(seconds):
+    for root, _, files in os.walk(os.path.join("output", ".store", "objects")):
+        for name in files:
+            path = os.path.join(root, name)
+            old = os.stat(path).st_mtime - seconds
+            os.utime(path, (old, old))
+
+
+def test_identical_logs_are_stored_once(store):
+    paths = _write_run("20260101_000000_nightly", {"a": "same output\n" * 100, "b": "same output\n" * 100,
+                                                   "c": "other\n"})
+    digests = [store.archive(path) for path in paths]
+
+    assert digests[0] == digests[1] != digests[2]
+    assert _objects() == sorted(f"{d}.gz" for d in set(digests))
+    for path in paths:
+        assert not os.path.exists(path)
+        assert os.path.exists(path + ".ref")
+    assert read_log(paths[0]) == "same output\n" * 100
+    with open_log(paths[2]) as f:
+        assert f.read() == b"other\n"
+
+
+def test_plain_logs_are_read_as_is(store):
+    path = _write_run("20260101_000000_nightly", {"a": "plain\n"})[0]
+    assert read_log(path) == "plain\n"
+    with pytest.raises(OSError):
+        open_log(path + ".missing")
+
+
+def test_unknown_codec_is_rejected(store):
+    with pytest.raises(ValueError, match="Unknown log codec 'xz'"):
+        LogStore(codec="xz")
+    if log_store.zstandard is None:
+        with pytest.raises(ValueError, match="needs the zstandard package"):
+            LogStore(codec="zst")
+
+
+def test_gc_keeps_the_newest_runs_and_their_objects(store):
+    shared = "shared\n" * 50
+    for day, own in ((1, "one\n"), (2, "two\n"), (3, "three\n")):
+        for path in _write_run(f"2026010{day}_000000_nightly", {"shared": shared, "own": own}):
+            store.archive(path)
+    _age_objects(2 * log_store.GC_GRACE_SEC)
+
+    stats = collect_garbage(keep=2)
+
+    assert stats["removed_runs"] == ["20260101_000000_nightly"]
+    assert stats["kept_runs"] == 2
+    assert stats["removed_objects"] == 1
+    assert sorted(os.listdir("output")) == [".store", "20260102_000000_nightly", "20260103_000000_nightly"]
+    assert sorted(os.listdir("reports")) == ["20260102_000000_nightly.json", "20260103_000000_nightly.json"]
+    assert len(_objects()) == 3
+    assert read_log(os.path.join("output", "20260102_000000_nightly", "shared.log")) == shared
+
+
+def test_gc_max_bytes_never_removes_the_newest_run(store):
+    for day in (1, 2, 3):
+        for path in _write_run(f"2026010{day}_000000_nightly", {"big": f"{day}" * 10000}):
+            store.archive(path)
+    _age_objects(2 * log_store.GC_GRACE_SEC)
+
+    stats = collect_garbage(max_bytes=1)
+
+    assert stats["removed_runs"] == ["20260101_000000_nightly", "20260102_000000_nightly"]
+    assert stats["kept_runs"] == 1
+    assert len(_objects()) == 1
+    assert read_log(os.path.join("output", "20260103_000000_nightly", "big.log")) == "3" * 10000
+
+
+def test_gc_spares_recent_unreferenced_objects(store):
+    path = _write_run("20260101_000000_nightly", {"a": "a\n"})[0]
+    store.archive(path)
+    # A test archived its log but its reference is not written yet
+    os.remove(path + ".ref")
+
+    assert collect_garbage()["removed_objects"] == 0
+    assert len(_objects()) == 1
+    _age_objects(2 * log_store.GC_GRACE_SEC)
+    assert collect_garbage()["removed_objects"] == 1
+    assert _objects() == []
+
+
+def test_gc_dry_run_removes_nothing(store):
+    for day in (1, 2):
+        store.archive(_write_run(f"2026010{day}_000000_nightly", {"a": f"{day}\n"})[0])
+    _age_objects(2 * log_store.GC_GRACE_SEC)
+
+    stats = collect_garbage(keep=1, dry_run=True)
+    assert stats["removed_runs"] == ["20260101_000000_nightly"]
+    assert stats["removed_objects"] == 1
+    assert stats["freed_bytes"] > 0
+    assert len(os.listdir("reports")) == 2
+    assert len(_objects()) == 2
@@ -0,0 +1,95 @@
+# File: unit_tests/test_logger.py
+# ---
+# Tests of the buffered console logger: lines queued from parallel threads are
+# written whole and in order with plain log_text() lines, and the JSON log
+# gets one event per line tagged with the test and worker of log_context().
+import json
+import threading
+import pytest
+from utils import helpers
+from utils.helpers import configure_json_log, flush_log, log_context, log_line, log_text
+
+
+@pytest.fixture
+def json_log(tmp_path):
+    """Path of a JSON log configured for the test; the log is closed afterwards."""
+    path = tmp_path / "logs" / "events.jsonl"
+    configure_json_log(str(path))
+    yield path
+    configure_json_log(None)
+
+
+def _events(path):
+    flush_log()
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_lines_from_parallel_threads_do_not_interleave(capsys):
+    def log_many(thread_id):
+        for idx in range(200):
+            log_line("INFO", f"thread{thread_id}", f"line {idx} " + "x" * 50)
+
+    threads = [threading.Thread(target=log_many, args=(t,)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    flush_log()
+
+    lines = [line for line in capsys.readouterr().out.splitlines() if "thread" in line]
+    assert len(lines) == 8 * 200
+    for line in lines:
+        assert line.endswith("x" * 50)
+        assert line.count(" : ") == 1
+    for t in range(8):
+        own = [line for line in lines if f"thread{t} " in line]
+        assert [int(line.split("line ")[1].split()[0]) for line in own] == list(range(200))
+
+
+def test_log_text_keeps_its_place(capsys):
+    log_line("START", "first")
+    log_text("plain text")
+    log_line("SUMMARY", "last")
+    flush_log()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert "first" in lines[0]
+    assert lines[1] == "plain text"
+    assert "last" in lines[2]
+
+
+def test_timestamp_is_formatted_once_per_second():
+    first = helpers._timestamp(1000.1)
+    assert helpers._timestamp(1000.9) is first
+    assert helpers._timestamp(1001.0) != first
+
+
+def test_json_log_events_carry_test_and_worker(json_log):
+    with log_context(test="suite/a", worker="host-1/w0"):
+        log_line("RUN", "Running test", "suite/a")
+        with log_context(test="suite/b"):
+            log_line("SUCCESS", "  Passed  ", 3)
+    log_line("SUMMARY", "Done")
+
+    events = _events(json_log)
+    assert [e["event"] for e in events] == ["RUN", "SUCCESS", "SUMMARY"]
+    assert events[0]["test"] == "suite/a"
+    assert events[0]["worker"] == "host-1/w0"
+    assert events[0]["value"] == "suite/a"
+    assert events[1]["test"] == "suite/b"
+    assert events[1]["worker"] == "host-1/w0"
+    assert events[1]["label"] == "Passed"
+    assert events[1]["value"] == 3
+    assert events[2]["test"] is None
+    assert events[2]["worker"] == threading.current_thread().name
+    assert all(isinstance(e["ts"], float) for e in events)
+
+
+def test_plain_text_and_closed_log_are_not_recorded(json_log):
+    log_text("not an event")
+    log_line("INFO", "recorded")
+    configure_json_log(None)
+    log_line("INFO", "after close")
+    flush_log()
+
+    assert [e["label"] for e in _events(json_log)] == ["recorded"]
@@ -0,0 +1,97 @@
+# File: unit_tests/test_metrics.py
+# ---
+# Tests of the live run metrics: counters and ETA kept by RunMetrics, the
+# Prometheus endpoint, a port already in use, and the progress bar.
+import io
+import socket
+import types
+import urllib.request
+import pytest
+from core import metrics as metrics_module
+from core.metrics import MetricsServer, ProgressBar, RunMetrics
+
+
+def _tests(*names):
+    return [{"name": name, "__file__": "tests/suite/suite.yaml"} for name in names]
+
+
+def _result(name, status="PASS", duration=1.0, executor="bash"):
+    return {"name": f"suite/{name}", "status": status, "duration_sec": duration, "executor": executor}
+
+
+@pytest.fixture
+def metrics():
+    run = RunMetrics({"suite/a": 10.0, "suite/b": 30.0})
+    run.run_started("20250101_000000", "nightly", _tests("a", "b", "c", "d"))
+    return run
+
+
+def test_counters_follow_the_run(metrics):
+    metrics.test_started(_tests("a")[0])
+    metrics.test_started(_tests("b")[0])
+    metrics.test_finished(_result("a", duration=0.3))
+    metrics.test_finished(_result("c", "SKIPPED", duration=0))
+
+    snap = metrics.snapshot()
+    assert (snap["total"], snap["done"], snap["in_flight"], snap["pending"]) == (4, 2, 0, 2)
+    assert snap["completed"] == {"PASS": 1, "SKIPPED": 1}
+    # Skipped tests are not timed
+    assert snap["histograms"] == {"bash": ([0, 1, 1, 1, 1, 1, 1, 1, 1], [1, 0.3])}
+
+
+def test_eta_scales_the_remaining_estimated_work(metrics, monkeypatch):
+    # a: 10s, b: 30s, c and d: the median of the history (30s) => 100s of work
+    clock = iter([100.0, 120.0])
+    monkeypatch.setattr(metrics_module, "time", types.SimpleNamespace(monotonic=lambda: next(clock)))
+    metrics.run_started("20250101_000000", "nightly", _tests("a", "b", "c", "d"))
+    metrics.test_finished(_result("a", duration=10.0))
+    metrics.test_finished(_result("b", duration=30.0))
+
+    # 40s of estimated work took 20s: the 60s left should take 30s
+    assert metrics.snapshot()["eta"] == pytest.approx(30.0)
+
+
+def test_prometheus_text(metrics):
+    metrics.test_finished(_result("a", "FAIL", duration=2.0, executor="nzsql"))
+    text = metrics.prometheus()
+
+    assert 'nztest_run_info{run_id="20250101_000000",label="nightly"} 1' in text
+    assert "nztest_tests 4" in text
+    assert 'nztest_tests_completed_total{status="FAIL"} 1' in text
+    assert 'nztest_test_duration_seconds_bucket{executor="nzsql",le="1"} 0' in text
+    assert 'nztest_test_duration_seconds_bucket{executor="nzsql",le="5"} 1' in text
+    assert 'nztest_test_duration_seconds_bucket{executor="nzsql",le="+Inf"} 1' in text
+    assert 'nztest_test_duration_seconds_sum{executor="nzsql"} 2.000000' in text
+    assert text.endswith("\n")
+
+
+def test_server_serves_the_metrics(metrics):
+    server = MetricsServer(metrics, 0).start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "nztest_tests 4" in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{server.port}/other", timeout=5)
+    finally:
+        server.close()
+
+
+def test_port_in_use_raises_oserror(metrics):
+    with socket.socket() as busy:
+        busy.bind(("127.0.0.1", 0))
+        busy.listen()
+        with pytest.raises(OSError):
+            MetricsServer(metrics, busy.getsockname()[1])
+
+
+def test_progress_bar(metrics):
+    stream = io.StringIO()
+    bar = ProgressBar(metrics, stream=stream, width=4)
+    metrics.test_finished(_result("a"))
+    metrics.test_finished(_result("b", "FAIL"))
+    bar.run_finished([])
+
+    line = stream.getvalue().rsplit("\r", 1)[1]
+    assert line.startswith("[##..] 2/4  running 0  failed 1  elapsed 0s  ETA ")
+    assert line.endswith("\033[K\n")
@@ -0,0 +1,97 @@
+# File: unit_tests/test_nzsql_batching.py
+# ---
+# Tests of nzsql_file batching in the runner: which adjacent tests are grouped
+# into a batch, and a batched run on the fake nzsql where every test still gets
+# its own status, log and duration, a failing member does not hide the others,
+# and one session serves the members that follow each other successfully.
+import pytest
+from core.loader import load_tests
+from core.runner import _plan_batches, run_tests
+from core.scheduler import build_dependency_graph
+from executors import nzsql_batch_executor
+
+SUITE = {
+    "sql/suite.yaml": (
+        "tests:\n"
+        "  - name: first\n    executor: nzsql_file\n    database: A\n    sql_file: first.sql\n"
+        "  - name: second\n    executor: nzsql_file\n    database: A\n    sql_file: second.sql\n"
+        "  - name: broken\n    executor: nzsql_file\n    database: A\n    sql_file: broken.sql\n"
+        "  - name: after_broken\n    executor: nzsql_file\n    database: A\n    sql_file: after.sql\n"
+        "  - name: other_db\n    executor: nzsql_file\n    database: B\n    sql_file: first.sql\n"
+        "  - name: shell\n    command: ok.sh\n"
+    ),
+    "sql/first.sql": "SELECT 'first' AS a;\n",
+    "sql/second.sql": "SELECT 'second' AS b;\n",
+    "sql/broken.sql": "ELECT 1;\n",
+    "sql/after.sql": "SELECT 'after' AS c;\n",
+    "sql/ok.sh": "#!/bin/sh\necho shell\n",
+}
+
+
+def _tests(*specs):
+    """nzsql_file test dicts; each spec is (name, database) or (name, database, extra keys)."""
+    tests = []
+    for spec in specs:
+        name, database, extra = spec if len(spec) == 3 else (*spec, {})
+        tests.append({"name": name, "executor": "nzsql_file", "database": database, "sql_file": f"{name}.sql",
+                      "__file__": "tests/suite/suite.yaml", **extra})
+    return tests
+
+
+def _batches(tests, max_size=10):
+    _plan_batches(tests, build_dependency_graph(tests), max_size)
+    return [t["__batch__"][1:] if "__batch__" in t else None for t in tests]
+
+
+def test_adjacent_tests_on_one_database_are_batched():
+    tests = _tests(("a", "A"), ("b", "A"), ("c", "B"), ("d", "B"), ("e", "B"), ("f", "A"))
+    assert _batches(tests) == [(0, 2), (1, 2), (0, 3), (1, 3), (2, 3), None]
+    assert tests[0]["__batch__"][0] != tests[2]["__batch__"][0]
+
+
+def test_batches_end_at_size_limit_skip_and_backward_dependency():
+    assert _batches(_tests(("a", "A"), ("b", "A"), ("c", "A")), max_size=2) == [(0, 2), (1, 2), None]
+    assert _batches(_tests(("a", "A"), ("b", "A", {"skip": True}), ("c", "A"), ("d", "A"))) == [
+        None, None, (0, 2), (1, 2)]
+    # b depends on c, listed after it: b and c cannot share a batch
+    assert _batches(_tests(("a", "A"), ("b", "A", {"depends_on": ["c"]}), ("c", "A"), ("d", "A"))) == [
+        (0, 2), (1, 2), (0, 2), (1, 2)]
+
+
+def test_members_wait_for_the_previous_member():
+    tests = _tests(("a", "A"), ("b", "A"), ("c", "A"))
+    assert _plan_batches(tests, build_dependency_graph(tests), 10) == [set(), {0}, {1}]
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """Records the databases of the nzsql sessions started by batches."""
+    started = []
+    session_class = nzsql_batch_executor.NzsqlSession
+
+    def counting_session(database, **kwargs):
+        started.append(database)
+        return session_class(database, **kwargs)
+    monkeypatch.setattr(nzsql_batch_executor, "NzsqlSession", counting_session)
+    return started
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_batched_run_keeps_results_per_test(fake_nzsql, write_suite, sessions, engine):
+    tests = load_tests(write_suite(SUITE), use_cache=False)
+    results, _, _ = run_tests(tests, output_dir_base="output", jobs=2, engine=engine, batch_size=10)
+
+    by_name = {r["name"]: r for r in results}
+    assert [r["status"] for r in results] == ["PASS", "PASS", "FAIL", "PASS", "PASS", "PASS"]
+    # The failed member closed the session and the next one started a fresh one
+    assert sorted(sessions) == ["A", "A"]
+    for name, own in (("first", "first"), ("second", "second"), ("after_broken", "after")):
+        with open(by_name[f"sql/{name}"]["output_file"]) as f:
+            output = f.read()
+        assert own in output
+        assert "__NZTEST_" not in output
+        assert by_name[f"sql/{name}"]["duration_sec"] > 0
+    with open(by_name["sql/broken"]["output_file"]) as f:
+        assert "ERROR" in f.read()
+    assert by_name["sql/second"]["cpu_user_sec"] is None
+    assert nzsql_batch_executor._sessions == {}
@@ -0,0 +1,134 @@
+# File: unit_tests/test_nzsql_sessions.py
+# ---
+# Tests of the nzsql sessions shared between tests: statement termination and
+# session reuse in the nzsql_pooled pool, and the sentinel that splits the
+# output of a batch of nzsql_file tests run in one session.
+import pytest
+from executors import nzsql_batch_executor, nzsql_pool_executor
+from executors.nzsql_pool_executor import NzsqlPool, run_nzsql_pooled
+
+
+@pytest.fixture
+def pool(fake_nzsql):
+    nzsql_pool_executor.configure_pool(1)
+    yield nzsql_pool_executor.get_pool()
+    nzsql_pool_executor.close_pool()
+    nzsql_pool_executor.configure_pool(nzsql_pool_executor.DEFAULT_POOL_SIZE)
+
+
+def _session_pids(pool):
+    return [session.proc.pid for idle in pool._idle.values() for session in idle]
+
+
+def test_pooled_statements_reuse_one_session(pool):
+    outputs = []
+    for value in (1, 2, 3):
+        success, output = run_nzsql_pooled(f"SELECT {value}", database="db", timeout=10)
+        assert success
+        outputs.append(output)
+        if value == 1:
+            pids = _session_pids(pool)
+        assert _session_pids(pool) == pids
+
+    assert len(pids) == 1
+    for value, output in zip((1, 2, 3), outputs):
+        assert f" {value} " in output
+        assert "__NZTEST_" not in output
+
+
+def test_trailing_comment_does_not_swallow_the_terminator(pool):
+    success, output = run_nzsql_pooled("SELECT 1 -- keep me", database="db", timeout=10)
+    assert success
+    assert " 1 " in output
+
+    # The first statement must not be left in the query buffer of the session
+    success, output = run_nzsql_pooled("SELECT 2", database="db", timeout=10)
+    assert success
+    assert " 2 " in output
+    assert "SELECT" not in output
+
+
+def test_statements_ending_with_terminator_are_run_as_is(pool):
+    success, output = run_nzsql_pooled("SELECT 'a--b' AS x;", database="db", timeout=10)
+    assert success
+    assert "a--b" in output
+
+
+def test_failed_statement_recycles_its_session(pool):
+    run_nzsql_pooled("SELECT 1", database="db", timeout=10)
+    first = _session_pids(pool)
+
+    success, output = run_nzsql_pooled("ELECT 1", database="db", timeout=10)
+    assert not success
+    assert "ERROR" in output
+    assert _session_pids(pool) == []
+
+    assert run_nzsql_pooled("SELECT 1", database="db", timeout=10)[0]
+    assert _session_pids(pool) != first
+
+
+def test_timed_out_session_is_not_returned_to_the_pool(pool, monkeypatch):
+    monkeypatch.setenv("FAKE_NZSQL_QUERY_DELAY", "5")
+    success, output = run_nzsql_pooled("SELECT 1", database="db", timeout=0.3)
+    assert not success
+    assert "Timed out" in output
+    assert _session_pids(pool) == []
+    assert pool._open["db"] == 0
+
+
+def test_release_after_close_closes_the_session(fake_nzsql):
+    pool = NzsqlPool(2)
+    busy = pool.acquire("db")
+    idle = pool.acquire("db")
+    pool.release(idle)
+
+    pool.close()
+    assert idle.proc.poll() is not None
+    pool.release(busy)
+    assert busy.proc.poll() is not None
+    assert pool._open["db"] == 0
+    assert pool._idle == {}
+
+
+def _sql_files(tmp_path, statements):
+    paths = []
+    for idx, sql in enumerate(statements):
+        path = tmp_path / f"member{idx}.sql"
+        path.write_text(sql)
+        paths.append(str(path))
+    return paths
+
+
+def test_batch_members_get_their_own_output(fake_nzsql, tmp_path):
+    files = _sql_files(tmp_path, ["SELECT 'first' AS a;\n", "SELECT 'second' AS b;\n", "SELECT 'third' AS c;\n"])
+    outputs = []
+    for position, path in enumerate(files):
+        success, output = nzsql_batch_executor.run_nzsql_batched("db", path, ("batch-1", position, len(files)), timeout=10)
+        assert success
+        outputs.append(output)
+        if position < len(files) - 1:
+            # The session is handed on to the next member
+            assert "batch-1" in nzsql_batch_executor._sessions
+
+    assert nzsql_batch_executor._sessions == {}
+    for output, own, others in zip(outputs, ("first", "second", "third"),
+                                   (("second", "third"), ("first", "third"), ("first", "second"))):
+        assert own in output
+        assert not any(other in output for other in others)
+        assert "__NZTEST_" not in output
+
+
+def test_failed_batch_member_closes_the_session(fake_nzsql, tmp_path):
+    files = _sql_files(tmp_path, ["SELECT 1;\n", "ELECT 2;\n", "SELECT 'after' AS x;\n"])
+    assert nzsql_batch_executor.run_nzsql_batched("db", files[0], ("batch-2", 0, 3), timeout=10)[0]
+    first = nzsql_batch_executor._sessions["batch-2"]
+
+    success, output = nzsql_batch_executor.run_nzsql_batched("db", files[1], ("batch-2", 1, 3), timeout=10)
+    assert not success
+    assert "ERROR" in output
+    assert "batch-2" not in nzsql_batch_executor._sessions
+    assert first.proc.poll() is not None
+
+    success, output = nzsql_batch_executor.run_nzsql_batched("db", files[2], ("batch-2", 2, 3), timeout=10)
+    assert success
+    assert "after" in output
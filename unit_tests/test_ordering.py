@@ -0,0 +1,113 @@
+# File: unit_tests/test_ordering.py
+# ---
+# Tests of test ordering and fail-fast: failed-first and longest-first
+# priorities propagated along dependencies, the failure limit that skips the
+# tests not started yet, and the last durations and statuses read from the
+# history database or, without one, from the newest earlier reports.
+import json
+import pytest
+from core.history import HistoryStore
+from core.report import load_durations, load_last_statuses
+from core.scheduler import build_dependency_graph, order_priorities, run_graph
+
+
+def _tests(*specs):
+    """Test dicts in tests/suite/; each spec is a name or (name, extra keys)."""
+    tests = []
+    for spec in specs:
+        name, extra = (spec, {}) if isinstance(spec, str) else spec
+        tests.append({"name": name, "__file__": "tests/suite/suite.yaml", **extra})
+    return tests
+
+
+def _run_in_order(tests, priorities=None, failing=(), max_failures=None):
+    """Runs the tests on one worker; returns (names in run order, results)."""
+    ran = []
+
+    def run_one(test):
+        if test.get("skip"):
+            return {"name": test["name"], "status": "SKIPPED"}
+        ran.append(test["name"])
+        return {"name": test["name"], "status": "FAIL" if test["name"] in failing else "PASS"}
+    results = run_graph(tests, build_dependency_graph(tests), run_one, jobs=1, priorities=priorities,
+                        max_failures=max_failures)
+    return ran, results
+
+
+@pytest.fixture
+def store(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.sqlite"))
+    yield history
+    history.close()
+
+
+def test_failed_first_also_hurries_the_dependencies(store):
+    tests = _tests("a", "b", ("c", {"depends_on_previous": True}), "d")
+    deps = build_dependency_graph(tests)
+    priorities = order_priorities(tests, deps, "failed-first", statuses={"suite/c": "TIMEOUT", "suite/a": "PASS"})
+
+    assert _run_in_order(tests, priorities)[0] == ["b", "c", "a", "d"]
+
+
+def test_longest_first_follows_the_longest_chain():
+    tests = _tests("short", "long", "head", ("tail", {"depends_on": ["head"]}), "unknown")
+    deps = build_dependency_graph(tests)
+    durations = {"suite/short": 1.0, "suite/long": 5.0, "suite/head": 1.0, "suite/tail": 10.0}
+    priorities = order_priorities(tests, deps, "longest-first", durations=durations)
+
+    # head + tail = 11s; unknown tests count as the median known duration (5s)
+    assert _run_in_order(tests, priorities)[0] == ["head", "tail", "long", "unknown", "short"]
+
+
+def test_default_order_and_unknown_order():
+    tests = _tests("a", "b")
+    assert order_priorities(tests, build_dependency_graph(tests)) == [0, 1]
+    with pytest.raises(ValueError, match="Unknown order 'random'"):
+        order_priorities(tests, build_dependency_graph(tests), "random")
+
+
+def test_fail_fast_skips_the_tests_not_started():
+    tests = _tests("a", "b", "c", "d")
+    ran, results = _run_in_order(tests, failing={"a", "b", "c"}, max_failures=2)
+
+    assert ran == ["a", "b"]
+    assert [r["status"] for r in results] == ["FAIL", "FAIL", "SKIPPED", "SKIPPED"]
+    assert [t.get("__skip_reason__") for t in tests] == [None, None, "fail-fast", "fail-fast"]
+
+
+def test_history_holds_the_last_duration_and_status(store):
+    store.record("20260101_000000", "nightly", {"name": "a", "status": "PASS", "duration_sec": 2.0})
+    store.record("20260102_000000", "nightly", {"name": "a", "status": "FAIL", "duration_sec": 3.0})
+    store.record("20260103_000000", "nightly", {"name": "a", "status": "SKIPPED", "duration_sec": 0.0})
+    store.record("20260101_000000", "nightly", {"name": "b", "status": "TIMEOUT", "duration_sec": 9.0})
+    store.record("20260102_000000", "nightly", {"name": "b", "status": "PASS", "duration_sec": 1.0})
+
+    assert store.last_durations() == {"a": 3.0, "b": 1.0}
+    assert store.last_statuses() == {"a": "FAIL", "b": "PASS"}
+
+
+def _write_reports(reports_dir, count):
+    reports_dir.mkdir()
+    for run in range(count):
+        results = [{"name": "a", "status": "PASS" if run % 2 else "FAIL", "duration_sec": float(run + 1)},
+                   {"name": f"only_in_{run}", "status": "PASS", "duration_sec": 1.0},
+                   {"name": "a_skipped", "status": "SKIPPED", "duration_sec": 0.0}]
+        (reports_dir / f"202601{run + 1:02d}_000000_nightly.json").write_text(json.dumps(results))
+
+
+def test_reports_are_read_without_a_history(tmp_path, store):
+    _write_reports(tmp_path / "reports", 5)
+    reports_dir = str(tmp_path / "reports")
+
+    durations = load_durations(reports_dir, history=store, max_reports=3)
+    assert durations == {"a": 5.0, "only_in_2": 1.0, "only_in_3": 1.0, "only_in_4": 1.0}
+    statuses = load_last_statuses(reports_dir, max_reports=2)
+    assert statuses == {"a": "FAIL", "only_in_3": "PASS", "only_in_4": "PASS"}
+
+
+def test_history_is_read_before_the_reports(tmp_path, store):
+    _write_reports(tmp_path / "reports", 2)
+    store.record("20260201_000000", "nightly", {"name": "a", "status": "PASS", "duration_sec": 7.0})
+
+    assert load_durations(str(tmp_path / "reports"), history=store) == {"a": 7.0}
+    assert load_last_statuses(str(tmp_path / "reports"), history=store) == {"a": "PASS"}
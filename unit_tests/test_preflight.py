@@ -0,0 +1,124 @@
+# File: unit_tests/test_preflight.py
+# ---
+# Tests of the preflight stage: one probe per distinct database, successful
+# probes cached for the TTL and keyed by the connection settings, failed or
+# slow databases and missing tools reported once for all the tests that need
+# them, and those tests reported as ERROR without running.
+import json
+import os
+import types
+import pytest
+from core import preflight
+from core.loader import load_tests
+from core.preflight import run_preflight
+from core.runner import run_tests
+
+
+@pytest.fixture
+def probes(fake_nzsql, monkeypatch, tmp_path):
+    """Records the databases probed; the cache goes to tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("NZ_HOST", "nz1")
+    monkeypatch.setenv("NZ_DATABASE", "DEFAULTDB")
+    probed = []
+    probe_database = preflight._probe_database
+
+    def counting(database, timeout):
+        probed.append(database)
+        return probe_database(database, timeout)
+    monkeypatch.setattr(preflight, "_probe_database", counting)
+    return probed
+
+
+def _tests(*specs):
+    """Tests of (executor, database) specs; database None leaves the key out."""
+    tests = []
+    for idx, (executor, database) in enumerate(specs):
+        test = {"name": f"t{idx}", "executor": executor, "command": "SELECT 1", "__file__": "tests/s/s.yaml"}
+        if database is not None:
+            test["database"] = database
+        tests.append(test)
+    return tests
+
+
+def test_each_database_is_probed_once(probes):
+    tests = _tests(("nzsql", "SALES"), ("nzsql_pooled", "SALES"), ("nzsql", None), ("bash", None))
+    assert run_preflight(tests) == 0
+    assert sorted(probes) == ["DEFAULTDB", "SALES"]
+    assert not any("__preflight_error__" in t for t in tests)
+
+
+def test_successful_probes_are_cached_for_the_ttl(probes, monkeypatch):
+    tests = _tests(("nzsql", "SALES"))
+    run_preflight(tests)
+    run_preflight(tests)
+    assert probes == ["SALES"]
+    with open(preflight.PREFLIGHT_CACHE_PATH) as f:
+        assert len(json.load(f)) == 1
+
+    # Other connection settings are not covered by the cached probe
+    monkeypatch.setenv("NZ_HOST", "nz2")
+    run_preflight(tests)
+    assert probes == ["SALES", "SALES"]
+
+    run_preflight(tests, ttl_sec=0)
+    assert probes == ["SALES", "SALES", "SALES"]
+
+
+def test_expired_probes_are_run_again(probes, monkeypatch):
+    tests = _tests(("nzsql", "SALES"))
+    run_preflight(tests, ttl_sec=60)
+    clock = preflight.time.time() + 61
+    monkeypatch.setattr(preflight, "time", types.SimpleNamespace(time=lambda: clock))
+    run_preflight(tests, ttl_sec=60)
+    assert probes == ["SALES", "SALES"]
+
+
+def test_failed_probes_are_not_cached(probes, tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    failing = bin_dir / "nzsql"
+    failing.write_text("#!/bin/sh\necho 'ERROR: connection refused' >&2\nexit 2\n")
+    failing.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    tests = _tests(("nzsql", "SALES"), ("nzsql_file", "SALES"), ("bash", None))
+    assert run_preflight(tests) == 2
+    assert tests[0]["__preflight_error__"] == "database 'SALES' on nz1 is not reachable: ERROR: connection refused"
+    assert "__preflight_error__" not in tests[2]
+    assert run_preflight(_tests(("nzsql", "SALES"))) == 1
+    assert probes == ["SALES", "SALES"]
+
+
+def test_slow_database(probes, monkeypatch):
+    monkeypatch.setenv("FAKE_NZSQL_CONNECT_DELAY", "5")
+    tests = _tests(("nzsql", "SALES"))
+    assert run_preflight(tests, timeout=0.3) == 1
+    assert tests[0]["__preflight_error__"] == "database 'SALES' on nz1 did not answer within 0.3s"
+
+
+def test_missing_tool_and_unknown_executor(probes, monkeypatch, tmp_path):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    tests = _tests(("nzsql", "SALES"), ("teradata", None), ("bash", None))
+    assert run_preflight(tests) == 2
+    assert tests[0]["__preflight_error__"] == "'nzsql' not found on the PATH"
+    assert tests[1]["__preflight_error__"] == "Unknown executor 'teradata'"
+    assert probes == []
+
+
+def test_tests_that_cannot_run_are_reported_as_error(probes, write_suite, monkeypatch):
+    tests = load_tests(write_suite({
+        "s/s.yaml": (
+            "tests:\n"
+            "  - name: query\n    executor: nzsql\n    database: SALES\n    command: SELECT 1\n"
+            "  - name: shell\n    command: ok.sh\n"
+        ),
+        "s/ok.sh": "#!/bin/sh\necho ok\n",
+    }), use_cache=False)
+    monkeypatch.setenv("PATH", f"/bin{os.pathsep}/usr/bin")
+    run_preflight(tests)
+    results, _, _ = run_tests(tests, output_dir_base="output")
+
+    assert [r["status"] for r in results] == ["ERROR", "PASS"]
+    with open(results[0]["output_file"]) as f:
+        assert "'nzsql' not found on the PATH" in f.read()
@@ -0,0 +1,139 @@
+# File: unit_tests/test_registry.py
+# ---
+# Tests of the executor registry: built-in specs and their lazy import,
+# executors registered from a config file or from Python, spec validation,
+# the arguments each style passes, and entry points that cannot be loaded,
+# which only fail the tests that use them.
+import asyncio
+import subprocess
+import sys
+import pytest
+from conftest import REPO_ROOT
+from executors import registry
+from executors.registry import (capabilities, executor_error, executor_spec, load_config, register_executor,
+                                requirements, run_executor, run_executor_async)
+
+PLUGIN = (
+    "CALLS = []\n"
+    "def run_test(test, timeout=None, capture=None):\n"
+    "    CALLS.append((test['name'], timeout))\n"
+    "    return True, f\"ran {test['name']}\"\n"
+    "def run_sql(command, database=None, timeout=None, capture=None, env=None):\n"
+    "    CALLS.append((command, database, env))\n"
+    "    return True, f'{database}: {command}'\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def clean_registry(monkeypatch, tmp_path):
+    """Empty registry state, and a `registry_plugin` module importable from tmp_path."""
+    for attr in ("_registered", "_entry_points", "_broken_entry_points", "_loaded"):
+        monkeypatch.setattr(registry, attr, {})
+    (tmp_path / "registry_plugin.py").write_text(PLUGIN)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    yield
+    sys.modules.pop("registry_plugin", None)
+
+
+class _EntryPoint:
+    """Stand-in for an importlib.metadata entry point."""
+
+    def __init__(self, name, value, target=None, error=None):
+        self.name, self.value, self._target, self._error = name, value, target, error
+
+    def load(self):
+        if self._error:
+            raise self._error
+        return self._target
+
+
+def test_builtin_executor_specs():
+    assert executor_spec("nzsql_pooled")["arguments"] == "pooled"
+    assert capabilities("nzsql_pooled") == {"async": True, "batch": False, "pooled": True, "streaming": True,
+                                            "env": False}
+    assert capabilities("nzsql_file")["batch"]
+    assert requirements("nzsql") == {"tools": ["nzsql"], "database": True}
+    assert requirements("bash") == {"tools": [], "database": False}
+
+
+def test_builtin_executors_are_imported_on_first_use():
+    # In a fresh interpreter: the other tests have imported the executors already
+    script = ("import sys\n"
+              "from executors.registry import capabilities, run_executor\n"
+              "capabilities('nzsql_pooled')\n"
+              "assert 'executors.nzsql_pool_executor' not in sys.modules\n"
+              "run_executor({'name': 't', 'executor': 'bash', 'command': 'true'})\n"
+              "assert 'executors.bash_executor' in sys.modules\n")
+    subprocess.run([sys.executable, "-c", script], cwd=REPO_ROOT, check=True)
+
+
+def test_unknown_executor():
+    assert executor_spec("teradata") is None
+    assert capabilities("teradata") is None
+    assert executor_error("teradata") == "Unknown executor 'teradata'"
+    assert run_executor({"name": "t", "executor": "teradata"}) == (False, "Unknown executor 'teradata'")
+
+
+def test_config_file_registers_executors(tmp_path):
+    (tmp_path / "executors.yaml").write_text(
+        "executors:\n"
+        "  plugin:\n    run: registry_plugin:run_test\n    arguments: test\n"
+        "  bash:\n    run: registry_plugin:run_test\n    arguments: test\n"
+    )
+    load_config()
+
+    assert dict(registry.list_executors())["plugin"] == "executors.yaml"
+    test = {"name": "t1", "executor": "plugin", "__file__": "tests/suite/suite.yaml"}
+    assert run_executor(test, timeout=5) == (True, "ran t1")
+    # A config entry replaces the built-in executor of the same name
+    assert run_executor({"name": "t2"}) == (True, "ran t2")
+    assert sys.modules["registry_plugin"].CALLS == [("t1", 5), ("t2", None)]
+
+
+def test_sql_command_style_passes_the_database():
+    register_executor("sql", {"run": "registry_plugin:run_sql", "arguments": "sql_command", "env": True})
+    test = {"name": "q", "executor": "sql", "command": "SELECT 1", "database": "SALES"}
+    assert run_executor(test, env={"A": "1"}) == (True, "SALES: SELECT 1")
+    # Blocking functions run on the event loop's thread pool
+    assert asyncio.run(run_executor_async(test)) == (True, "SALES: SELECT 1")
+    assert sys.modules["registry_plugin"].CALLS == [("SELECT 1", "SALES", {"A": "1"}), ("SELECT 1", "SALES", None)]
+
+
+@pytest.mark.parametrize("config, message", [
+    ("executors: []\n", "has no 'executors' mapping"),
+    ("executors:\n  x:\n    arguments: test\n", "needs a run or run_async function"),
+    ("executors:\n  x:\n    run: no_colon\n", "run must be 'module:function'"),
+    ("executors:\n  x:\n    run: m:f\n    arguments: argv\n", "arguments must be one of"),
+    ("executors:\n  x:\n    run: m:f\n    timeout: 3\n", "unknown keys timeout"),
+    ("executors:\n  x:\n    run: m:f\n    requires: {tools: nzsql}\n", "requires.tools must be a list"),
+    ("executors: [\n", "Cannot read executor config"),
+])
+def test_invalid_config_is_rejected(tmp_path, config, message):
+    (tmp_path / "bad.yaml").write_text(config)
+    with pytest.raises(ValueError, match=message):
+        load_config(str(tmp_path / "bad.yaml"))
+
+
+def test_function_that_cannot_be_imported():
+    register_executor("missing", {"run": "registry_plugin:no_such_function"})
+    with pytest.raises(ValueError, match="cannot load run function registry_plugin:no_such_function: AttributeError"):
+        run_executor({"name": "t", "executor": "missing"})
+
+
+def test_entry_point_executors(monkeypatch):
+    def run_plugin(test, timeout=None, capture=None):
+        return True, f"plugin {test['name']}"
+    entry_points = [
+        _EntryPoint("plugin", "pkg.plugin:run", target=run_plugin),
+        _EntryPoint("broken", "pkg.broken:SPEC", error=RuntimeError("driver not installed")),
+        _EntryPoint("invalid", "pkg.invalid:SPEC", target={"arguments": "test"}),
+    ]
+    monkeypatch.setattr(registry, "_entry_points_of_group", lambda: entry_points)
+
+    assert run_executor({"name": "t", "executor": "plugin"}) == (True, "plugin t")
+    assert executor_spec("broken") is None
+    assert executor_error("broken") == ("Broken executor 'broken': cannot load entry point pkg.broken:SPEC: "
+                                        "RuntimeError: driver not installed")
+    assert "needs a run or run_async function" in executor_error("invalid")
+    assert dict(registry.list_executors())["broken"] == "entry point (nztest.executors)"
@@ -0,0 +1,72 @@
+# File: unit_tests/test_report_stream.py
+# ---
+# Tests of the streamed JSON Lines report: results are appended as tests
+# finish and read back in the tests' original order, a line cut short by a
+# crash is ignored, and the final JSON report has the json.dump layout.
+import json
+from core.report import StreamingReport, read_report_stream, write_report
+
+
+def _tests(*names):
+    return [{"name": name, "__file__": "tests/suite/suite.yaml"} for name in names]
+
+
+def _result(name, status="PASS"):
+    return {"name": f"suite/{name}", "status": status}
+
+
+def test_results_are_read_back_in_test_order(tmp_path):
+    report = StreamingReport(str(tmp_path))
+    report.run_started("20250101_000000", "nightly", _tests("a", "b", "c"))
+    for name in ("c", "a", "b"):
+        report.test_finished(_result(name))
+    report.run_finished([])
+
+    assert report.path == str(tmp_path / "20250101_000000_nightly.jsonl")
+    assert [r["name"] for r in read_report_stream(report.path)] == ["suite/a", "suite/b", "suite/c"]
+    assert all("__index__" not in r for r in read_report_stream(report.path))
+
+
+def test_lines_are_on_disk_before_the_run_finishes(tmp_path):
+    report = StreamingReport(str(tmp_path))
+    report.run_started("20250101_000000", "nightly", _tests("a", "b"))
+    report.test_finished(_result("b", "FAIL"))
+
+    assert list(read_report_stream(report.path)) == [_result("b", "FAIL")]
+    report.close()
+
+
+def test_tests_with_the_same_name_keep_their_positions(tmp_path):
+    report = StreamingReport(str(tmp_path))
+    report.run_started("20250101_000000", "nightly", _tests("dup", "other", "dup"))
+    report.test_finished(dict(_result("dup"), attempt="first"))
+    report.test_finished(_result("other"))
+    report.test_finished(dict(_result("dup"), attempt="second"))
+    report.close()
+
+    results = list(read_report_stream(report.path))
+    assert [r["name"] for r in results] == ["suite/dup", "suite/other", "suite/dup"]
+    assert [r.get("attempt") for r in results] == ["first", None, "second"]
+
+
+def test_truncated_last_line_and_unindexed_lines(tmp_path):
+    path = tmp_path / "20250101_000000_nightly.jsonl"
+    path.write_text(
+        json.dumps({"name": "old"}) + "\n"
+        + json.dumps({"__index__": 1, "name": "second"}) + "\n"
+        + json.dumps({"__index__": 0, "name": "first"}) + "\n"
+        + '{"__index__": 2, "name": "cut'
+    )
+    assert [r["name"] for r in read_report_stream(str(path))] == ["first", "second", "old"]
+
+
+def test_final_report_matches_json_dump(tmp_path):
+    results = [{"name": "suite/a", "status": "PASS", "nested": {"x": [1, 2]}}, {"name": "suite/b", "status": "FAIL"}]
+    path = write_report(iter(results), label="nightly", output_dir=str(tmp_path), run_id="20250101_000000")
+
+    with open(path) as f:
+        text = f.read()
+    assert text == json.dumps(results, indent=2)
+    empty = write_report([], label="empty", output_dir=str(tmp_path), run_id="20250101_000000")
+    with open(empty) as f:
+        assert json.load(f) == []
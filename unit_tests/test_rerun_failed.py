@@ -0,0 +1,114 @@
+# File: unit_tests/test_rerun_failed.py
+# ---
+# Tests of --rerun-failed and flaky test detection: which tests of an earlier
+# report are run again, how the rerun results replace the earlier ones, the
+# history query that finds flipping outcomes, and a rerun through main.py.
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+import pytest
+from conftest import REPO_ROOT
+from core.history import HistoryStore
+from core.report import merge_results, rerun_names
+
+
+def _result(name, status, fingerprint="fp", **extra):
+    return {"name": name, "status": status, "fingerprint": fingerprint, **extra}
+
+
+def test_failures_and_the_tests_they_skipped_are_rerun():
+    results = [
+        _result("s/pass", "PASS"),
+        _result("s/fail", "FAIL"),
+        _result("s/timeout", "TIMEOUT"),
+        _result("s/error", "ERROR"),
+        _result("s/after_fail", "SKIPPED", skip_reason="failed dependency"),
+        _result("s/fail_fast", "SKIPPED", skip_reason="fail-fast"),
+        _result("s/disabled", "SKIPPED", skip_reason="configuration"),
+        _result("s/old_skip", "SKIPPED"),
+        _result("s/cached", "CACHED"),
+    ]
+    assert rerun_names(results) == {"s/fail", "s/timeout", "s/error", "s/after_fail", "s/fail_fast"}
+
+
+def test_rerun_results_replace_the_earlier_ones():
+    previous = [_result("a", "PASS"), _result("b", "FAIL"), _result("c", "FAIL", fingerprint="old"),
+                _result("d", "TIMEOUT"), _result("e", "SKIPPED", fingerprint=None)]
+    rerun = [_result("e", "PASS"), _result("b", "PASS"), _result("c", "PASS", fingerprint="new"),
+             _result("d", "FAIL"), _result("new", "PASS")]
+
+    merged = list(merge_results(previous, rerun))
+
+    assert [(r["name"], r["status"], r.get("previous_status")) for r in merged] == [
+        ("a", "PASS", None), ("b", "PASS", "FAIL"), ("c", "PASS", "FAIL"), ("d", "FAIL", "TIMEOUT"),
+        ("e", "PASS", "SKIPPED"), ("new", "PASS", None)]
+    # Only b flipped with unchanged inputs
+    assert [r["name"] for r in merged if r.get("flaky")] == ["b"]
+    assert [r["name"] for r in merged if r.get("rerun")] == ["b", "c", "d", "e", "new"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.sqlite"))
+    yield history
+    history.close()
+
+
+def test_history_finds_flipping_tests(store):
+    runs = [
+        ("r1", [_result("flip", "PASS"), _result("stable", "FAIL"), _result("changed", "PASS", "v1"),
+                _result("retried", "PASS", attempts=1)]),
+        ("r2", [_result("flip", "FAIL"), _result("stable", "TIMEOUT"), _result("changed", "FAIL", "v2"),
+                _result("retried", "PASS", attempts=3)]),
+        ("r3", [_result("flip", "PASS"), _result("stable", "FAIL"), _result("changed", "FAIL", "v2"),
+                _result("skipped", "SKIPPED")]),
+    ]
+    for run_id, results in runs:
+        for result in results:
+            store.record(run_id, "nightly", dict(result, duration_sec=1.0))
+
+    assert store.flaky() == [("flip", "fp", 3, 2, 1, 2, "PASS"), ("retried", "fp", 2, 2, 0, 1, "PASS")]
+    assert [row[0] for row in store.flaky(names=["retried", "stable"])] == ["retried"]
+    assert store.flaky(label="weekly") == []
+
+
+def _main(*args):
+    subprocess.run([sys.executable, os.path.join(REPO_ROOT, "main.py"), "--test-dir", "tests", *args],
+                   check=True, capture_output=True)
+    return sorted(glob.glob(os.path.join("reports", "*.json")))[-1]
+
+
+def test_rerun_through_main(write_suite, tmp_path):
+    write_suite({
+        "suite/suite.yaml": (
+            "tests:\n"
+            "  - name: flip\n    command: flip.sh\n"
+            "  - name: after_flip\n    command: ok.sh\n    depends_on_previous: true\n"
+            "  - name: ok\n    command: ok.sh\n"
+            "  - name: disabled\n    command: ok.sh\n    skip: true\n"
+        ),
+        # Fails on its first run only
+        "suite/flip.sh": "#!/bin/sh\n[ -e flipped ] && exit 0\ntouch flipped\nexit 1\n",
+        "suite/ok.sh": "#!/bin/sh\necho \"$0\" >> ran.txt\n",
+    })
+    first = _main("--label", "ci")
+    assert [r["status"] for r in json.loads(open(first).read())] == ["FAIL", "SKIPPED", "PASS", "SKIPPED"]
+    # Run IDs have a one-second resolution
+    time.sleep(1.1)
+    (tmp_path / "ran.txt").unlink()
+
+    second = _main("--rerun-failed", first)
+
+    assert second != first and second.endswith("_ci.json")
+    results = {r["name"]: r for r in json.loads(open(second).read())}
+    assert [results[name]["status"] for name in ("suite/flip", "suite/after_flip", "suite/ok", "suite/disabled")] == [
+        "PASS", "PASS", "PASS", "SKIPPED"]
+    assert results["suite/flip"]["flaky"] is True
+    assert results["suite/flip"]["previous_status"] == "FAIL"
+    assert results["suite/after_flip"]["rerun"] is True
+    assert "rerun" not in results["suite/ok"]
+    # Only the rerun tests ran again
+    assert (tmp_path / "ran.txt").read_text().count("ok.sh") == 1
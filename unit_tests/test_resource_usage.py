@@ -0,0 +1,50 @@
+# File: unit_tests/test_resource_usage.py
+# ---
+# Tests of the per-test resource accounting: the CPU time, max RSS, block I/O
+# and context switches of a test's process tree end up in its result on both
+# engines, and stay empty for tests that did not run a process of their own.
+import pytest
+from core.loader import load_tests
+from core.runner import run_tests
+from executors.process import RESOURCE_FIELDS
+
+SUITE = {
+    # The grandchild allocates ~64 MB and burns CPU; the script waits for it
+    "suite/heavy.sh": "#!/bin/sh\npython3 -c \"x = bytearray(64 * 2**20); sum(range(3 * 10**6))\"\n",
+    "suite/light.sh": "#!/bin/sh\necho light\n",
+    "suite/suite.yaml": (
+        "tests:\n"
+        "  - name: heavy\n    command: heavy.sh\n"
+        "  - name: light\n    command: light.sh\n"
+        "  - name: skipped\n    command: light.sh\n    skip: true\n"
+    ),
+}
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_usage_of_the_process_tree_is_recorded(write_suite, engine):
+    tests = load_tests(write_suite(SUITE), use_cache=False)
+    heavy, light, skipped = run_tests(tests, engine=engine, jobs=2)[0]
+
+    for result in (heavy, light):
+        assert all(result[field] is not None for field in RESOURCE_FIELDS)
+    assert heavy["max_rss_kb"] > 60 * 1024
+    assert heavy["max_rss_kb"] > light["max_rss_kb"]
+    assert heavy["cpu_user_sec"] + heavy["cpu_sys_sec"] > light["cpu_user_sec"] + light["cpu_sys_sec"]
+    assert all(skipped[field] is None for field in RESOURCE_FIELDS)
+
+
+def test_nzsql_executor_records_usage(write_suite, fake_nzsql):
+    tests = load_tests(write_suite({"sql/sql.yaml": "tests:\n  - name: q\n    executor: nzsql\n    command: SELECT 1\n"
+                                                    "    database: db\n"}), use_cache=False)
+    result = run_tests(tests)[0][0]
+    assert result["status"] == "PASS"
+    assert result["max_rss_kb"] > 0
+
+
+def test_pooled_sessions_leave_usage_empty(write_suite, fake_nzsql):
+    tests = load_tests(write_suite({"sql/sql.yaml": "tests:\n  - name: q\n    executor: nzsql_pooled\n"
+                                                    "    command: SELECT 1\n    database: db\n"}), use_cache=False)
+    result = run_tests(tests)[0][0]
+    assert result["status"] == "PASS"
+    assert all(result[field] is None for field in RESOURCE_FIELDS)
@@ -0,0 +1,115 @@
+# File: unit_tests/test_result_cache.py
+# ---
+# Tests of --reuse-results: what the fingerprint covers, reuse of an earlier
+# PASS with an unchanged fingerprint, expiry and eviction of the store, and
+# fingerprints only being computed when something uses them.
+import os
+import time
+import pytest
+from core import runner
+from core.loader import load_tests
+from core.result_cache import ResultCache, fingerprint
+from core.runner import run_tests
+
+SUITE = {
+    "suite/ok.sh": "#!/bin/sh\necho ran >> runs.txt\necho passed\n",
+    "suite/fails.sh": "#!/bin/sh\necho ran >> runs.txt\nexit 1\n",
+    "suite/data.csv": "1,2\n",
+    "suite/suite.yaml": (
+        "tests:\n"
+        "  - name: ok\n    command: ok.sh\n    inputs: ['*.csv']\n    fingerprint_env: [ORDERS_SCHEMA]\n"
+        "  - name: fails\n    command: fails.sh\n"
+    ),
+}
+
+
+@pytest.fixture
+def suite(write_suite, monkeypatch):
+    monkeypatch.delenv("ORDERS_SCHEMA", raising=False)
+    return load_tests(write_suite(SUITE), use_cache=False)
+
+
+def _runs():
+    with open("runs.txt") as f:
+        return len(f.readlines())
+
+
+def test_fingerprint_covers_definition_script_inputs_and_env(suite, monkeypatch):
+    ok = suite[0]
+    base = fingerprint(ok)
+    assert fingerprint(dict(ok)) == base
+    assert fingerprint(dict(ok, skip=True)) == base
+
+    assert fingerprint(dict(ok, timeout_sec=5)) != base
+    monkeypatch.setenv("ORDERS_SCHEMA", "v2")
+    assert fingerprint(ok) != base
+    monkeypatch.delenv("ORDERS_SCHEMA")
+
+    for path, text in (("tests/suite/data.csv", "1,3\n"), ("tests/suite/ok.sh", "#!/bin/sh\necho changed\n")):
+        with open(path) as f:
+            original = f.read()
+        with open(path, "w") as f:
+            f.write(text)
+        assert fingerprint(ok) != base
+        with open(path, "w") as f:
+            f.write(original)
+        assert fingerprint(ok) == base
+
+
+def test_pass_is_reused_and_failure_is_run_again(suite):
+    cache = ResultCache(cache_dir="cache")
+    first, _, _ = run_tests(suite, result_cache=cache, run_id="run1")
+    assert [r["status"] for r in first] == ["PASS", "FAIL"]
+    assert _runs() == 2
+
+    second, _, _ = run_tests(suite, result_cache=cache, run_id="run2")
+    assert [r["status"] for r in second] == ["CACHED", "FAIL"]
+    assert _runs() == 3
+    assert second[0]["fingerprint"] == first[0]["fingerprint"]
+    with open(second[0]["output_file"]) as f:
+        assert f.read() == "passed\n"
+
+
+def test_changed_input_runs_the_test_again(suite):
+    cache = ResultCache(cache_dir="cache")
+    run_tests(suite[:1], result_cache=cache, run_id="run1")
+    with open("tests/suite/data.csv", "a") as f:
+        f.write("3,4\n")
+
+    results, _, _ = run_tests(suite[:1], result_cache=cache, run_id="run2")
+    assert results[0]["status"] == "PASS"
+    assert _runs() == 2
+
+
+def test_expired_result_is_not_reused(suite):
+    run_tests(suite[:1], result_cache=ResultCache(cache_dir="cache"), run_id="run1")
+    results, _, _ = run_tests(suite[:1], result_cache=ResultCache(cache_dir="cache", max_age_sec=-1), run_id="run2")
+    assert results[0]["status"] == "PASS"
+
+
+def test_eviction_removes_the_oldest_entries(tmp_path):
+    cache = ResultCache(cache_dir=str(tmp_path / "cache"), max_bytes=1)
+    log = tmp_path / "test.log"
+    log.write_text("x" * 100)
+    for idx, fp in enumerate(("aa01", "bb02")):
+        cache.store(fp, {"output_file": str(log), "status": "PASS"})
+        os.utime(cache._paths(fp)[0], (time.time() - 100 + idx, time.time() - 100 + idx))
+    assert cache.lookup("aa01") and cache.lookup("bb02")
+
+    cache.max_bytes = os.path.getsize(cache._paths("bb02")[0]) + 100
+    cache.evict()
+    assert cache.lookup("aa01") is None
+    assert cache.lookup("bb02") is not None
+
+
+def test_fingerprint_is_only_computed_when_used(suite, monkeypatch):
+    computed = []
+    monkeypatch.setattr(runner, "fingerprint", lambda test: computed.append(test["name"]) or "fp")
+
+    results, _, _ = run_tests(suite, run_id="run1")
+    assert computed == []
+    assert all(r.get("fingerprint") is None for r in results)
+
+    results, _, _ = run_tests(suite, run_id="run2", fingerprints=True)
+    assert sorted(computed) == ["fails", "ok"]
+    assert [r["fingerprint"] for r in results] == ["fp", "fp"]
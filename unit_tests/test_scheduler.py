@@ -0,0 +1,94 @@
+# File: unit_tests/test_scheduler.py
+# ---
+# Tests of the dependency graph scheduler: graph building and cycle detection,
+# skip propagation along dependencies, and results kept in the original order
+# whatever order the workers finish in.
+import asyncio
+import threading
+import time
+import pytest
+from core.scheduler import build_dependency_graph, run_graph, run_graph_async
+
+
+def _tests(*specs):
+    """Test dicts in tests/suite/; each spec is a name or (name, extra keys)."""
+    tests = []
+    for spec in specs:
+        name, extra = (spec, {}) if isinstance(spec, str) else spec
+        tests.append({"name": name, "__file__": "tests/suite/suite.yaml", **extra})
+    return tests
+
+
+def _runner(failing=(), delays=None):
+    """A run_one that records the tests it ran and fails the named ones."""
+    ran = []
+    lock = threading.Lock()
+
+    def run_one(test):
+        if not test.get("skip"):
+            time.sleep((delays or {}).get(test["name"], 0))
+            with lock:
+                ran.append(test["name"])
+        status = "SKIPPED" if test.get("skip") else "FAIL" if test["name"] in failing else "PASS"
+        return {"name": test["name"], "status": status}
+    return run_one, ran
+
+
+def test_graph_links_previous_and_named_dependencies():
+    tests = _tests("a", ("b", {"depends_on_previous": True}), ("c", {"depends_on": ["a", "suite/b"]}), "d")
+    assert build_dependency_graph(tests) == [set(), {0}, {0, 1}, set()]
+
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError, match="unknown dependency 'missing'"):
+        build_dependency_graph(_tests(("a", {"depends_on": "missing"})))
+
+
+def test_dependency_cycle_is_rejected():
+    tests = _tests(("a", {"depends_on": ["c"]}), ("b", {"depends_on": ["a"]}), ("c", {"depends_on": ["b"]}), "d")
+    with pytest.raises(ValueError, match="Dependency cycle between tests: suite/a, suite/b, suite/c"):
+        build_dependency_graph(tests)
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_failure_skips_dependents_transitively(jobs):
+    tests = _tests("setup", ("load", {"depends_on_previous": True}), ("check", {"depends_on": ["load"]}),
+                   "independent")
+    run_one, ran = _runner(failing={"setup"})
+
+    results = run_graph(tests, build_dependency_graph(tests), run_one, jobs=jobs)
+
+    assert [r["status"] for r in results] == ["FAIL", "SKIPPED", "SKIPPED", "PASS"]
+    assert sorted(ran) == ["independent", "setup"]
+    assert tests[1]["__skip_reason__"] == "failed dependency"
+    assert tests[2]["__skip_reason__"] == "failed dependency"
+
+
+def test_results_keep_the_original_order():
+    tests = _tests("slow", "fast", ("after_fast", {"depends_on": ["fast"]}))
+    run_one, ran = _runner(delays={"slow": 0.3})
+
+    results = run_graph(tests, build_dependency_graph(tests), run_one, jobs=3)
+
+    assert ran.index("after_fast") < ran.index("slow")
+    assert [r["name"] for r in results] == ["slow", "fast", "after_fast"]
+
+
+def test_independent_tests_run_in_parallel():
+    tests = _tests("a", "b", "c", "d")
+    run_one, _ = _runner(delays={name: 0.2 for name in "abcd"})
+
+    start = time.monotonic()
+    run_graph(tests, build_dependency_graph(tests), run_one, jobs=4)
+    assert time.monotonic() - start < 0.6
+
+
+def test_async_graph_skips_dependents():
+    tests = _tests("a", ("b", {"depends_on_previous": True}), "c")
+    run_one, _ = _runner(failing={"a"})
+
+    async def run_one_async(test):
+        return run_one(test)
+
+    results = asyncio.run(run_graph_async(tests, build_dependency_graph(tests), run_one_async, jobs=2))
+    assert [r["status"] for r in results] == ["FAIL", "SKIPPED", "PASS"]
@@ -0,0 +1,129 @@
+# File: unit_tests/test_selection.py
+# ---
+# Tests of test selection through the persistent index: tag, executor, name and
+# changed-since filters, dependencies selected with the tests that need them,
+# only changed YAML files parsed again, and the connection variables only
+# required when a selected test uses a database.
+import os
+import subprocess
+import pytest
+from core import loader, selection
+from core.selection import select_tests
+from utils.env_check import check_env_vars
+
+SUITE = {
+    "alpha/alpha.yaml": (
+        "tests:\n"
+        "  - name: setup\n    command: ok.sh\n    tags: [smoke]\n"
+        "  - name: load\n    command: ok.sh\n    tags: [nightly]\n    depends_on_previous: true\n"
+        "  - name: query\n    executor: nzsql\n    command: SELECT 1\n    tags: nightly\n"
+    ),
+    "beta/beta.yaml": (
+        "tests:\n"
+        "  - name: check\n    command: ok.sh\n    tags: [smoke]\n    depends_on: [alpha/load]\n"
+        "  - name: other\n    command: ok.sh\n"
+    ),
+}
+
+
+@pytest.fixture
+def suite(write_suite):
+    loader.configure_tests_root("tests")
+    test_dir = write_suite(SUITE)
+    yield test_dir
+    loader.configure_tests_root("tests")
+
+
+def _names(selected):
+    tests, added = selected
+    return sorted(loader.test_name(t) for t in tests), added
+
+
+def _count_parsed(monkeypatch):
+    """Records the YAML files parsed again through load_documents()."""
+    parsed = []
+    load_documents = selection.load_documents
+
+    def counting(paths, use_cache=True):
+        parsed.append(sorted(os.path.basename(p) for p in paths))
+        return load_documents(paths, use_cache=use_cache)
+    monkeypatch.setattr(selection, "load_documents", counting)
+    return parsed
+
+
+def test_tags_select_tests_and_their_dependencies(suite):
+    assert _names(select_tests([suite], tags={"smoke"})) == (
+        ["alpha/load", "alpha/setup", "beta/check"], 1)
+    assert _names(select_tests([suite], tags={"nightly"})) == (
+        ["alpha/load", "alpha/query", "alpha/setup"], 1)
+
+
+def test_executor_and_name_filters(suite):
+    assert _names(select_tests([suite], executors={"nzsql"})) == (["alpha/query"], 0)
+    assert _names(select_tests([suite], name_glob=["oth*"])) == (["beta/other"], 0)
+    assert _names(select_tests([suite], name_glob=["beta/*"]))[0] == [
+        "alpha/load", "alpha/setup", "beta/check", "beta/other"]
+    assert _names(select_tests([suite], names={"alpha/query", "beta/other"})) == (
+        ["alpha/query", "beta/other"], 0)
+
+
+def test_filters_combine(suite):
+    assert _names(select_tests([suite], tags={"smoke"}, name_glob=["se*"])) == (["alpha/setup"], 0)
+
+
+def test_selected_tests_keep_their_file_and_fields(suite):
+    tests, _ = select_tests([suite], name_glob=["query"])
+    assert tests == [{"name": "query", "executor": "nzsql", "command": "SELECT 1", "tags": "nightly",
+                      "__file__": os.path.join("tests", "alpha", "alpha.yaml")}]
+
+
+def test_only_changed_files_are_parsed_again(suite, write_suite, monkeypatch):
+    select_tests([suite], tags={"smoke"})
+    parsed = _count_parsed(monkeypatch)
+
+    select_tests([suite], tags={"smoke"})
+    # The selected files are loaded; nothing is re-indexed
+    assert parsed == [["alpha.yaml", "beta.yaml"]]
+
+    parsed.clear()
+    write_suite({"beta/beta.yaml": "tests:\n  - name: renamed\n    command: ok.sh\n    tags: [smoke]\n"})
+    assert _names(select_tests([suite], tags={"smoke"})) == (["alpha/setup", "beta/renamed"], 0)
+    assert parsed[0] == ["beta.yaml"]
+
+
+def test_index_is_rebuilt_for_another_tests_root(suite, monkeypatch):
+    select_tests([suite])
+    assert selection._read_index() != {}
+
+    loader.configure_tests_root(os.path.join("tests", "alpha"))
+    assert selection._read_index() == {}
+    assert _names(select_tests([os.path.join(suite, "alpha")], name_glob=["./setup"])) == (["./setup"], 0)
+
+
+def test_changed_since_selects_tests_below_changed_dirs(suite, tmp_path, write_suite):
+    def git(*args):
+        subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t", *args], cwd=tmp_path,
+                       check=True, capture_output=True)
+    git("init", "-q")
+    git("add", ".")
+    git("commit", "-q", "-m", "base")
+
+    assert _names(select_tests([suite], changed_since="HEAD")) == ([], 0)
+    write_suite({"beta/data/expected.txt": "new\n"})
+    assert _names(select_tests([suite], changed_since="HEAD"))[0] == [
+        "alpha/load", "alpha/setup", "beta/check", "beta/other"]
+
+    with pytest.raises(ValueError, match="Cannot list files changed since 'no-such-ref'"):
+        select_tests([suite], changed_since="no-such-ref")
+
+
+def test_connection_variables_only_required_for_database_tests(suite, monkeypatch):
+    for var in ("NZ_HOST", "NZ_USER", "NZ_PASSWORD"):
+        monkeypatch.delenv(var, raising=False)
+    bash_tests, _ = select_tests([suite], name_glob=["beta/*"])
+    check_env_vars(bash_tests)
+
+    nzsql_tests, _ = select_tests([suite], name_glob=["query"])
+    check_env_vars([dict(nzsql_tests[0], skip=True)])
+    with pytest.raises(SystemExit):
+        check_env_vars(nzsql_tests)
@@ -0,0 +1,90 @@
+# File: unit_tests/test_timeouts_and_retries.py
+# ---
+# Tests of per-test timeouts and retries: a test that runs too long is killed
+# with its whole process group and reported as TIMEOUT, and failed attempts
+# are retried with a doubling backoff, keeping the log of each attempt.
+import os
+import time
+import pytest
+from core import runner
+from core.loader import load_tests
+from core.runner import run_tests
+
+SUITE = {
+    # Starts a grandchild that would outlive a kill of the script alone
+    "suite/hangs.sh": "#!/bin/sh\nsleep 30 &\necho $! > grandchild.pid\nwait\n",
+    # Fails until it has been run `$1` times
+    "suite/flaky.sh": "#!/bin/sh\necho run >> flaky.runs\n"
+                      "[ \"$(wc -l < flaky.runs)\" -ge \"$1\" ] && echo passed && exit 0\necho failed\nexit 1\n",
+    "suite/ok.sh": "#!/bin/sh\necho ok\n",
+}
+
+
+def _load(write_suite, yaml_tests):
+    return load_tests(write_suite(dict(SUITE, **{"suite/suite.yaml": "tests:\n" + yaml_tests})), use_cache=False)
+
+
+def _alive(pid):
+    """Whether a process is still alive a moment later (a killed grandchild may stay a zombie)."""
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                if f.read().rsplit(")", 1)[1].split()[0] == "Z":
+                    return False
+        except FileNotFoundError:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_timeout_kills_the_process_group(write_suite, engine):
+    tests = _load(write_suite, "  - name: hangs\n    command: hangs.sh\n    timeout_sec: 0.5\n"
+                               "  - name: ok\n    command: ok.sh\n")
+    start = time.monotonic()
+    results = run_tests(tests, engine=engine)[0]
+
+    assert time.monotonic() - start < 10
+    assert [r["status"] for r in results] == ["TIMEOUT", "PASS"]
+    with open(results[0]["output_file"]) as f:
+        assert "Timed out after 0.5s" in f.read()
+    with open("grandchild.pid") as f:
+        assert not _alive(int(f.read()))
+
+
+def test_default_timeout_applies_to_tests_without_their_own(write_suite):
+    tests = _load(write_suite, "  - name: hangs\n    command: hangs.sh\n")
+    results = run_tests(tests, default_timeout=0.3)[0]
+    assert results[0]["status"] == "TIMEOUT"
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_retry_until_pass_keeps_each_attempt_log(write_suite, engine, monkeypatch):
+    delays = []
+    prepare_retry = runner._prepare_retry
+    monkeypatch.setattr(runner, "_prepare_retry", lambda *args: delays.append(prepare_retry(*args)) or 0)
+    tests = _load(write_suite, "  - name: flaky\n    command: flaky.sh 3\n    retries: 3\n    retry_backoff: 0.5\n")
+
+    result = run_tests(tests, engine=engine)[0][0]
+
+    assert (result["status"], result["attempts"]) == ("PASS", 3)
+    assert delays == [0.5, 1.0]
+    base, ext = os.path.splitext(result["output_file"])
+    for attempt in (1, 2):
+        with open(f"{base}.attempt{attempt}{ext}") as f:
+            assert f.read() == "failed\n"
+    with open(result["output_file"]) as f:
+        assert f.read() == "passed\n"
+
+
+def test_retries_are_exhausted(write_suite):
+    tests = _load(write_suite, "  - name: flaky\n    command: flaky.sh 10\n    retries: 2\n")
+    result = run_tests(tests)[0][0]
+    assert (result["status"], result["attempts"]) == ("FAIL", 3)
+
+
+def test_pass_is_not_retried(write_suite):
+    tests = _load(write_suite, "  - name: ok\n    command: ok.sh\n    retries: 2\n")
+    result = run_tests(tests)[0][0]
+    assert (result["status"], result["attempts"]) == ("PASS", 1)
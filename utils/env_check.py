@@ -1,17 +1,31 @@
 # File: utils/env_check.py
 # ---
 # This module checks for the presence of required environment variables.
+# The connection variables are only required when a selected test connects to
+# a database, i.e. its executor declares `requires.database` (see
+# executors/registry.py); runs of bash tests alone do not need them.
 import os
-from utils.helpers import log_line
+from executors.registry import requirements
+from utils.helpers import log_line, log_text
 
 REQUIRED_ENV_VARS = ["NZ_HOST", "NZ_USER", "NZ_PASSWORD"]
 
 def check_env_vars(tests=None):
+    if tests is not None and not any(_needs_database(test) for test in tests):
+        return
     missing = [var for var in REQUIRED_ENV_VARS if var not in os.environ]
     if missing:
         for var in missing:
             log_line("ERROR", "Missing ENV", var)
-        print("Environment check failed. Exiting.")
+        log_text("Environment check failed. Exiting.")
         exit(1)
     else:
         log_line("INFO", "All required environment variables are set")
+
+# Whether a test will connect to a database. Skipped tests do not, and unknown
+# executors are reported by the preflight check instead.
+def _needs_database(test):
+    if test.get("skip"):
+        return False
+    requires = requirements(test.get("executor", "bash"))
+    return bool(requires and requires["database"])
@@ -1,7 +1,25 @@
 # File: utils/helpers.py
 # ---
 # This module provides utility functions for logging and formatting output.
-from datetime import datetime
+# Console lines are not printed by the calling thread: log_line() formats the
+# line and queues it, and a background writer thread writes whatever is queued
+# in one batch, so lines from parallel tests never interleave and a slow stdout
+# pipe does not hold up the tests. The timestamp text is formatted once per
+# second instead of on every call.
+# When a JSON log is configured, every event is also appended to it as one JSON
+# object per line, tagged with the test being run and the worker running it
+# (see log_context()).
+# Anything printed directly must go through log_text() (or call flush_log()
+# first) to keep its place relative to the queued lines.
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import sys
+import threading
+import time
 
 USE_EMOJIS = True  # Default to True
 
@@ -31,11 +49,39 @@ LABEL_PREFIXES = {
     "REPORT": "[REPORT   ]",
 }
 
+# Most queued items written in one batch
+LOG_BATCH_SIZE = 1000
+
+# Test and worker attached to the events of the current thread or asyncio task
+_current_test = contextvars.ContextVar("current_test", default=None)
+_current_worker = contextvars.ContextVar("current_worker", default=None)
+
+_queue = queue.SimpleQueue()
+_writer = None
+_writer_lock = threading.Lock()
+_json_file = None
+# (second, formatted timestamp) of the last log line
+_timestamp_cache = (None, "")
+
+
 def log_line(prefix_key, label="", value="", indent=0):
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    now = time.time()
+    ts = _timestamp(now)
     indent_space = " " * indent
     prefix = EMOJI_PREFIXES.get(prefix_key, "") if USE_EMOJIS else LABEL_PREFIXES.get(prefix_key, "")
-    print(f"{ts} {indent_space}{prefix} {label:<15} : {value}")
+    line = f"{ts} {indent_space}{prefix} {label:<15} : {value}\n"
+
+    event = None
+    if _json_file is not None:
+        event = {
+            "ts": round(now, 3),
+            "event": prefix_key,
+            "label": label.strip() if isinstance(label, str) else str(label),
+            "value": value if isinstance(value, (int, float)) else str(value),
+            "test": _current_test.get(),
+            "worker": _current_worker.get() or threading.current_thread().name,
+        }
+    _enqueue((line, event))
 
 # def log_line(prefix_key, label="", value="", indent=0):
 #     ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -43,3 +89,105 @@ def log_line(prefix_key, label="", value="", indent=0):
 #     prefix = EMOJI_PREFIXES.get(prefix_key, "") if USE_EMOJIS else LABEL_PREFIXES.get(prefix_key, "")
 #     colon = ":" if value else ""
 #     print(f"{ts} {indent_space}{prefix} {label:<12}{colon} {value}")
+
+
+def log_text(text=""):
+    """Writes a plain console line (like print()) in order with the log lines."""
+    _enqueue((f"{text}\n", None))
+
+
+def flush_log():
+    """Waits until every queued line has been written."""
+    if _writer is None or not _writer.is_alive():
+        return
+    done = threading.Event()
+    _queue.put(done)
+    done.wait()
+
+
+def configure_json_log(path):
+    """
+    Also writes every log event to a JSON Lines file.
+
+    Args:
+        path (str): Log file, appended to; None stops the JSON log.
+    """
+    global _json_file
+    flush_log()
+    if _json_file is not None:
+        _json_file.close()
+        _json_file = None
+    if path:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        _json_file = open(path, "a")
+
+
+@contextlib.contextmanager
+def log_context(test=None, worker=None):
+    """Tags the log events of the current thread or asyncio task with a test name and worker id."""
+    tokens = []
+    if test is not None:
+        tokens.append((_current_test, _current_test.set(test)))
+    if worker is not None:
+        tokens.append((_current_worker, _current_worker.set(worker)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def _timestamp(now):
+    global _timestamp_cache
+    second = int(now)
+    cached_second, text = _timestamp_cache
+    if second != cached_second:
+        text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+        _timestamp_cache = (second, text)
+    return text
+
+
+def _enqueue(item):
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        with _writer_lock:
+            if _writer is None or not _writer.is_alive():
+                _writer = threading.Thread(target=_write_loop, name="log-writer", daemon=True)
+                _writer.start()
+    _queue.put(item)
+
+
+# Writes queued lines in batches: everything that was queued while the previous
+# batch was being written goes out in a single write.
+def _write_loop():
+    while True:
+        batch = [_queue.get()]
+        try:
+            while len(batch) < LOG_BATCH_SIZE:
+                batch.append(_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        text, events, flushed = [], [], []
+        for item in batch:
+            if isinstance(item, threading.Event):
+                flushed.append(item)
+                continue
+            line, event = item
+            text.append(line)
+            if event is not None:
+                events.append(json.dumps(event, default=str) + "\n")
+        try:
+            if text:
+                sys.stdout.write("".join(text))
+                sys.stdout.flush()
+            if events and _json_file is not None:
+                _json_file.write("".join(events))
+                _json_file.flush()
+        except (OSError, ValueError):
+            pass
+        for done in flushed:
+            done.set()
+
+
+atexit.register(flush_log)
@@ -1,24 +1,102 @@
 # File: utils/report_utils.py
 # ---
 # This module contains functions for generating HTML reports from test results.
+# Two layouts are available:
+#   - "full":  one self-contained page with a row per test (report_template.html)
+#   - "index": a compact page with a sortable, filterable, virtualized table
+#     (report_index_template.html). The table data is in one small script file
+#     and the outputs are split into chunk files of CHUNK_TESTS tests each, which
+#     the page only loads when a test is opened. Chunks are plain .js files
+#     rather than JSON so that they also load from file:// URLs.
+# The Jinja2 environment and templates are created once per process.
+import functools
+import json
 import os
 from jinja2 import Environment, FileSystemLoader
 
-def generate_html_report(results, label="system", timestamp=""):
-    reports_dir = "reports"
-    os.makedirs(reports_dir, exist_ok=True)
+HTML_MODES = ("full", "index")
+
+# Tests per output chunk of the "index" layout
+CHUNK_TESTS = 200
 
+# Columns of each row in the "index" layout's rows.js
+INDEX_COLUMNS = ["name", "status", "duration_sec", "executor", "output_lines",
+                 "output_bytes", "output_truncated", "output_file", "description", "log_archived"]
+
+
+@functools.lru_cache(maxsize=None)
+def _template(name):
     env = Environment(
         loader=FileSystemLoader(searchpath=os.path.join(os.path.dirname(__file__), "templates"))
     )
-    template = env.get_template("report_template.html")
+    return env.get_template(name)
+
+
+def generate_html_report(results, label="system", timestamp="", mode="full"):
+    """
+    Writes the HTML report of a run.
+
+    Args:
+        results (iterable): Result dictionaries; iterated only once.
+        label (str): Run label used in the title and file name.
+        timestamp (str): Run ID used in the title and file name.
+        mode (str): "full" or "index", see HTML_MODES.
+
+    Returns:
+        str: Path of the HTML page.
+    """
+    reports_dir = "reports"
+    os.makedirs(reports_dir, exist_ok=True)
+    output_path = os.path.join(reports_dir, f"{timestamp}_{label}.html")
+
+    if mode == "index":
+        _write_index_report(results, reports_dir, output_path, label, timestamp)
+        return output_path
 
-    output_html = template.render(
+    # results may be a stream of results: render them row by row to the file
+    _template("report_template.html").stream(
         results=results,
         label=label,
         timestamp=timestamp
-    )
+    ).dump(output_path)
+    return output_path
 
-    output_path = os.path.join(reports_dir, f"{timestamp}_{label}.html")
-    with open(output_path, "w") as f:
-        f.write(output_html)
+
+# Writes the "index" layout: the page, <name>_data/rows.js and the output chunks.
+def _write_index_report(results, reports_dir, output_path, label, timestamp):
+    data_name = f"{timestamp}_{label}_data"
+    data_dir = os.path.join(reports_dir, data_name)
+    os.makedirs(data_dir, exist_ok=True)
+
+    rows = []
+    chunk = {}
+    counts = {}
+    for idx, result in enumerate(results):
+        rows.append([result.get(column) for column in INDEX_COLUMNS])
+        counts[result.get("status")] = counts.get(result.get("status"), 0) + 1
+        chunk[idx] = result.get("output") or ""
+        if len(chunk) == CHUNK_TESTS:
+            _write_chunk(data_dir, idx // CHUNK_TESTS, chunk)
+            chunk = {}
+    if chunk:
+        _write_chunk(data_dir, (len(rows) - 1) // CHUNK_TESTS, chunk)
+
+    with open(os.path.join(data_dir, "rows.js"), "w") as f:
+        f.write("nzReport.rows(")
+        json.dump({"columns": INDEX_COLUMNS, "chunkTests": CHUNK_TESTS, "rows": rows}, f, separators=(",", ":"))
+        f.write(");\n")
+
+    _template("report_index_template.html").stream(
+        label=label,
+        timestamp=timestamp,
+        data_dir=data_name,
+        total=len(rows),
+        counts=sorted(counts.items(), key=lambda item: str(item[0]))
+    ).dump(output_path)
+
+
+def _write_chunk(data_dir, number, outputs):
+    with open(os.path.join(data_dir, f"outputs_{number:05d}.js"), "w") as f:
+        f.write(f"nzReport.outputs({number},")
+        json.dump({str(idx): output for idx, output in outputs.items()}, f, separators=(",", ":"))
+        f.write(");\n")
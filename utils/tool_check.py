@@ -3,14 +3,21 @@
 # This module checks for the presence of required tools in the system.
 # It verifies that essential command-line tools are available for the test suite to function correctly.
 # If any required tool is missing, it raises an EnvironmentError with a descriptive message.
+# The preflight stage (core/preflight.py) uses find_tools() for the tools that
+# the executors of the selected tests declare.
 import shutil
 from utils.helpers import log_line
 
-def check_nz_tools():
-    required_tools = ["nzsql"]
-    for tool in required_tools:
-        if not shutil.which(tool):
-            log_line("❌", "Missing Tool", tool)
+REQUIRED_TOOLS = ["nzsql"]
+
+def find_tools(tools):
+    """Returns {tool: path on the PATH, or None when it is missing}."""
+    return {tool: shutil.which(tool) for tool in tools}
+
+def check_nz_tools(required_tools=None):
+    for tool, path in find_tools(required_tools or REQUIRED_TOOLS).items():
+        if not path:
+            log_line("ERROR", "Missing Tool", tool)
             raise EnvironmentError(f"Required tool not found: {tool}")
         else:
-            log_line("🔍", "Tool Check", f"{tool} found")
+            log_line("INFO", "Tool Check", f"{tool} found")